@@ -0,0 +1,82 @@
+"""構造化出力のデコード＋スキーマ検証のマイクロベンチマーク
+
+従来の処理（行ごとのコードブロック除去 → json.loads → jsonschema.validate）と
+response_decoding.StructuredDecoder の 1 件あたりの処理時間を比較する。
+
+    python bench_response_decoding.py [繰り返し回数]
+"""
+import json
+import sys
+import time
+
+from jsonschema import validate
+
+from main import STRUCTURED_JSON_SCHEMA, STRUCTURED_SUMMARY_SCHEMA
+from response_decoding import JSON_CODEC, StructuredDecoder
+
+ANALYSIS_RESPONSE = {
+    "title": "Transformer を用いた論文推薦",
+    "fields": [{"name": "人工知能", "score": 0.9}, {"name": "情報・通信", "score": 0.4}],
+    "labels": {
+        "target": {"ja": "論文推薦", "en": "paper recommendation"},
+        "approaches": {
+            "methods": [{"ja": "トランスフォーマー", "en": "transformer"}, {"ja": "対照学習", "en": "contrastive learning"}],
+            "factors": [{"ja": "引用関係", "en": "citation graph"}],
+            "metrics": [{"ja": "再現率", "en": "recall"}, {"ja": "nDCG", "en": "nDCG"}],
+        },
+        "search_keywords": [
+            {"ja": "論文推薦", "en": "paper recommendation"},
+            {"ja": "引用ネットワーク", "en": "citation network"},
+            {"ja": "埋め込み", "en": "embedding"},
+        ],
+    },
+}
+
+SUMMARY_RESPONSE = {
+    "title": "Transformer を用いた論文推薦",
+    "keywords": ["Transformer", "論文推薦", "対照学習", "引用ネットワーク"],
+    "background": "研究者が関連論文を見つける負担が増えている。" * 3,
+    "method": "引用関係を用いた対照学習で論文の埋め込みを学習する。" * 3,
+    "results": "既存手法に比べて nDCG@10 が 12% 向上した。" * 3,
+    "conclusion": "引用関係の活用が推薦精度の向上に有効である。" * 2,
+    "importance_level": "medium",
+}
+
+
+def legacy_decode(content, schema):
+    """従来のデコード処理"""
+    clean_lines = [line for line in content.splitlines() if not line.strip().startswith("```")]
+    data = json.loads("\n".join(clean_lines))
+    validate(instance=data, schema=schema)
+    return data
+
+
+def bench(func, content, iterations):
+    """1 件あたりの平均処理時間（マイクロ秒）"""
+    func(content)
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        func(content)
+    return (time.perf_counter() - started_at) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"JSON コーデック: {JSON_CODEC} / 繰り返し: {iterations}")
+    print(f"{'ケース':<24}{'従来 (µs)':>12}{'新 (µs)':>12}{'倍率':>8}")
+    for name, schema, response in (
+        ("analysis", STRUCTURED_JSON_SCHEMA, ANALYSIS_RESPONSE),
+        ("summary", STRUCTURED_SUMMARY_SCHEMA, SUMMARY_RESPONSE),
+    ):
+        decoder = StructuredDecoder(schema)
+        plain = json.dumps(response, ensure_ascii=False, indent=2)
+        fenced = f"```json\n{plain}\n```"
+        for label, content in ((name, plain), (f"{name} (```json)", fenced)):
+            assert decoder.decode(content) == legacy_decode(content, schema)
+            legacy = bench(lambda text: legacy_decode(text, schema), content, iterations)
+            current = bench(decoder.decode, content, iterations)
+            print(f"{label:<24}{legacy:>12.1f}{current:>12.1f}{legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""論文の埋め込みベクトルの保存と類似度計算
+
+論文（タイトル+アブストラクト）の埋め込みを paperId とモデル名ごとに SQLite へ保存し、
+同じ論文を再度埋め込まないようにする。検索クエリの埋め込みはメモリ上の LRU で保持する。
+類似度は NumPy で行列演算としてまとめて計算する。
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "nomic-embed-text:latest")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "embeddings.sqlite3")
+)
+EMBEDDING_QUERY_CACHE_ENTRIES = int(os.environ.get("EMBEDDING_QUERY_CACHE_ENTRIES", "256"))
+
+
+def paper_text(paper: Dict[str, Any]) -> str:
+    """埋め込み対象のテキスト（タイトル+アブストラクト）"""
+    return f"{paper.get('title') or ''}\n{paper.get('abstract') or ''}".strip()
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2 正規化する（ゼロベクトルはそのまま）"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def cosine_scores(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """クエリと各行のコサイン類似度をまとめて計算する"""
+    if len(matrix) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return normalize(matrix.astype(np.float32)) @ normalize(query.astype(np.float32))
+
+
+class EmbeddingStore:
+    """paperId・モデル名をキーとした埋め込みベクトルのキャッシュ"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, query_entries: int = EMBEDDING_QUERY_CACHE_ENTRIES):
+        self.path = path
+        self.query_entries = query_entries
+        self.hits = 0
+        self.misses = 0
+        self._queries: "OrderedDict[tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """SQLite 接続を返す（初回アクセス時にテーブルを作成）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    paper_id TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (paper_id, model)
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, paper_ids: Iterable[str], model: str) -> Dict[str, np.ndarray]:
+        """保存済みの埋め込みを返す（未保存の paperId は含まない）"""
+        paper_ids = list(dict.fromkeys(paper_ids))
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # SQLite のパラメータ数上限を超えないよう分割して取得する
+            for start in range(0, len(paper_ids), 500):
+                chunk = paper_ids[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT paper_id, vector FROM embeddings WHERE model = ? AND paper_id IN ({','.join('?' * len(chunk))})",
+                    [model, *chunk],
+                ).fetchall()
+                for paper_id, vector in rows:
+                    found[paper_id] = np.frombuffer(vector, dtype=np.float32)
+        self.hits += len(found)
+        self.misses += len(paper_ids) - len(found)
+        return found
+
+    def set_many(self, model: str, vectors: Dict[str, np.ndarray]) -> None:
+        """埋め込みをまとめて保存する"""
+        if not vectors:
+            return
+        now = time.time()
+        rows = [
+            (paper_id, model, len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for paper_id, vector in vectors.items()
+        ]
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (paper_id, model, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.commit()
+
+    def iter_vectors(self, model: str, batch_size: int = 10000) -> Iterator[Dict[str, np.ndarray]]:
+        """保存済みの埋め込みを batch_size 件ずつ返す"""
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT paper_id, vector FROM embeddings WHERE model = ? AND paper_id > ? ORDER BY paper_id LIMIT ?",
+                    (model, last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield {paper_id: np.frombuffer(vector, dtype=np.float32) for paper_id, vector in rows}
+            last_id = rows[-1][0]
+
+    def get_query(self, text: str, model: str) -> Optional[np.ndarray]:
+        """検索クエリの埋め込みをメモリから取得する"""
+        with self._lock:
+            vector = self._queries.get((model, text))
+            if vector is not None:
+                self._queries.move_to_end((model, text))
+            return vector
+
+    def set_query(self, text: str, model: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._queries[(model, text)] = vector
+            self._queries.move_to_end((model, text))
+            while len(self._queries) > self.query_entries:
+                self._queries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self.conn.execute("SELECT model, COUNT(*) FROM embeddings GROUP BY model").fetchall()
+        return {
+            "path": self.path,
+            "vectors": {model: count for model, count in rows},
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_queries": len(self._queries),
+        }
+
+
+def batched(items: List[Any], size: int = EMBEDDING_BATCH_SIZE) -> List[List[Any]]:
+    """リストを size 件ずつに分割する"""
+    return [items[start:start + size] for start in range(0, len(items), max(1, size))]
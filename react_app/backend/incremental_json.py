@@ -0,0 +1,120 @@
+"""ストリーミング中の JSON を逐次解析するパーサ
+
+LLM がトークン単位で出力する JSON 文書を受け取りながら、オブジェクトのメンバーや配列の要素が
+閉じた時点でその値を取り出す。文書全体の完成を待たずに、完成したフィールドから順に
+クライアントへ送るために使う。最初の `{` / `[` より前（マークダウンのコードブロックなど）は読み飛ばす。
+"""
+import json
+from typing import Any, Iterable, List, Optional, Set, Tuple, Union
+
+Path = Tuple[Union[str, int], ...]
+
+_WHITESPACE = " \t\r\n"
+
+
+class _Frame:
+    """解析中のオブジェクト・配列"""
+
+    __slots__ = ("kind", "key", "index", "expect_key", "start")
+
+    def __init__(self, kind: str, start: int):
+        self.kind = kind
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expect_key = kind == "object"
+        self.start = start
+
+    @property
+    def position(self) -> Union[str, int, None]:
+        return self.key if self.kind == "object" else self.index
+
+
+class IncrementalJSONParser:
+    """feed() で受け取ったテキストから、値が閉じたメンバーを (パス, 値) として返す"""
+
+    def __init__(self, paths: Optional[Iterable[Path]] = None):
+        # paths を指定した場合はそのパスの値のみを返す（未指定ならルート直下のメンバー）
+        self.paths: Optional[Set[Path]] = set(paths) if paths is not None else None
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._primitive_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """テキストを追加し、新たに閉じた値を返す"""
+        self.text += chunk
+        completed: List[Tuple[Path, Any]] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._end_string(i, completed)
+                continue
+            if self._primitive_start is not None:
+                if c not in ",}]" and c not in _WHITESPACE:
+                    continue
+                self._value_done(self._primitive_start, i, completed)
+                self._primitive_start = None
+            if not self._started:
+                if c in "{[":
+                    self._started = True
+                    self._stack.append(_Frame("object" if c == "{" else "array", i))
+                continue
+            if c in _WHITESPACE or c == ":":
+                continue
+            frame = self._stack[-1]
+            if c == ",":
+                frame.expect_key = frame.kind == "object"
+            elif c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = frame.expect_key
+            elif c in "{[":
+                self._stack.append(_Frame("object" if c == "{" else "array", i))
+            elif c in "}]":
+                closed = self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                else:
+                    self._value_done(closed.start, i + 1, completed)
+            else:
+                self._primitive_start = i
+        self._pos = len(text)
+        return completed
+
+    def _end_string(self, end: int, completed: List[Tuple[Path, Any]]) -> None:
+        if self._string_is_key:
+            frame = self._stack[-1]
+            frame.key = json.loads(self.text[self._string_start:end + 1])
+            frame.expect_key = False
+        else:
+            self._value_done(self._string_start, end + 1, completed)
+
+    def _value_done(self, start: int, end: int, completed: List[Tuple[Path, Any]]) -> None:
+        """値が閉じたときの処理（対象のパスなら値を取り出す）"""
+        path = tuple(frame.position for frame in self._stack)
+        wanted = len(path) == 1 if self.paths is None else path in self.paths
+        if wanted:
+            completed.append((path, json.loads(self.text[start:end])))
+        parent = self._stack[-1]
+        if parent.kind == "array":
+            parent.index += 1
+
+    def result(self) -> Any:
+        """文書全体を解析して返す（未完成なら json.JSONDecodeError）"""
+        start = min((i for i in (self.text.find("{"), self.text.find("[")) if i >= 0), default=0)
+        return json.JSONDecoder().raw_decode(self.text, start)[0]
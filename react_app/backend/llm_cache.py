@@ -0,0 +1,183 @@
+"""LLM 生成結果のディスクキャッシュ
+
+同じ論文（タイトル+アブストラクト）に対する解析・要約・翻訳を毎回生成し直さないよう、
+エンドポイント名・モデル名・プロンプトのバージョン・入力内容のハッシュをキーとして
+SQLite に結果を保存する。TTL を過ぎたエントリは無効とし、件数上限を超えた場合は
+最終アクセスが古い順（LRU）に削除する。ヒット時の最終アクセス時刻はメモリにためておき、
+保存時か一定件数・一定時間ごとにまとめて書き込む（読み込みのたびにコミットしない）。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "llm_cache.sqlite3")
+)
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+# 最終アクセス時刻をまとめて書き込む件数と間隔（秒）
+LLM_CACHE_ACCESS_FLUSH_ENTRIES = int(os.environ.get("LLM_CACHE_ACCESS_FLUSH_ENTRIES", "64"))
+LLM_CACHE_ACCESS_FLUSH_INTERVAL = float(os.environ.get("LLM_CACHE_ACCESS_FLUSH_INTERVAL", "30"))
+
+
+class LLMCache:
+    """SQLite を使った TTL/LRU 付きのキャッシュ"""
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl: float = LLM_CACHE_TTL,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        enabled: bool = LLM_CACHE_ENABLED,
+        access_flush_entries: int = LLM_CACHE_ACCESS_FLUSH_ENTRIES,
+        access_flush_interval: float = LLM_CACHE_ACCESS_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.access_flush_entries = access_flush_entries
+        self.access_flush_interval = access_flush_interval
+        # 未書き込みの最終アクセス時刻（key → 時刻）
+        self._accessed: Dict[str, float] = {}
+        self._accessed_flushed_at = time.time()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """SQLite 接続を返す（初回アクセス時にテーブルを作成）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_endpoint ON llm_cache(endpoint)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(endpoint: str, model: str, prompt_version: str, data: Any) -> str:
+        """エンドポイント・モデル・プロンプト版・入力からキャッシュキーを生成する"""
+        raw = json.dumps(
+            {"endpoint": endpoint, "model": model, "prompt_version": prompt_version, "input": data},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, endpoint: str) -> Optional[Any]:
+        """キャッシュを参照する。期限切れまたは未登録の場合は None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+                return None
+            self._accessed[key] = now
+            if (
+                len(self._accessed) >= self.access_flush_entries
+                or now - self._accessed_flushed_at >= self.access_flush_interval
+            ):
+                self._flush_access()
+            self.hits[endpoint] = self.hits.get(endpoint, 0) + 1
+        return json.loads(row[0])
+
+    def set(self, key: str, endpoint: str, value: Any) -> None:
+        """結果を保存し、期限切れと上限超過分を削除する"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            # LRU の削除対象を正しく選べるよう、ためておいた最終アクセス時刻を先に反映する
+            self._flush_access(commit=False)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, endpoint, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self.conn.execute(
+                """DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+    def _flush_access(self, commit: bool = True) -> None:
+        """ためておいた最終アクセス時刻を書き込む（ロックを取得した状態で呼ぶ）"""
+        if self._accessed:
+            self.conn.executemany(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._accessed.items()],
+            )
+            self._accessed.clear()
+            if commit:
+                self.conn.commit()
+        self._accessed_flushed_at = time.time()
+
+    def flush(self) -> None:
+        """最終アクセス時刻を書き込む（終了時など）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._flush_access()
+
+    def invalidate(self, endpoint: Optional[str] = None) -> int:
+        """キャッシュを削除する（endpoint 指定時はそのエンドポイント分のみ）。削除件数を返す"""
+        with self._lock:
+            if endpoint is None:
+                cursor = self.conn.execute("DELETE FROM llm_cache")
+            else:
+                cursor = self.conn.execute("DELETE FROM llm_cache WHERE endpoint = ?", (endpoint,))
+            self.conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """エンドポイント別の件数とヒット/ミス数を返す"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT endpoint, COUNT(*) FROM llm_cache GROUP BY endpoint"
+            ).fetchall()
+        entries = {endpoint: count for endpoint, count in rows}
+        endpoints = set(entries) | set(self.hits) | set(self.misses)
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "entries": sum(entries.values()),
+            "endpoints": {
+                endpoint: {
+                    "entries": entries.get(endpoint, 0),
+                    "hits": self.hits.get(endpoint, 0),
+                    "misses": self.misses.get(endpoint, 0),
+                }
+                for endpoint in sorted(endpoints)
+            },
+        }
@@ -0,0 +1,244 @@
+"""LLM ジョブのスケジューラ
+
+機能（analysis / translation / quick_summary / detailed_summary）ごとに待ち行列を持ち、
+モデルごとの同時実行数を制限する。空きを待つジョブは優先度順（対話・ストリーミング >
+通常 > バッチ）に実行し、待ち行列が上限に達した機能への新規ジョブは 429 で拒否する。
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# 優先度（値が小さいほど先に実行）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "normal": PRIORITY_NORMAL,
+    "batch": PRIORITY_BATCH,
+}
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "2"))
+LLM_QUEUE_LIMIT = int(os.environ.get("LLM_QUEUE_LIMIT", "32"))
+
+
+def parse_limits(value: str) -> Dict[str, int]:
+    """"name=2,other=4" 形式の設定文字列を辞書に変換する"""
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, limit = item.rsplit("=", 1)
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+# モデル別の同時実行数（例: LLM_MODEL_CONCURRENCY="gemma3:12b=1,gemma-textonly_v3:latest=3"）
+LLM_MODEL_CONCURRENCY = parse_limits(os.environ.get("LLM_MODEL_CONCURRENCY", ""))
+# 機能別の待ち行列の上限（例: LLM_QUEUE_LIMITS="analysis=64,translation=16"）
+LLM_QUEUE_LIMITS = parse_limits(os.environ.get("LLM_QUEUE_LIMITS", ""))
+
+
+def parse_priority(value: Optional[str], default: int = PRIORITY_NORMAL) -> int:
+    """X-Request-Priority ヘッダーの値を優先度に変換する"""
+    if value is None:
+        return default
+    return PRIORITY_NAMES.get(value.strip().lower(), default)
+
+
+class QueueFullError(HTTPException):
+    """待ち行列が上限に達したことを表す 429 エラー"""
+
+    def __init__(self, function_name: str, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail=f"{function_name}の処理待ちが上限に達しました。{retry_after}秒後に再試行してください",
+            headers={"Retry-After": str(retry_after)},
+        )
+        self.function_name = function_name
+        self.retry_after = retry_after
+
+
+class _ModelSlots:
+    """モデル単位の実行枠（優先度付きセマフォ）"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int) -> None:
+        if self.active < self.max_concurrency and not self.waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 枠を受け取った直後にキャンセルされた場合は次の待機者へ譲る
+                self.release()
+            else:
+                self.waiters = [w for w in self.waiters if w[2] is not future]
+                heapq.heapify(self.waiters)
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    def resize(self, max_concurrency: int) -> None:
+        """同時実行数を変更する（増えた分は待機者へすぐに割り当てる）"""
+        self.max_concurrency = max_concurrency
+        self._wake()
+
+    def _wake(self) -> None:
+        while self.waiters and self.active < self.max_concurrency:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                # 空いた実行枠を優先度順に待機者へ割り当てる
+                self.active += 1
+                future.set_result(None)
+
+
+class _FunctionStats:
+    """機能別の待ち行列メトリクス"""
+
+    def __init__(self):
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.avg_wait = 0.0
+        self.avg_duration = 0.0
+
+    def observe(self, wait: float, duration: float) -> None:
+        # 指数移動平均で直近の傾向を追う
+        alpha = 0.2
+        if self.completed + self.failed == 1:
+            self.avg_wait, self.avg_duration = wait, duration
+        else:
+            self.avg_wait += alpha * (wait - self.avg_wait)
+            self.avg_duration += alpha * (duration - self.avg_duration)
+
+
+class LLMScheduler:
+    """機能別の待ち行列とモデル別の同時実行数制限を管理する"""
+
+    def __init__(
+        self,
+        default_max_concurrency: int = LLM_MAX_CONCURRENCY,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        default_queue_limit: int = LLM_QUEUE_LIMIT,
+        queue_limits: Optional[Dict[str, int]] = None,
+        host_count: Optional[Callable[[str], int]] = None,
+    ):
+        self.default_max_concurrency = default_max_concurrency
+        self.model_concurrency = dict(LLM_MODEL_CONCURRENCY if model_concurrency is None else model_concurrency)
+        self.default_queue_limit = default_queue_limit
+        self.queue_limits = dict(LLM_QUEUE_LIMITS if queue_limits is None else queue_limits)
+        # モデルを処理できるホスト数（同時実行数はホストあたりの値にこの台数を掛ける）。
+        # 実行枠はモデルごとに 1 つなので、機能によって台数が変わらないよう全機能の接続先を合わせて数える
+        self.host_count = host_count
+        self._slots: Dict[str, _ModelSlots] = {}
+        self._stats: Dict[str, _FunctionStats] = {}
+
+    def _model_slots(self, model: str) -> _ModelSlots:
+        if model not in self._slots:
+            limit = self.model_concurrency.get(model, self.default_max_concurrency)
+            self._slots[model] = _ModelSlots(max(1, limit))
+        return self._slots[model]
+
+    def _resize(self, function_name: str, model: str) -> _ModelSlots:
+        """ホスト数に合わせてモデルの同時実行数を更新する"""
+        slots = self._model_slots(model)
+        if self.host_count is not None:
+            limit = max(1, self.model_concurrency.get(model, self.default_max_concurrency))
+            slots.resize(limit * max(1, self.host_count(model)))
+        return slots
+
+    def _function_stats(self, function_name: str) -> _FunctionStats:
+        if function_name not in self._stats:
+            self._stats[function_name] = _FunctionStats()
+        return self._stats[function_name]
+
+    def retry_after(self, function_name: str, model: str) -> int:
+        """待ち行列が捌けるまでの目安秒数"""
+        stats = self._function_stats(function_name)
+        slots = self._model_slots(model)
+        estimate = (stats.avg_duration or 10.0) * (len(slots.waiters) + 1) / slots.max_concurrency
+        return max(1, math.ceil(estimate))
+
+    def ensure_capacity(self, function_name: str, model: str) -> None:
+        """待ち行列に空きがなければ QueueFullError を送出する"""
+        stats = self._function_stats(function_name)
+        limit = self.queue_limits.get(function_name, self.default_queue_limit)
+        if stats.waiting >= limit:
+            stats.rejected += 1
+            raise QueueFullError(function_name, self.retry_after(function_name, model))
+
+    @asynccontextmanager
+    async def slot(self, function_name: str, model: str, priority: int = PRIORITY_NORMAL) -> AsyncIterator[None]:
+        """実行枠を確保してから処理を行うためのコンテキストマネージャ"""
+        self.ensure_capacity(function_name, model)
+        stats = self._function_stats(function_name)
+        slots = self._resize(function_name, model)
+
+        queued_at = time.perf_counter()
+        stats.waiting += 1
+        try:
+            await slots.acquire(priority)
+        finally:
+            stats.waiting -= 1
+        started_at = time.perf_counter()
+        stats.running += 1
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            stats.running -= 1
+            if failed:
+                stats.failed += 1
+            else:
+                stats.completed += 1
+            stats.observe(started_at - queued_at, time.perf_counter() - started_at)
+            slots.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        """/health 向けの待ち行列メトリクス"""
+        return {
+            "functions": {
+                name: {
+                    "waiting": stats.waiting,
+                    "running": stats.running,
+                    "completed": stats.completed,
+                    "failed": stats.failed,
+                    "rejected": stats.rejected,
+                    "queue_limit": self.queue_limits.get(name, self.default_queue_limit),
+                    "avg_wait": round(stats.avg_wait, 3),
+                    "avg_duration": round(stats.avg_duration, 3),
+                }
+                for name, stats in self._stats.items()
+            },
+            "models": {
+                model: {
+                    "active": slots.active,
+                    "waiting": len(slots.waiters),
+                    "max_concurrency": slots.max_concurrency,
+                }
+                for model, slots in self._slots.items()
+            },
+        }
@@ -1,18 +1,61 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response
 from fastapi.responses import StreamingResponse
-import requests
+from contextlib import asynccontextmanager
+import httpx
 import time
 import json
+import re
+import base64
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from jsonschema import validate, ValidationError
+from typing import List, Optional, Dict, Any, Tuple
+from jsonschema import ValidationError
 import asyncio
-import PyPDF2
-import io
+import numpy as np
 from urllib.parse import urlparse
-
-app = FastAPI()
+from ollama_client import OllamaClient
+from llm_cache import LLMCache
+from singleflight import SingleFlight, StreamFlight
+from search_cache import SearchCache
+from paper_store import PaperStore
+from embeddings import EmbeddingStore, EMBEDDING_MODEL, batched, cosine_scores, paper_text
+from vector_index import VectorIndex, VECTOR_INDEX_DIR
+from rank_fusion import build_fanout_queries, reciprocal_rank_fusion
+from incremental_json import IncrementalJSONParser
+from response_decoding import JSON_CODEC, StructuredDecoder, loads as json_loads, strip_code_fence
+from rate_limiter import TokenBucket, backoff_delay, parse_retry_after
+from model_warmup import ModelWarmer, get_keep_alive
+from pdf_cache import PdfCache, PdfEntry
+from pdf_extract import PdfExtractor
+from pdf_store import PdfDocument, PdfDocumentWriter, PdfStore
+from ollama_pool import OllamaHost, OllamaHostPool, OLLAMA_HEALTH_INTERVAL, model_capacity, monitor_hosts, probe_hosts
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BATCH, parse_priority
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動・終了時の処理（モデルのウォームアップ、ベクトルインデックスの同期、共有HTTPクライアントのクローズ）"""
+    get_vector_index()
+    sync_task = asyncio.ensure_future(asyncio.to_thread(sync_vector_index))
+    # 各ホストの保有モデルを確認してから、モデルを持つホストで読み込む
+    await probe_hosts(ollama_hosts.values())
+    for function_name in MODEL_CONFIGS:
+        warm_model(function_name)
+    monitor_task = None
+    if OLLAMA_HEALTH_INTERVAL > 0:
+        monitor_task = asyncio.ensure_future(monitor_hosts(lambda: list(ollama_hosts.values())))
+    yield
+    sync_task.cancel()
+    model_warmer.cancel()
+    if monitor_task is not None:
+        monitor_task.cancel()
+    for host in ollama_hosts.values():
+        await host.client.aclose()
+    await semantic_scholar_client.aclose()
+    await pdf_client.aclose()
+    pdf_extractor.shutdown()
+    llm_cache.flush()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -57,6 +100,24 @@ class StructuredSummary(BaseModel):
 class SummaryResult(BaseModel):
     summary: str
     structured: Optional[StructuredSummary] = None
+    timings: Optional[Dict[str, float]] = None  # 各生成の所要時間（秒）
+
+class FullSummaryRequest(BaseModel):
+    pdf_url: Optional[str] = None
+    paper_id: Optional[str] = None  # 処理済みのPDFは paperId だけで指定できる
+    title: Optional[str] = None  # 省略時はPDFから推定したタイトル
+
+class FullSummaryChunk(BaseModel):
+    section: Optional[str] = None
+    start: int
+    end: int
+    summary: str
+    cached: bool = False
+
+class FullSummaryResult(BaseModel):
+    structured: Optional[StructuredSummary] = None
+    chunks: List[FullSummaryChunk]
+    timings: Optional[Dict[str, float]] = None  # map（チャンク要約）・reduce（まとめ）の所要時間（秒）
 
 class QuickSummary(BaseModel):
     summary: str
@@ -71,18 +132,29 @@ class PaperAnalysisResult(BaseModel):
     metrics: List[Label]
     search_keywords: List[Label]
 
+class FanoutSearchRequest(BaseModel):
+    queries: Optional[List[str]] = None
+    analysis: Optional[PaperAnalysisResult] = None  # 指定時は検索キーワード・手法・要因・指標からクエリを作る
+    year_from: int = 2023
+    year_to: Optional[int] = None
+    limit_per_query: int = 20
+    limit: int = 20
+    source: Optional[str] = None
+
 class ModelConfig(BaseModel):
     analysis_model: str
     translation_model: str
     quick_summary_model: str
     detailed_summary_model: str
+    embedding_model: str
 
 class ModelConfigRequest(BaseModel):
-    function_name: str  # 'analysis', 'translation', 'quick_summary', 'detailed_summary'
+    function_name: str  # 'analysis', 'translation', 'quick_summary', 'detailed_summary', 'embedding'
     model_name: str
 
 class PdfProcessRequest(BaseModel):
     pdf_url: str
+    paper_id: Optional[str] = None  # 指定すると処理済みの本文を paperId で保存・再利用する
 
 class PdfMetadata(BaseModel):
     title: str
@@ -90,9 +162,24 @@ class PdfMetadata(BaseModel):
     abstract: str
     sections: List[str]
 
+class PdfPageTiming(BaseModel):
+    page: int
+    chars: int
+    seconds: float
+    cpu_seconds: float
+    timed_out: bool
+
+class PdfExtractionStats(BaseModel):
+    workers: int
+    seconds: float
+    cpu_seconds: float
+    truncated: bool  # CPU時間の上限で打ち切ったページがあるか
+    pages: List[PdfPageTiming]
+
 class PdfProcessResult(BaseModel):
     text: str
     metadata: PdfMetadata
+    extraction: Optional[PdfExtractionStats] = None
 
 # 設定
 import os
@@ -109,7 +196,8 @@ MODEL_CONFIGS = {
     "analysis": OLLAMA_MODEL,
     "translation": "gemma-textonly_v3:latest",
     "quick_summary": "gemma-textonly_v3:latest",
-    "detailed_summary": "gemma-textonly_v3:latest"
+    "detailed_summary": "gemma-textonly_v3:latest",
+    "embedding": EMBEDDING_MODEL
 }
 default_ollama_url = (
     "http://host.docker.internal:11435" if running_in_docker() else "http://127.0.0.1:11435"
@@ -122,6 +210,113 @@ def get_ollama_url(path: str) -> str:
 
 OLLAMA_CHAT_URL = get_ollama_url("/api/chat")
 
+def split_base_urls(value: str) -> List[str]:
+    """カンマ区切りの接続先一覧を分割する"""
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+# 負荷分散する接続先の一覧（未設定なら OLLAMA_API_BASE_URL の 1 台）
+OLLAMA_API_BASE_URLS = split_base_urls(os.environ.get("OLLAMA_API_BASE_URLS", OLLAMA_API_BASE_URL))
+
+# 機能別のOllama接続先（例: OLLAMA_API_BASE_URL_DETAILED_SUMMARY、カンマ区切りで複数可）。未設定なら共通の接続先を使う
+OLLAMA_FUNCTION_BASE_URLS = {
+    function_name: split_base_urls(os.environ.get(f"OLLAMA_API_BASE_URL_{function_name.upper()}", ""))
+    or OLLAMA_API_BASE_URLS
+    for function_name in MODEL_CONFIGS
+}
+
+# 接続先ごとのホスト状態（keep-alive付きコネクションプールを共有し、実行中のリクエスト数は機能をまたいで数える）
+ollama_hosts: Dict[str, OllamaHost] = {}
+ollama_pools: Dict[Tuple[str, ...], OllamaHostPool] = {}
+
+def get_host_pool(base_urls: List[str]) -> OllamaHostPool:
+    """接続先一覧のホストプールを返す（同じ接続先のホスト状態は共有する）"""
+    key = tuple(base_urls)
+    if key not in ollama_pools:
+        for base_url in key:
+            if base_url not in ollama_hosts:
+                ollama_hosts[base_url] = OllamaHost(OllamaClient(base_url))
+        ollama_pools[key] = OllamaHostPool([ollama_hosts[base_url] for base_url in key])
+    return ollama_pools[key]
+
+def get_ollama_pool(function_name: str) -> OllamaHostPool:
+    """機能に対応する接続先のホストプールを返す"""
+    return get_host_pool(OLLAMA_FUNCTION_BASE_URLS.get(function_name, OLLAMA_API_BASE_URLS))
+
+# 共通の接続先（モデル一覧の取得など）。機能別の接続先もここで登録してヘルスチェックの対象にする
+ollama_pool = get_host_pool(OLLAMA_API_BASE_URLS)
+for function_name in MODEL_CONFIGS:
+    get_ollama_pool(function_name)
+
+def is_model_resident(base_url: str, model: str) -> Optional[bool]:
+    """直近のヘルスチェックでモデルが読み込まれていたか（未取得なら None）"""
+    host = ollama_hosts.get(base_url)
+    if host is None or host.checked_at is None:
+        return None
+    return any(entry["name"] == model for entry in host.residency)
+
+# 機能別の keep_alive（例: OLLAMA_KEEP_ALIVE_EMBEDDING=-1）。未設定なら OLLAMA_KEEP_ALIVE を使う
+OLLAMA_KEEP_ALIVES = {function_name: get_keep_alive(function_name) for function_name in MODEL_CONFIGS}
+
+# モデルの事前読み込みと常駐状況の記録
+model_warmer = ModelWarmer()
+
+def warm_model(function_name: str) -> None:
+    """機能に設定されたモデルを、そのモデルを持つ各ホストでバックグラウンドで読み込む"""
+    model = MODEL_CONFIGS[function_name]
+    for host in get_ollama_pool(function_name).hosts_for(model):
+        model_warmer.warm(host.client, model, OLLAMA_KEEP_ALIVES[function_name], embedding=function_name == "embedding")
+
+# 機能別の待ち行列とモデル別の同時実行数を管理するスケジューラ（同時実行数はモデルを持つホストの台数倍。
+# 同じモデルを機能ごとに別の接続先で使う場合も、すべての接続先のホストを合わせて数える）
+llm_scheduler = LLMScheduler(host_count=lambda model: model_capacity(ollama_hosts.values(), model))
+
+# 一括解析の設定
+BATCH_ANALYSIS_CONCURRENCY = int(os.environ.get("BATCH_ANALYSIS_CONCURRENCY", "4"))
+BATCH_ANALYSIS_MAX_PAPERS = int(os.environ.get("BATCH_ANALYSIS_MAX_PAPERS", "100"))
+
+# 全文要約の設定（チャンクの大きさは 1 トークン ≈ 4 文字として文字数に換算する）
+FULL_SUMMARY_CHUNK_TOKENS = int(os.environ.get("FULL_SUMMARY_CHUNK_TOKENS", "1500"))
+FULL_SUMMARY_CHARS_PER_TOKEN = 4
+FULL_SUMMARY_CONCURRENCY = int(os.environ.get("FULL_SUMMARY_CONCURRENCY", "4"))
+# 要約しないセクション（見出しの先頭が一致するもの、大文字小文字は区別しない）
+FULL_SUMMARY_SKIP_SECTIONS = tuple(
+    heading.strip()
+    for heading in os.environ.get("FULL_SUMMARY_SKIP_SECTIONS", "References,Bibliography,Acknowledg").split(",")
+    if heading.strip()
+)
+
+async def scheduled_chat_content(
+    function_name: str, payload: Dict[str, Any], priority: int, timeout: float = 60, pool: Optional[OllamaHostPool] = None
+) -> str:
+    """スケジューラの実行枠を確保してから、選んだホストでOllamaのchatを呼び出す"""
+    payload = {**payload, "keep_alive": OLLAMA_KEEP_ALIVES[function_name]}
+    async with llm_scheduler.slot(function_name, payload["model"], priority):
+        return await (pool or get_ollama_pool(function_name)).call(
+            payload["model"], lambda client: client.chat_content(payload, timeout=timeout)
+        )
+
+# LLM生成結果のキャッシュ
+llm_cache = LLMCache()
+
+# プロンプトテンプレートのバージョン（プロンプトを変更したら値を上げて既存キャッシュを無効化する）
+PROMPT_VERSIONS = {
+    "analyze": "1",
+    "translate": "1",
+    "quick-summary": "1",
+    "summarize": "1",
+    "summarize-chunk": "1",
+    "summarize-full": "1",
+}
+
+def get_llm_cache_key(endpoint: str, model: str, data: Any) -> str:
+    """エンドポイント・モデル・プロンプト版・入力からキャッシュキーを生成する"""
+    return llm_cache.make_key(endpoint, model, PROMPT_VERSIONS[endpoint], data)
+
+# 実行中の同一生成をまとめる（キーはキャッシュキーと共通）
+llm_flights = SingleFlight()
+translation_stream_flights = StreamFlight()
+analysis_stream_flights = StreamFlight()
+
 # 分野リスト
 FIELD_LIST = [
     "transformer","人工知能", "ロボティクス", "電子工学", "機械工学", "材料工学",
@@ -312,7 +507,10 @@ STRUCTURED_JSON_SCHEMA = {
     "additionalProperties": False
 }
 
-def get_structured_response_from_ollama(prompt: str, temperature: float = 0.8) -> Dict[str, Any]:
+# スキーマのバリデータは起動時に 1 度だけ作る
+analysis_decoder = StructuredDecoder(STRUCTURED_JSON_SCHEMA)
+
+async def get_structured_response_from_ollama(prompt: str, temperature: float = 0.8, priority: int = PRIORITY_NORMAL) -> Dict[str, Any]:
     """Ollama APIを使って構造化されたレスポンスを取得する"""
     payload = {
         "model": MODEL_CONFIGS["analysis"],
@@ -323,57 +521,284 @@ def get_structured_response_from_ollama(prompt: str, temperature: float = 0.8) -
     }
 
     try:
-        response = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result["message"]["content"]
-        
-        # マークダウンのコードブロックを除去
-        clean_lines = [line for line in content.splitlines() if not line.strip().startswith("```")]
-        clean_result = "\n".join(clean_lines)
+        content = await scheduled_chat_content("analysis", payload, priority, timeout=60)
         
-        # JSONパース
-        structured_data = json.loads(clean_result)
-        
-        # スキーマバリデーション
-        validate(instance=structured_data, schema=STRUCTURED_JSON_SCHEMA)
-        
-        return structured_data
-    except requests.RequestException as e:
+        # コードブロックの除去・JSONパース・スキーマバリデーション
+        return analysis_decoder.decode(content)
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Ollama API通信エラー: {str(e)}")
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=500, detail=f"JSONパースエラー: {str(e)}")
     except ValidationError as e:
         raise HTTPException(status_code=500, detail=f"スキーマバリデーションエラー: {str(e)}")
 
-def search_papers_semantic(query: str, year_from: int = 2023, year_to: int | None = None,
-                           limit: int = 10, max_retries: int = 5) -> list[dict]:
-    """Semantic Scholar API から論文情報を取得する"""
-    url = "http://api.semanticscholar.org/graph/v1/paper/search/"
+# Semantic Scholar から取得するフィールド
+SEMANTIC_SCHOLAR_FIELDS = "title,abstract,url,authors,openAccessPdf,citationCount,publicationDate,paperId,year,influentialCitationCount,fieldsOfStudy,venue,isOpenAccess,referenceCount"
+
+# 検索結果のキャッシュ（メモリ + ディスク、stale-while-revalidate 対応）
+search_cache = SearchCache()
+
+# 取得済み論文のメタデータストア（全文検索インデックス付き）
+paper_store = PaperStore()
+# 論文・検索クエリの埋め込みキャッシュ
+embedding_store = EmbeddingStore()
+# 論文の埋め込みの近傍検索インデックス（埋め込みモデルごと）
+vector_indexes: Dict[str, VectorIndex] = {}
+# 検索で取得した論文をバックグラウンドで埋め込んでインデックスに追加するか
+VECTOR_INDEX_AUTO_EMBED = os.environ.get("VECTOR_INDEX_AUTO_EMBED", "1") != "0"
+background_embedding_lock = asyncio.Lock()
+background_embedding_tasks: set = set()
+
+def get_vector_index(model: Optional[str] = None) -> VectorIndex:
+    """埋め込みモデルに対応するベクトルインデックスを返す"""
+    model = model or MODEL_CONFIGS["embedding"]
+    if model not in vector_indexes:
+        vector_indexes[model] = VectorIndex(os.path.join(VECTOR_INDEX_DIR, re.sub(r"[^\w.-]", "_", model)))
+    return vector_indexes[model]
+
+def sync_vector_index(model: Optional[str] = None) -> None:
+    """計算済みの埋め込みのうちインデックスに未登録のものを追加する"""
+    model = model or MODEL_CONFIGS["embedding"]
+    index = get_vector_index(model)
+    added = 0
+    for vectors in embedding_store.iter_vectors(model):
+        added += index.add(vectors)
+    if added:
+        print(f"ベクトルインデックスに{added}件を追加 ({model})")
+
+# 検索結果の並べ替え方法
+SEARCH_RERANK_OPTIONS = ("embedding",)
+
+# 検索元の既定値（local: ローカルのみ / remote: Semantic Scholar / hybrid: ローカルで足りればローカル、不足・障害時は補完）
+SEARCH_SOURCES = ("local", "remote", "hybrid")
+SEARCH_DEFAULT_SOURCE = os.environ.get("SEARCH_DEFAULT_SOURCE", "hybrid")
+# hybrid でローカルの結果だけを返してよい期間（秒）。過ぎたクエリは Semantic Scholar に問い合わせて新しい論文を取り込む
+SEARCH_LOCAL_MAX_AGE = float(os.environ.get("SEARCH_LOCAL_MAX_AGE", str(24 * 3600)))
+
+# Semantic Scholar へのアクセス設定（APIキーがあれば利用し、許可されたレートいっぱいまで送信する）
+SEMANTIC_SCHOLAR_API_KEY = os.environ.get("SEMANTIC_SCHOLAR_API_KEY")
+SEMANTIC_SCHOLAR_RATE = float(os.environ.get("SEMANTIC_SCHOLAR_RATE", "1"))
+SEMANTIC_SCHOLAR_BURST = int(os.environ.get("SEMANTIC_SCHOLAR_BURST", "1"))
+# 複数ワーカー間でレート上限を共有する場合の状態ファイル
+SEMANTIC_SCHOLAR_RATE_LIMIT_FILE = os.environ.get("SEMANTIC_SCHOLAR_RATE_LIMIT_FILE")
+
+semantic_scholar_limiter = TokenBucket(
+    SEMANTIC_SCHOLAR_RATE, SEMANTIC_SCHOLAR_BURST, state_path=SEMANTIC_SCHOLAR_RATE_LIMIT_FILE
+)
+semantic_scholar_client = httpx.AsyncClient(
+    headers={"x-api-key": SEMANTIC_SCHOLAR_API_KEY} if SEMANTIC_SCHOLAR_API_KEY else None,
+    timeout=30,
+)
+
+# PDF のディスクキャッシュとダウンロード用クライアント（リダイレクト先の PDF も取得する）
+pdf_cache = PdfCache()
+pdf_client = httpx.AsyncClient(follow_redirects=True)
+# PDFのテキスト抽出（ページ範囲ごとにプロセスプールで並列実行）
+pdf_extractor = PdfExtractor()
+# 処理済みPDFの本文とページ・セクション・段落の位置
+pdf_store = PdfStore()
+
+async def request_semantic_scholar(url: str, params: Dict[str, Any], max_retries: int = 5,
+                                   stats: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """レート制限とバックオフ付きで Semantic Scholar API を呼び出し、JSON を返す"""
+    if stats is None:
+        stats = {}
+    stats.setdefault("rate_limit_wait", 0.0)
+    stats.setdefault("retries", 0)
+    retry_after: Optional[float] = None
+    last_error = ""
+    
+    for attempt in range(max_retries):
+        if attempt > 0:
+            stats["retries"] += 1
+        stats["rate_limit_wait"] += await semantic_scholar_limiter.acquire()
+        try:
+            resp = await semantic_scholar_client.get(url, params=params)
+        except httpx.HTTPError as e:
+            last_error = str(e)
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        
+        try:
+            data = resp.json()
+        except ValueError:
+            data = {}
+        if resp.status_code == 429 or data.get("code") == "429":
+            # Retry-After を優先し、なければ指数バックオフ + ジッタ。待機は全リクエストで共有する
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            delay = max(retry_after or 0.0, backoff_delay(attempt))
+            print(f"Semantic Scholar API 429: {delay:.2f}秒待機して再試行します")
+            semantic_scholar_limiter.penalize(delay)
+            last_error = "429 Too Many Requests"
+            continue
+        if resp.status_code >= 500:
+            last_error = f"{resp.status_code} {data.get('message', '')}".strip()
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        if resp.status_code != 200:
+            raise HTTPException(status_code=500, detail=f"Semantic Scholar API error: {resp.status_code} {data.get('message', '')}")
+        return data
+    
+    if last_error.startswith("429"):
+        raise HTTPException(
+            status_code=503,
+            detail="Semantic Scholar APIが混雑しています。時間をおいて再試行してください",
+            headers={"Retry-After": str(int(retry_after or 1))}
+        )
+    raise HTTPException(status_code=500, detail=f"Semantic Scholar API error: {last_error}")
+
+SEMANTIC_SCHOLAR_SEARCH_URL = "http://api.semanticscholar.org/graph/v1/paper/search/"
+SEMANTIC_SCHOLAR_BULK_SEARCH_URL = "http://api.semanticscholar.org/graph/v1/paper/search/bulk"
+# 関連度順の検索で取得できる件数の上限（offset + limit）と 1 リクエストあたりの件数上限
+SEMANTIC_SCHOLAR_MAX_RESULTS = 1000
+SEMANTIC_SCHOLAR_PAGE_SIZE = 100
+# 一括取得モード（mode=bulk）で 1 回の検索で取得する件数の上限
+SEARCH_BULK_MAX_RESULTS = int(os.environ.get("SEARCH_BULK_MAX_RESULTS", "10000"))
+
+def get_year_param(year_from: int, year_to: int | None) -> str:
+    """年範囲の検索パラメータを返す"""
+    if year_to is not None:
+        return f"{year_from}-{year_to}"
+    return f"{year_from}-"
+
+def encode_search_cursor(**state: Any) -> str:
+    """次ページの取得位置をカーソル文字列に変換する"""
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_search_cursor(cursor: str) -> Dict[str, Any]:
+    """カーソル文字列を取得位置に戻す"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursorが不正です")
+    if not isinstance(state, dict):
+        raise HTTPException(status_code=400, detail="cursorが不正です")
+    return state
+
+async def search_papers_semantic(query: str, year_from: int = 2023, year_to: int | None = None,
+                                 limit: int = 10, offset: int = 0, max_retries: int = 5,
+                                 stats: Optional[Dict[str, float]] = None) -> list[dict]:
+    """Semantic Scholar API から論文情報を取得する（100件を超える場合は複数ページを並行に取得）"""
+    end = min(offset + limit, SEMANTIC_SCHOLAR_MAX_RESULTS)
+    
+    async def fetch_page(page_offset: int) -> list[dict]:
+        params = {
+            "query": query,
+            "fields": SEMANTIC_SCHOLAR_FIELDS,
+            "offset": page_offset,
+            "limit": min(SEMANTIC_SCHOLAR_PAGE_SIZE, end - page_offset),
+            "sort": "relevance",
+            "year": get_year_param(year_from, year_to),
+        }
+        data = await request_semantic_scholar(SEMANTIC_SCHOLAR_SEARCH_URL, params, max_retries, stats)
+        # 該当なしの場合は "data" キーが含まれない
+        papers = data.get("data", [])
+        remember_papers(papers)
+        return papers
+    
+    # 各ページの送信間隔はレートリミッタが調整する
+    pages = await asyncio.gather(*(fetch_page(page_offset) for page_offset in range(offset, end, SEMANTIC_SCHOLAR_PAGE_SIZE)))
+    return [paper for page in pages for paper in page]
+
+async def search_papers_semantic_bulk(query: str, year_from: int = 2023, year_to: int | None = None,
+                                      token: Optional[str] = None, max_retries: int = 5,
+                                      stats: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """Semantic Scholar の一括検索 API から 1 ページ（最大1000件）を取得する"""
     params = {
         "query": query,
-        "fields": "title,abstract,url,authors,openAccessPdf,citationCount,publicationDate,paperId,year,influentialCitationCount,fieldsOfStudy,venue,isOpenAccess,referenceCount",
-        "limit": limit,
-        "sort": "relevance",
+        "fields": SEMANTIC_SCHOLAR_FIELDS,
+        "year": get_year_param(year_from, year_to),
     }
-    if year_to is not None:
-        params["year"] = f"{year_from}-{year_to}"
-    else:
-        params["year"] = f"{year_from}-"
-
-    retries = 0
-    while retries < max_retries:
-        resp = requests.get(url, params=params, timeout=30)
-        data = resp.json()
-        if "data" in data:
-            return data["data"]
-        if data.get("code") == "429":
-            time.sleep(1)
-            retries += 1
-            continue
-        retries += 1
-    raise HTTPException(status_code=500, detail="Semantic Scholar API error")
+    if token:
+        params["token"] = token
+    data = await request_semantic_scholar(SEMANTIC_SCHOLAR_BULK_SEARCH_URL, params, max_retries, stats)
+    remember_papers(data.get("data", []))
+    return data
+
+async def embed_texts(texts: List[str], priority: int = PRIORITY_NORMAL) -> np.ndarray:
+    """テキストをバッチに分けて埋め込む（バッチは並行に送り、同時実行数はスケジューラが制限する）"""
+    model = MODEL_CONFIGS["embedding"]
+    pool = get_ollama_pool("embedding")
+    
+    async def embed_batch(batch: List[str]) -> List[List[float]]:
+        async with llm_scheduler.slot("embedding", model, priority):
+            return await pool.call(
+                model, lambda client: client.embed(model, batch, keep_alive=OLLAMA_KEEP_ALIVES["embedding"])
+            )
+    
+    results = await asyncio.gather(*(embed_batch(batch) for batch in batched(texts)))
+    return np.array([vector for result in results for vector in result], dtype=np.float32)
+
+async def embed_query(text: str, priority: int = PRIORITY_INTERACTIVE) -> np.ndarray:
+    """検索クエリを埋め込む（直近のクエリはメモリから返す）"""
+    model = MODEL_CONFIGS["embedding"]
+    vector = embedding_store.get_query(text, model)
+    if vector is None:
+        vector = (await embed_texts([text], priority))[0]
+        embedding_store.set_query(text, model, vector)
+    return vector
+
+async def embed_papers(papers: List[Dict[str, Any]], priority: int = PRIORITY_NORMAL) -> Dict[str, np.ndarray]:
+    """論文の埋め込みを paperId ごとに返す（未計算の論文のみ埋め込んで保存する）"""
+    model = MODEL_CONFIGS["embedding"]
+    vectors = embedding_store.get_many([paper["paperId"] for paper in papers if paper.get("paperId")], model)
+    missing = {
+        paper["paperId"]: paper_text(paper)
+        for paper in papers
+        if paper.get("paperId") and paper["paperId"] not in vectors and paper_text(paper)
+    }
+    if missing:
+        matrix = await embed_texts(list(missing.values()), priority)
+        computed = dict(zip(missing.keys(), matrix))
+        await asyncio.to_thread(embedding_store.set_many, model, computed)
+        # ファイル追記とメモリマップの再読み込みを伴うため、イベントループを止めないようスレッドで実行する
+        await asyncio.to_thread(get_vector_index(model).add, computed)
+        vectors.update(computed)
+    return vectors
+
+def remember_papers(papers: List[Dict[str, Any]]) -> None:
+    """取得した論文をバックグラウンドでローカルストアに保存し、埋め込んでインデックスに追加する"""
+    if not papers:
+        return
+    
+    async def store_papers():
+        # 全文検索インデックスの更新を検索のレスポンスに含めないよう、スレッドで保存する
+        try:
+            await asyncio.to_thread(paper_store.upsert_many, papers)
+        except Exception as e:
+            print(f"論文の保存に失敗: {e}")
+            return
+        if not VECTOR_INDEX_AUTO_EMBED:
+            return
+        # 対話的な処理の邪魔をしないよう、1 バッチずつ最低優先度で埋め込む
+        async with background_embedding_lock:
+            try:
+                for batch in batched(papers):
+                    await embed_papers(batch, PRIORITY_BATCH)
+            except Exception as e:
+                print(f"論文の埋め込みに失敗: {e}")
+    
+    task = asyncio.ensure_future(store_papers())
+    background_embedding_tasks.add(task)
+    task.add_done_callback(background_embedding_tasks.discard)
+
+async def rerank_papers(query: str, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """クエリとのコサイン類似度で論文を並べ替え、similarity を付けて返す"""
+    query_vector, vectors = await asyncio.gather(
+        embed_query(query), embed_papers(papers, PRIORITY_INTERACTIVE)
+    )
+    embedded = [index for index, paper in enumerate(papers) if paper.get("paperId") in vectors]
+    if not embedded:
+        return papers
+    scores = cosine_scores(query_vector, np.stack([vectors[papers[index]["paperId"]] for index in embedded]))
+    order = np.argsort(-scores, kind="stable")
+    # キャッシュ上の論文データを書き換えないよう複製してスコアを付ける
+    ranked = [{**papers[embedded[i]], "similarity": round(float(scores[i]), 4)} for i in order]
+    # 埋め込めなかった論文（タイトル・アブストラクトなし）は末尾に元の順で並べる
+    embedded_set = set(embedded)
+    return ranked + [paper for index, paper in enumerate(papers) if index not in embedded_set]
 
 # エンドポイント定義
 
@@ -385,18 +810,47 @@ async def health_check():
         "ollama_model": OLLAMA_MODEL,
         "ollama_url": OLLAMA_API_BASE_URL,
         "ollama_chat_url": OLLAMA_CHAT_URL,
-        "running_in_docker": running_in_docker()
+        "ollama_function_urls": OLLAMA_FUNCTION_BASE_URLS,
+        "ollama_hosts": [host.stats() for host in ollama_hosts.values()],
+        "running_in_docker": running_in_docker(),
+        "json_codec": JSON_CODEC,
+        "keep_alive": OLLAMA_KEEP_ALIVES,
+        "models": model_warmer.stats(is_model_resident),
+        "llm_queues": llm_scheduler.metrics(),
+        "search_cache": search_cache.stats(),
+        "paper_store": paper_store.stats(),
+        "embeddings": embedding_store.stats(),
+        "vector_index": get_vector_index().stats(),
+        "pdf_cache": pdf_cache.stats(),
+        "pdf_extract": pdf_extractor.stats(),
+        "pdf_store": pdf_store.stats(),
+        "semantic_scholar_rate_limit": semantic_scholar_limiter.stats(),
+        "singleflight": {
+            "llm": llm_flights.stats(),
+            "translation_stream": translation_stream_flights.stats(),
+            "analysis_stream": analysis_stream_flights.stats(),
+        }
     }
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """LLMキャッシュの件数とヒット/ミス数を取得"""
+    return llm_cache.stats()
+
+@app.delete("/cache")
+async def invalidate_cache(endpoint: Optional[str] = None):
+    """LLMキャッシュを削除（endpoint指定時はそのエンドポイント分のみ）"""
+    if endpoint is not None and endpoint not in PROMPT_VERSIONS:
+        raise HTTPException(status_code=400, detail=f"無効なエンドポイント名です。有効な値: {list(PROMPT_VERSIONS)}")
+    deleted = llm_cache.invalidate(endpoint)
+    return {"message": f"キャッシュを{deleted}件削除しました", "deleted": deleted}
+
 @app.get("/models")
 async def get_available_models():
     """利用可能なOllamaモデル一覧を取得"""
     try:
-        ollama_tags_url = get_ollama_url("/api/tags")
-        response = requests.get(ollama_tags_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
+        # ヘルスチェックで取得済みの一覧を返す（古ければ裏で取り直す）
+        data = {"models": await ollama_pool.list_models()}
         models = []
         
         if "models" in data:
@@ -423,88 +877,502 @@ async def get_model_config():
         analysis_model=MODEL_CONFIGS["analysis"],
         translation_model=MODEL_CONFIGS["translation"],
         quick_summary_model=MODEL_CONFIGS["quick_summary"],
-        detailed_summary_model=MODEL_CONFIGS["detailed_summary"]
+        detailed_summary_model=MODEL_CONFIGS["detailed_summary"],
+        embedding_model=MODEL_CONFIGS["embedding"]
     )
 
 @app.post("/models/config")
 async def update_model_config(request: ModelConfigRequest):
     """機能別モデル設定を更新"""
-    valid_functions = ["analysis", "translation", "quick_summary", "detailed_summary"]
+    valid_functions = ["analysis", "translation", "quick_summary", "detailed_summary", "embedding"]
     
     if request.function_name not in valid_functions:
         raise HTTPException(status_code=400, detail=f"無効な機能名です。有効な値: {valid_functions}")
     
     # モデルが利用可能か確認
     try:
-        ollama_tags_url = get_ollama_url("/api/tags")
-        response = requests.get(ollama_tags_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        available_models = [model.get("name", "") for model in data.get("models", [])]
+        pool = get_ollama_pool(request.function_name)
+        available_models = [model.get("name", "") for model in await pool.list_models()]
+        if request.model_name not in available_models:
+            # 直前に追加されたモデルかもしれないので、取り直してから判定する
+            available_models = [model.get("name", "") for model in await pool.list_models(refresh=True)]
         
         if request.model_name not in available_models:
             raise HTTPException(status_code=400, detail=f"モデル '{request.model_name}' は利用できません。利用可能なモデル: {available_models}")
         
         # 設定を更新
+        previous_model = MODEL_CONFIGS[request.function_name]
         MODEL_CONFIGS[request.function_name] = request.model_name
+        # 次のリクエストで読み込みを待たないよう、新しいモデルを先に読み込む
+        warm_model(request.function_name)
+        # 旧モデルを同じホストで使う機能がなくなった場合は、そのホストからアンロードしてメモリを空ける
+        if previous_model != request.model_name:
+            for host in pool.hosts:
+                if not any(
+                    model == previous_model and host in get_ollama_pool(function_name).hosts
+                    for function_name, model in MODEL_CONFIGS.items()
+                ):
+                    asyncio.ensure_future(model_warmer.unload(host.client, previous_model))
+        if request.function_name == "embedding":
+            # 新しいモデルのインデックスに計算済みの埋め込みを反映する
+            get_vector_index(request.model_name)
+            asyncio.ensure_future(asyncio.to_thread(sync_vector_index, request.model_name))
         
         return {
             "message": f"{request.function_name}の使用モデルを{request.model_name}に変更しました",
             "updated_config": MODEL_CONFIGS
         }
         
-    except requests.RequestException as e:
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Ollama API通信エラー: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"モデル設定の更新に失敗しました: {str(e)}")
 
+async def find_papers(q: str, year_from: int, year_to: int | None, limit: int, offset: int = 0,
+                      source: str = SEARCH_DEFAULT_SOURCE, pinned: Optional[str] = None) -> tuple[list[dict], Dict[str, Any]]:
+    """検索元（local / remote / hybrid）に応じて論文を検索し、(論文, 検索元などの情報) を返す
+
+    pinned には 1 ページ目で実際に使った検索元（カーソルに保存した値）を渡す。続きのページも同じ検索元から
+    取得し、ローカルと Semantic Scholar の順位が混ざって論文が重複・欠落しないようにする。
+    """
+    local_papers: list[dict] = []
+    if pinned in ("local", "local-fallback"):
+        papers = paper_store.search(q, year_from, year_to, limit, offset, match_all=source == "hybrid")
+        return papers, {"source": pinned}
+    if source != "remote" and pinned is None:
+        # hybrid ではすべての語を含む論文だけで 1 ページ分が埋まり、かつ最近上流から取得したクエリのみローカルから返す
+        papers = paper_store.search(q, year_from, year_to, limit, offset, match_all=source == "hybrid")
+        if source == "local":
+            return papers, {"source": "local"}
+        age = paper_store.query_age(q, year_from, year_to)
+        if len(papers) >= limit and age is not None and age <= SEARCH_LOCAL_MAX_AGE:
+            return papers, {"source": "local"}
+        local_papers = papers
+    
+    cache_key = search_cache.make_key(
+        query=q, year_from=year_from, year_to=year_to, limit=limit, offset=offset, fields=SEMANTIC_SCHOLAR_FIELDS
+    )
+    stats: Dict[str, float] = {"rate_limit_wait": 0.0, "retries": 0}
+    try:
+        papers, cache_status, age = await search_cache.get_or_fetch(
+            cache_key, lambda: search_papers_semantic(q, year_from, year_to, limit, offset, stats=stats)
+        )
+    except HTTPException as e:
+        # 上流が混雑・障害中の場合はローカルの結果で代替する（2 ページ目以降は検索元を変えない）
+        if source != "hybrid" or pinned is not None or not local_papers:
+            raise
+        print(f"Semantic Scholar API エラーのためローカル検索結果を返却: {e.detail}")
+        return local_papers, {"source": "local-fallback", **stats}
+    if offset == 0:
+        await asyncio.to_thread(paper_store.mark_query_refreshed, q, year_from, year_to)
+    return papers, {"source": "remote", "cache": cache_status, "age": age, **stats}
+
 @app.get("/search")
-async def search_endpoint(q: str, year_from: int = 2023, year_to: int | None = None, limit: int = 10):
-    """論文検索エンドポイント"""
-    papers = search_papers_semantic(q, year_from, year_to, limit)
-    return {"papers": papers}
+async def search_endpoint(response: Response, q: str, year_from: int = 2023, year_to: int | None = None,
+                          limit: int = 10, cursor: Optional[str] = None, mode: str = "relevance",
+                          source: Optional[str] = None, rerank: Optional[str] = None):
+    """論文検索エンドポイント（cursor で続きを取得、mode=bulk で大量の結果をNDJSONで逐次返す）"""
+    source = source or SEARCH_DEFAULT_SOURCE
+    if source not in SEARCH_SOURCES:
+        raise HTTPException(status_code=400, detail="sourceは 'local'、'remote'、'hybrid' のいずれかを指定してください")
+    if rerank is not None and rerank not in SEARCH_RERANK_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"rerankは {list(SEARCH_RERANK_OPTIONS)} のいずれかを指定してください")
+    if mode == "bulk":
+        return search_bulk(q, year_from, year_to, limit, cursor)
+    if mode != "relevance":
+        raise HTTPException(status_code=400, detail="modeは 'relevance' または 'bulk' を指定してください")
+    if not 1 <= limit <= SEMANTIC_SCHOLAR_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limitは1〜{SEMANTIC_SCHOLAR_MAX_RESULTS}で指定してください")
+    state = decode_search_cursor(cursor) if cursor else {}
+    offset = int(state.get("offset", 0))
+    pinned = state.get("source")
+    if offset >= SEMANTIC_SCHOLAR_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"関連度順の検索は{SEMANTIC_SCHOLAR_MAX_RESULTS}件までです。mode=bulkを利用してください")
+    
+    papers, info = await find_papers(q, year_from, year_to, limit, offset, source, pinned)
+    response.headers["X-Search-Source"] = info["source"]
+    if "cache" in info:
+        response.headers["Cache-Control"] = search_cache.cache_control(info["age"])
+        response.headers["Age"] = str(int(info["age"]))
+        response.headers["X-Cache"] = info["cache"]
+    if "rate_limit_wait" in info:
+        # レートリミッタで待機した秒数と上流への再試行回数
+        response.headers["X-RateLimit-Wait"] = f"{info['rate_limit_wait']:.3f}"
+        response.headers["X-Upstream-Retries"] = str(info["retries"])
+    
+    if rerank == "embedding" and papers:
+        started_at = time.perf_counter()
+        try:
+            papers = await rerank_papers(q, papers)
+            response.headers["X-Rerank"] = "embedding"
+        except (httpx.HTTPError, HTTPException, KeyError) as e:
+            # 埋め込みモデルが使えない場合は元の順序のまま返す
+            print(f"埋め込みによる並べ替えに失敗: {e}")
+            response.headers["X-Rerank"] = "failed"
+        response.headers["X-Rerank-Time"] = f"{time.perf_counter() - started_at:.3f}"
+    
+    # 要求件数ちょうど返ってきた場合は続きがあるとみなす
+    next_offset = offset + len(papers)
+    has_more = len(papers) >= limit and next_offset < SEMANTIC_SCHOLAR_MAX_RESULTS
+    return {
+        "papers": papers,
+        "offset": offset,
+        "next_cursor": encode_search_cursor(offset=next_offset, source=info["source"]) if has_more else None,
+    }
+
+@app.post("/search/fanout")
+async def fanout_search(request: FanoutSearchRequest):
+    """複数のクエリを並行に検索し、RRFで1つのランキングに統合して返す（各論文にヒットしたクエリと順位を付ける）"""
+    source = request.source or SEARCH_DEFAULT_SOURCE
+    if source not in SEARCH_SOURCES:
+        raise HTTPException(status_code=400, detail="sourceは 'local'、'remote'、'hybrid' のいずれかを指定してください")
+    if not 1 <= request.limit_per_query <= SEMANTIC_SCHOLAR_PAGE_SIZE or not 1 <= request.limit <= SEMANTIC_SCHOLAR_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit・limit_per_queryは1〜{SEMANTIC_SCHOLAR_PAGE_SIZE}で指定してください")
+    
+    keywords = list(request.queries or [])
+    target, facets = None, []
+    if request.analysis is not None:
+        analysis = request.analysis
+        keywords += [label.en for label in analysis.search_keywords]
+        target = analysis.target.en
+        facets = [label.en for label in analysis.methods + analysis.factors + analysis.metrics]
+    queries = build_fanout_queries(keywords, target, facets)
+    if not queries:
+        raise HTTPException(status_code=400, detail="queriesまたはanalysisを指定してください")
+    
+    started_at = time.perf_counter()
+    
+    async def search_query(query: str):
+        try:
+            papers, info = await find_papers(query, request.year_from, request.year_to, request.limit_per_query, 0, source)
+            return query, papers, info
+        except HTTPException as e:
+            return query, None, {"status_code": e.status_code, "error": e.detail}
+    
+    # 各クエリは並行に送り、上流への送信間隔はレートリミッタが調整する
+    results = await asyncio.gather(*(search_query(query) for query in queries))
+    rankings = {query: papers for query, papers, _ in results if papers is not None}
+    if not rankings:
+        _, _, info = results[0]
+        raise HTTPException(status_code=info["status_code"], detail=info["error"])
+    
+    return {
+        "papers": reciprocal_rank_fusion(rankings)[:request.limit],
+        "queries": [
+            {"query": query, "count": len(papers) if papers is not None else 0, **info}
+            for query, papers, info in results
+        ],
+        "elapsed": round(time.perf_counter() - started_at, 3),
+    }
+
+def search_bulk(q: str, year_from: int, year_to: int | None, limit: int, cursor: Optional[str]) -> StreamingResponse:
+    """一括検索 API をページ送りし、取得したページから順にNDJSONで返す"""
+    if not 1 <= limit <= SEARCH_BULK_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limitは1〜{SEARCH_BULK_MAX_RESULTS}で指定してください")
+    token = decode_search_cursor(cursor).get("token") if cursor else None
+    stats: Dict[str, float] = {"rate_limit_wait": 0.0, "retries": 0}
+    
+    def fetch(page_token: Optional[str]) -> asyncio.Task:
+        return asyncio.ensure_future(search_papers_semantic_bulk(q, year_from, year_to, page_token, stats=stats))
+    
+    async def generate_pages():
+        started_at = time.perf_counter()
+        count = 0
+        page = 0
+        next_token = token
+        pending = fetch(token)
+        try:
+            while pending is not None:
+                try:
+                    data = await pending
+                except HTTPException as e:
+                    yield json.dumps({"type": "error", "status_code": e.status_code, "detail": e.detail}, ensure_ascii=False) + "\n"
+                    return
+                # ページ途中で打ち切ると続きのカーソルで取りこぼすため、limit はページ単位で判定する
+                papers = data.get("data", [])
+                count += len(papers)
+                next_token = data.get("token")
+                # 次ページの取得を先に始めてから現在のページを送る
+                pending = fetch(next_token) if next_token and count < limit else None
+                page += 1
+                yield json.dumps({
+                    "type": "page",
+                    "page": page,
+                    "papers": papers,
+                    "count": count,
+                    "total": data.get("total"),
+                }, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "type": "complete",
+                "count": count,
+                "next_cursor": encode_search_cursor(token=next_token) if next_token else None,
+                "elapsed": round(time.perf_counter() - started_at, 3),
+                "rate_limit_wait": round(stats["rate_limit_wait"], 3),
+                "retries": stats["retries"],
+            }, ensure_ascii=False) + "\n"
+        finally:
+            # クライアント切断時は先読み中のリクエストを取り消す
+            if pending is not None:
+                pending.cancel()
+    
+    return StreamingResponse(generate_pages(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+@app.get("/papers/{paper_id}/similar")
+async def similar_papers(paper_id: str, k: int = 10):
+    """埋め込みの近傍検索で、指定した論文に似た論文を返す"""
+    if not 1 <= k <= 100:
+        raise HTTPException(status_code=400, detail="kは1〜100で指定してください")
+    index = get_vector_index()
+    # インデックスのロック待ちでイベントループを止めないようスレッドで実行する
+    vector = await asyncio.to_thread(index.get_vector, paper_id)
+    if vector is None:
+        paper = paper_store.get(paper_id)
+        if paper is None:
+            raise HTTPException(status_code=404, detail="論文が見つかりません。先に検索で取得してください")
+        try:
+            vectors = await embed_papers([paper], PRIORITY_INTERACTIVE)
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=500, detail=f"埋め込みの計算に失敗しました: {str(e)}")
+        if paper_id not in vectors:
+            raise HTTPException(status_code=422, detail="タイトル・アブストラクトがないため類似論文を検索できません")
+        vector = vectors[paper_id]
+    
+    started_at = time.perf_counter()
+    neighbours = await asyncio.to_thread(index.search, vector, k, paper_id)
+    search_ms = (time.perf_counter() - started_at) * 1000
+    papers = paper_store.get_many(neighbour_id for neighbour_id, _ in neighbours)
+    return {
+        "paperId": paper_id,
+        "similar": [
+            {**papers[neighbour_id], "similarity": round(score, 4)}
+            for neighbour_id, score in neighbours
+            if neighbour_id in papers
+        ],
+        "search_ms": round(search_ms, 3),
+    }
+
+def build_analysis_result(raw_data: Dict[str, Any]) -> PaperAnalysisResult:
+    """LLMの構造化出力を解析結果モデルに変換する"""
+    return PaperAnalysisResult(
+        title=raw_data.get("title"),
+        fields=[PaperField(**field) for field in raw_data["fields"]],
+        target=Label(**raw_data["labels"]["target"]),
+        methods=[Label(**method) for method in raw_data["labels"]["approaches"]["methods"]],
+        factors=[Label(**factor) for factor in raw_data["labels"]["approaches"]["factors"]],
+        metrics=[Label(**metric) for metric in raw_data["labels"]["approaches"]["metrics"]],
+        search_keywords=[Label(**keyword) for keyword in raw_data["labels"]["search_keywords"]]
+    )
+
+async def run_paper_analysis(request: PaperAnalysisRequest, priority: int = PRIORITY_NORMAL) -> PaperAnalysisResult:
+    """論文解析を実行する（キャッシュ確認・同一解析の共有を含む）"""
+    # キャッシュ確認
+    cache_key = get_llm_cache_key("analyze", MODEL_CONFIGS["analysis"], request.model_dump())
+    cached = llm_cache.get(cache_key, "analyze")
+    if cached is not None:
+        print("解析結果をキャッシュから返却")
+        return PaperAnalysisResult(**cached)
+    
+    # プロンプト生成
+    input_text = f"{request.title}, {request.abstract}"
+    prompt = ANALYSIS_PROMPT_TEMPLATE.format(input_text=input_text)
+    print(f"プロンプト生成完了, 長さ: {len(prompt)}")
+    
+    # Ollama APIで解析実行
+    print("Ollama API呼び出し開始...")
+    raw_data = await llm_flights.do(
+        cache_key, lambda: get_structured_response_from_ollama(prompt, priority=priority)
+    )
+    print("Ollama API呼び出し完了")
+    
+    # レスポンスデータの変換
+    analysis_result = build_analysis_result(raw_data)
+    
+    llm_cache.set(cache_key, "analyze", analysis_result.model_dump())
+    return analysis_result
 
 @app.post("/analyze", response_model=PaperAnalysisResult)
-async def analyze_paper(request: PaperAnalysisRequest):
+async def analyze_paper(request: PaperAnalysisRequest, x_request_priority: Optional[str] = Header(None)):
     """論文解析エンドポイント"""
     print(f"解析リクエスト受信: {request.title}")
     print(f"Ollama URL: {OLLAMA_CHAT_URL}")
     print(f"Docker環境: {running_in_docker()}")
     
     try:
-        # プロンプト生成
-        input_text = f"{request.title}, {request.abstract}"
-        prompt = ANALYSIS_PROMPT_TEMPLATE.format(input_text=input_text)
-        print(f"プロンプト生成完了, 長さ: {len(prompt)}")
-        
-        # Ollama APIで解析実行
-        print("Ollama API呼び出し開始...")
-        raw_data = get_structured_response_from_ollama(prompt)
-        print("Ollama API呼び出し完了")
-        
-        # レスポンスデータの変換
-        analysis_result = PaperAnalysisResult(
-            title=raw_data.get("title"),
-            fields=[PaperField(**field) for field in raw_data["fields"]],
-            target=Label(**raw_data["labels"]["target"]),
-            methods=[Label(**method) for method in raw_data["labels"]["approaches"]["methods"]],
-            factors=[Label(**factor) for factor in raw_data["labels"]["approaches"]["factors"]],
-            metrics=[Label(**metric) for metric in raw_data["labels"]["approaches"]["metrics"]],
-            search_keywords=[Label(**keyword) for keyword in raw_data["labels"]["search_keywords"]]
-        )
-        
-        return analysis_result
-        
+        return await run_paper_analysis(request, parse_priority(x_request_priority))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"論文解析中にエラーが発生しました: {str(e)}")
 
+# /analyze-stream で完成した順に送るフィールド（構造化出力内のパス → 解析結果のフィールド名）
+ANALYSIS_STREAM_FIELDS = {
+    ("title",): "title",
+    ("fields",): "fields",
+    ("labels", "target"): "target",
+    ("labels", "approaches", "methods"): "methods",
+    ("labels", "approaches", "factors"): "factors",
+    ("labels", "approaches", "metrics"): "metrics",
+    ("labels", "search_keywords"): "search_keywords",
+}
+
+async def stream_analysis_from_ollama(payload: Dict[str, Any], cache_key: str):
+    """Ollamaの解析ストリームを読み出す（完了時に検証済みの結果をキャッシュへ保存）"""
+    parser = IncrementalJSONParser(paths=())
+    async with llm_scheduler.slot("analysis", payload["model"], PRIORITY_INTERACTIVE):
+        async with get_ollama_pool("analysis").acquire(payload["model"]) as client:
+            async for chunk_data in client.chat_stream(
+                {**payload, "keep_alive": OLLAMA_KEEP_ALIVES["analysis"]}, timeout=120
+            ):
+                yield chunk_data
+                parser.feed(chunk_data.get("message", {}).get("content", ""))
+                if chunk_data.get("done", False):
+                    break
+    try:
+        raw_data = parser.result()
+        analysis_decoder.validate(raw_data)
+        llm_cache.set(cache_key, "analyze", build_analysis_result(raw_data).model_dump())
+    except (ValueError, ValidationError, KeyError) as e:
+        print(f"ストリーミング解析結果の検証に失敗: {e}")
+
+@app.post("/analyze-stream")
+async def analyze_paper_stream(request: PaperAnalysisRequest):
+    """論文解析をストリーミングで実行し、値が確定したフィールドから順にSSEで返す"""
+    print(f"ストリーミング解析リクエスト受信: {request.title}")
+    
+    # キャッシュ確認（/analyze と共通のキャッシュ）
+    cache_key = get_llm_cache_key("analyze", MODEL_CONFIGS["analysis"], request.model_dump())
+    cached = llm_cache.get(cache_key, "analyze")
+    if cached is None:
+        # 待ち行列が溢れている場合はストリーム開始前に429を返す
+        llm_scheduler.ensure_capacity("analysis", MODEL_CONFIGS["analysis"])
+    
+    def encode(event: Dict[str, Any]) -> str:
+        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    async def generate_analysis():
+        started_at = time.perf_counter()
+        yield encode({"type": "start"})
+        if cached is not None:
+            print("解析結果をキャッシュから返却")
+            for name in ANALYSIS_STREAM_FIELDS.values():
+                yield encode({"type": "field", "name": name, "value": cached[name], "elapsed": 0.0})
+            yield encode({"type": "complete", "result": cached, "cached": True, "elapsed": round(time.perf_counter() - started_at, 3)})
+            return
+        
+        prompt = ANALYSIS_PROMPT_TEMPLATE.format(input_text=f"{request.title}, {request.abstract}")
+        payload = {
+            "model": MODEL_CONFIGS["analysis"],
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.8,
+            "format": STRUCTURED_JSON_SCHEMA
+        }
+        parser = IncrementalJSONParser(ANALYSIS_STREAM_FIELDS)
+        try:
+            # 同じ論文の解析が進行中なら、その上流ストリームを途中から共有する
+            chunk_stream = analysis_stream_flights.subscribe(
+                cache_key, lambda: stream_analysis_from_ollama(payload, cache_key)
+            )
+            async for chunk_data in chunk_stream:
+                # 閉じたフィールドを完成した順に送る（値の検証は最後にまとめて行う）
+                for path, value in parser.feed(chunk_data.get("message", {}).get("content", "")):
+                    yield encode({
+                        "type": "field",
+                        "name": ANALYSIS_STREAM_FIELDS[path],
+                        "value": value,
+                        "elapsed": round(time.perf_counter() - started_at, 3),
+                    })
+                if chunk_data.get("done", False):
+                    break
+            
+            raw_data = parser.result()
+            analysis_decoder.validate(raw_data)
+            result = build_analysis_result(raw_data)
+            yield encode({"type": "complete", "result": result.model_dump(), "elapsed": round(time.perf_counter() - started_at, 3)})
+        except httpx.HTTPStatusError as e:
+            yield encode({"type": "error", "content": f"Ollama API error: {e.response.status_code}"})
+        except httpx.HTTPError as e:
+            yield encode({"type": "error", "content": f"Ollama API通信エラー: {str(e)}"})
+        except json.JSONDecodeError as e:
+            yield encode({"type": "error", "content": f"JSONパースエラー: {str(e)}"})
+        except ValidationError as e:
+            yield encode({"type": "error", "content": f"スキーマバリデーションエラー: {e.message}"})
+        except Exception as e:
+            print(f"ストリーミング解析エラー: {str(e)}")
+            yield encode({"type": "error", "content": str(e)})
+    
+    return StreamingResponse(
+        generate_analysis(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+    )
+
+@app.post("/analyze/batch")
+async def analyze_papers_batch(papers: List[PaperAnalysisRequest], format: str = "ndjson"):
+    """複数論文を並列に解析し、完了した順に結果をNDJSON（format=sseでSSE）で返す"""
+    print(f"一括解析リクエスト受信: {len(papers)}件")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="formatは 'ndjson' または 'sse' を指定してください")
+    if len(papers) > BATCH_ANALYSIS_MAX_PAPERS:
+        raise HTTPException(status_code=400, detail=f"一度に解析できる論文は{BATCH_ANALYSIS_MAX_PAPERS}件までです")
+    
+    # 同じ論文（タイトル+アブストラクト）はバッチ内で1回だけ解析する
+    index_groups: Dict[str, List[int]] = {}
+    for index, paper in enumerate(papers):
+        key = get_llm_cache_key("analyze", MODEL_CONFIGS["analysis"], paper.model_dump())
+        index_groups.setdefault(key, []).append(index)
+    semaphore = asyncio.Semaphore(BATCH_ANALYSIS_CONCURRENCY)
+    
+    async def analyze_group(indexes: List[int]):
+        async with semaphore:
+            try:
+                # 一括解析は対話的な操作より後回しにする
+                result = await run_paper_analysis(papers[indexes[0]], PRIORITY_BATCH)
+                return indexes, {"status": "ok", "result": result.model_dump()}
+            except HTTPException as e:
+                return indexes, {"status": "error", "status_code": e.status_code, "detail": e.detail}
+            except Exception as e:
+                return indexes, {"status": "error", "status_code": 500, "detail": f"論文解析中にエラーが発生しました: {str(e)}"}
+    
+    def encode(event: Dict[str, Any]) -> str:
+        body = json.dumps(event, ensure_ascii=False)
+        return f"data: {body}\n\n" if format == "sse" else f"{body}\n"
+    
+    async def generate_results():
+        tasks = [asyncio.ensure_future(analyze_group(indexes)) for indexes in index_groups.values()]
+        completed = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                indexes, body = await next_result
+                for index in indexes:
+                    completed += 1
+                    yield encode({"type": "result", "index": index, "completed": completed, "total": len(papers), **body})
+            yield encode({"type": "complete", "total": len(papers), "unique": len(index_groups)})
+        finally:
+            # クライアント切断時は未着手の解析を取り消す
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        generate_results(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
 @app.post("/translate", response_model=TranslationResult)
-async def translate_text(request: TranslationRequest):
+async def translate_text(request: TranslationRequest, x_request_priority: Optional[str] = Header(None)):
     """英語テキストを日本語に翻訳するエンドポイント"""
     print(f"翻訳リクエスト受信: {request.text[:100]}...")
     
     try:
+        # キャッシュ確認
+        cache_key = get_llm_cache_key("translate", MODEL_CONFIGS["translation"], request.model_dump())
+        cached = llm_cache.get(cache_key, "translate")
+        if cached is not None:
+            print("翻訳結果をキャッシュから返却")
+            return TranslationResult(**cached)
+        
         # 翻訳用プロンプト（より明確に指示）
         translation_prompt = f"""/no_think 以下の英語テキストのみを日本語に翻訳してください。余計な文章や説明は一切追加せず、翻訳結果のみを出力してください。
 
@@ -521,25 +1389,59 @@ async def translate_text(request: TranslationRequest):
         }
         
         print("Ollama API翻訳呼び出し開始...")
-        response = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        translation = result["message"]["content"].strip()
+        priority = parse_priority(x_request_priority)
+        content = await llm_flights.do(
+            cache_key, lambda: scheduled_chat_content("translation", payload, priority, timeout=60)
+        )
+        translation = content.strip()
         
         print("翻訳完了")
-        return TranslationResult(translation=translation)
+        result = TranslationResult(translation=translation)
+        llm_cache.set(cache_key, "translate", result.model_dump())
+        return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"翻訳中にエラーが発生しました: {str(e)}")
 
+async def stream_translation_from_ollama(payload: Dict[str, Any], cache_key: str):
+    """Ollamaの翻訳ストリームを読み出す（完了時に結果をキャッシュへ保存）"""
+    accumulated_text = ""
+    # ストリーミング翻訳は対話的な処理として最優先で実行枠を確保する
+    async with llm_scheduler.slot("translation", payload["model"], PRIORITY_INTERACTIVE):
+        async with get_ollama_pool("translation").acquire(payload["model"]) as client:
+            async for chunk_data in client.chat_stream(
+                {**payload, "keep_alive": OLLAMA_KEEP_ALIVES["translation"]}, timeout=120
+            ):
+                yield chunk_data
+                accumulated_text += chunk_data.get("message", {}).get("content", "") or chunk_data.get("text", "")
+                if chunk_data.get("done", False):
+                    llm_cache.set(cache_key, "translate", {"translation": accumulated_text.strip()})
+                    break
+
 @app.post("/translate-stream")
 async def translate_text_stream(request: TranslationRequest):
     """英語テキストを日本語にストリーミング翻訳するエンドポイント"""
     print(f"ストリーミング翻訳リクエスト受信: {request.text[:100]}...")
     
-    def generate_translation():
+    # キャッシュ確認（/translate と共通のキャッシュ）
+    cache_key = get_llm_cache_key("translate", MODEL_CONFIGS["translation"], request.model_dump())
+    cached = llm_cache.get(cache_key, "translate")
+    if cached is None:
+        # 待ち行列が溢れている場合はストリーム開始前に429を返す
+        llm_scheduler.ensure_capacity("translation", MODEL_CONFIGS["translation"])
+    
+    async def generate_translation():
         try:
+            if cached is not None:
+                print("翻訳結果をキャッシュから返却")
+                translation = cached["translation"]
+                yield f"data: {json.dumps({'type': 'start', 'content': ''})}\n\n"
+                yield f"data: {json.dumps({'type': 'chunk', 'content': translation, 'accumulated': translation})}\n\n"
+                yield f"data: {json.dumps({'type': 'complete', 'content': translation})}\n\n"
+                return
+            
             # 翻訳用プロンプト（明確に指示）
             translation_prompt = f"""/no_think 以下の英語テキストのみを日本語に翻訳してください。余計な文章や説明は一切追加せず、翻訳結果のみを出力してください。
 
@@ -561,53 +1463,42 @@ async def translate_text_stream(request: TranslationRequest):
             # 開始イベントを送信
             yield f"data: {json.dumps({'type': 'start', 'content': ''})}\n\n"
             
-            # Ollamaからのストリーミングレスポンスを処理
-            response = requests.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=120)
-            
-            if response.status_code != 200:
-                error_msg = f"Ollama API error: {response.status_code}"
-                print(error_msg)
-                yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
-                return
-            
             accumulated_text = ""
             
-            # Streamlitアプリと同じ処理方法
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        chunk_data = json.loads(line.decode('utf-8'))
-                        print(f"受信チャンク: {chunk_data}")
-                        
-                        # Streamlitアプリと同じ構造でcontentを抽出
-                        content = ""
-                        if "message" in chunk_data and "content" in chunk_data["message"]:
-                            content = chunk_data["message"]["content"]
-                        else:
-                            # 例外対応: "text" キーの場合
-                            content = chunk_data.get("text", "")
-                            
-                        if content:
-                            accumulated_text += content
-                            # チャンクデータを送信
-                            yield f"data: {json.dumps({'type': 'chunk', 'content': content, 'accumulated': accumulated_text})}\n\n"
-                            
-                        # 完了フラグをチェック
-                        if chunk_data.get('done', False):
-                            print("ストリーミング完了フラグ受信")
-                            # 完了イベントを送信
-                            yield f"data: {json.dumps({'type': 'complete', 'content': accumulated_text})}\n\n"
-                            break
-                            
-                    except json.JSONDecodeError as e:
-                        print(f"JSON decode error: {e}")
-                        # JSONパースに失敗した場合、デコード済みの文字列をそのまま処理
-                        decoded_line = line.decode("utf-8")
-                        print(f"デコード済み行: {decoded_line}")
-                        continue
+            # Ollamaからのストリーミングレスポンスを処理（Streamlitアプリと同じ処理方法）
+            # 同じテキストの翻訳が進行中なら、その上流ストリームを途中から共有する
+            chunk_stream = translation_stream_flights.subscribe(
+                cache_key, lambda: stream_translation_from_ollama(payload, cache_key)
+            )
+            async for chunk_data in chunk_stream:
+                print(f"受信チャンク: {chunk_data}")
+                
+                # Streamlitアプリと同じ構造でcontentを抽出
+                content = ""
+                if "message" in chunk_data and "content" in chunk_data["message"]:
+                    content = chunk_data["message"]["content"]
+                else:
+                    # 例外対応: "text" キーの場合
+                    content = chunk_data.get("text", "")
+                    
+                if content:
+                    accumulated_text += content
+                    # チャンクデータを送信
+                    yield f"data: {json.dumps({'type': 'chunk', 'content': content, 'accumulated': accumulated_text})}\n\n"
+                    
+                # 完了フラグをチェック
+                if chunk_data.get('done', False):
+                    print("ストリーミング完了フラグ受信")
+                    # 完了イベントを送信
+                    yield f"data: {json.dumps({'type': 'complete', 'content': accumulated_text})}\n\n"
+                    break
                         
             print("ストリーミング翻訳完了")
             
+        except httpx.HTTPStatusError as e:
+            error_msg = f"Ollama API error: {e.response.status_code}"
+            print(error_msg)
+            yield f"data: {json.dumps({'type': 'error', 'content': error_msg})}\n\n"
         except Exception as e:
             print(f"ストリーミング翻訳エラー: {str(e)}")
             import traceback
@@ -628,11 +1519,18 @@ async def translate_text_stream(request: TranslationRequest):
     )
 
 @app.post("/quick-summary", response_model=QuickSummary)
-async def quick_summary_paper(request: SummaryRequest):
+async def quick_summary_paper(request: SummaryRequest, x_request_priority: Optional[str] = Header(None)):
     """論文の簡潔要約（一言要約+キーワード）を生成"""
     print(f"簡潔要約リクエスト受信: {request.title}")
     
     try:
+        # キャッシュ確認
+        cache_key = get_llm_cache_key("quick-summary", MODEL_CONFIGS["quick_summary"], request.model_dump())
+        cached = llm_cache.get(cache_key, "quick-summary")
+        if cached is not None:
+            print("簡潔要約をキャッシュから返却")
+            return QuickSummary(**cached)
+        
         # 簡潔要約用プロンプト（内容を増強）
         quick_summary_prompt = f"""論文: {request.title}
 {request.abstract}
@@ -679,27 +1577,26 @@ async def quick_summary_paper(request: SummaryRequest):
         }
         
         print("Ollama API簡潔要約呼び出し開始...")
-        response = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result["message"]["content"]
-        
-        # マークダウンのコードブロックを除去
-        clean_lines = [line for line in content.splitlines() if not line.strip().startswith("```")]
-        clean_result = "\n".join(clean_lines)
+        priority = parse_priority(x_request_priority)
+        content = await llm_flights.do(
+            cache_key, lambda: scheduled_chat_content("quick_summary", payload, priority, timeout=60)
+        )
         
         try:
-            quick_data = json.loads(clean_result)
-            return QuickSummary(**quick_data)
+            quick_data = json_loads(strip_code_fence(content))
+            quick_summary = QuickSummary(**quick_data)
+            llm_cache.set(cache_key, "quick-summary", quick_summary.model_dump())
+            return quick_summary
         except (json.JSONDecodeError, ValidationError) as e:
             print(f"簡潔要約のパースに失敗: {e}")
-            # フォールバック: デフォルト値を返す
+            # フォールバック: デフォルト値を返す（キャッシュしない）
             return QuickSummary(
                 keywords=["論文", "研究", "分析"],
                 summary="論文の要約に失敗しました"
             )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"簡潔要約中にエラーが発生しました: {str(e)}")
 
@@ -729,12 +1626,22 @@ STRUCTURED_SUMMARY_SCHEMA = {
     "additionalProperties": False
 }
 
+summary_decoder = StructuredDecoder(STRUCTURED_SUMMARY_SCHEMA)
+
 @app.post("/summarize", response_model=SummaryResult)
-async def summarize_paper(request: SummaryRequest):
+async def summarize_paper(request: SummaryRequest, x_request_priority: Optional[str] = Header(None)):
     """論文を要約するエンドポイント（構造化要約対応）"""
     print(f"要約リクエスト受信: {request.title}")
     
     try:
+        # キャッシュ確認（簡潔要約・構造化要約の両モデルをキーに含める）
+        summary_models = f"{MODEL_CONFIGS['quick_summary']}|{MODEL_CONFIGS['detailed_summary']}"
+        cache_key = get_llm_cache_key("summarize", summary_models, request.model_dump())
+        cached = llm_cache.get(cache_key, "summarize")
+        if cached is not None:
+            print("要約結果をキャッシュから返却")
+            return SummaryResult(**cached)
+        
         # 簡潔要約
         simple_summary_prompt = f"""{request.title}
 {request.abstract}
@@ -780,6 +1687,21 @@ async def summarize_paper(request: SummaryRequest):
 /no_think"""
         
         # 並行して両方の要約を実行
+        # モデルが異なる場合のみ機能別の接続先に振り分ける（同一モデルなら同じホストで読み込み済みモデルを共有）
+        simple_pool = get_ollama_pool("quick_summary")
+        if MODEL_CONFIGS["detailed_summary"] != MODEL_CONFIGS["quick_summary"]:
+            structured_pool = get_ollama_pool("detailed_summary")
+        else:
+            structured_pool = simple_pool
+        priority = parse_priority(x_request_priority)
+        timings: Dict[str, float] = {}
+        
+        async def timed(name: str, coro):
+            start = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                timings[name] = round(time.perf_counter() - start, 3)
         
         async def get_simple_summary():
             payload = {
@@ -788,10 +1710,8 @@ async def summarize_paper(request: SummaryRequest):
                 "stream": False,
                 "temperature": 0.5
             }
-            response = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=60)
-            response.raise_for_status()
-            result = response.json()
-            return result["message"]["content"].strip()
+            content = await scheduled_chat_content("quick_summary", payload, priority, timeout=60, pool=simple_pool)
+            return content.strip()
         
         async def get_structured_summary():
             payload = {
@@ -801,115 +1721,142 @@ async def summarize_paper(request: SummaryRequest):
                 "temperature": 0.7,
                 "format": STRUCTURED_SUMMARY_SCHEMA
             }
-            response = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=90)
-            response.raise_for_status()
-            result = response.json()
-            content = result["message"]["content"]
-            
-            # マークダウンのコードブロックを除去
-            clean_lines = [line for line in content.splitlines() if not line.strip().startswith("```")]
-            clean_result = "\n".join(clean_lines)
+            content = await scheduled_chat_content(
+                "detailed_summary", payload, priority, timeout=90, pool=structured_pool
+            )
             
             try:
-                structured_data = json.loads(clean_result)
-                # スキーマバリデーション
-                validate(instance=structured_data, schema=STRUCTURED_SUMMARY_SCHEMA)
+                structured_data = summary_decoder.decode(content)
                 return StructuredSummary(**structured_data)
             except (json.JSONDecodeError, ValidationError) as e:
                 print(f"構造化要約のパースに失敗: {e}")
                 return None
         
-        print("Ollama API要約呼び出し開始...")
+        async def generate_summaries():
+            total_start = time.perf_counter()
+            # 簡潔要約と構造化要約を同時に生成（構造化要約は失敗してもエラーにしない）
+            simple_summary, structured_summary = await asyncio.gather(
+                timed("simple", get_simple_summary()),
+                timed("structured", get_structured_summary()),
+                return_exceptions=True,
+            )
+            timings["total"] = round(time.perf_counter() - total_start, 3)
+            return simple_summary, structured_summary, timings
         
-        # 簡潔な要約を先に取得
-        simple_summary = await get_simple_summary()
+        print("Ollama API要約呼び出し開始...")
+        # 同じ論文の要約が生成中ならその結果を共有する
+        simple_summary, structured_summary, timings = await llm_flights.do(cache_key, generate_summaries)
         
-        # 構造化要約を並行して取得（失敗してもエラーにしない）
-        try:
-            structured_summary = await get_structured_summary()
-        except Exception as e:
-            print(f"構造化要約の取得に失敗: {e}")
+        if isinstance(simple_summary, BaseException):
+            raise simple_summary
+        if isinstance(structured_summary, BaseException):
+            print(f"構造化要約の取得に失敗: {structured_summary}")
             structured_summary = None
         
-        print("要約完了")
-        return SummaryResult(
+        print(f"要約完了: {timings}")
+        summary_result = SummaryResult(
             summary=simple_summary,
-            structured=structured_summary
+            structured=structured_summary,
+            timings=timings
         )
+        # 構造化要約に失敗した結果は再生成の余地を残すためキャッシュしない
+        if structured_summary is not None:
+            llm_cache.set(cache_key, "summarize", summary_result.model_dump())
+        return summary_result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"要約中にエラーが発生しました: {str(e)}")
 
-def extract_text_from_pdf_url(pdf_url: str) -> str:
-    """PDFのURLからテキストを抽出する"""
-    try:
-        response = requests.get(pdf_url, timeout=30)
-        response.raise_for_status()
-        
-        # PDFバイナリデータをPyPDF2で処理
-        pdf_file = io.BytesIO(response.content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        
-        return text.strip()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"PDF処理エラー: {str(e)}")
-
-def extract_metadata_from_text(text: str) -> PdfMetadata:
-    """抽出したテキストからメタデータを推定する（簡易版）"""
-    lines = text.split('\n')
-    
-    # 簡易的なメタデータ抽出
-    title = ""
-    authors = []
-    abstract = ""
-    sections = []
-    
-    # タイトル推定（最初の非空行）
-    for line in lines[:10]:
-        if line.strip() and len(line.strip()) > 10:
-            title = line.strip()
-            break
-    
-    # セクション見出し検出
-    for line in lines:
-        line = line.strip()
-        if line and (line.isupper() or 
-                    line.startswith(('Abstract', 'Introduction', 'Method', 'Results', 'Conclusion', 'References'))):
-            if len(line) < 50:  # 見出しは通常短い
-                sections.append(line)
-    
+def pdf_metadata(title: str, sections: List[List[Any]]) -> PdfMetadata:
+    """PDFのメタデータ（簡易版: タイトルは先頭付近の行、セクションは見出しらしい行の先頭10件）"""
     return PdfMetadata(
         title=title,
-        authors=authors,
-        abstract=abstract,
-        sections=sections[:10]  # 最大10セクション
+        authors=[],
+        abstract="",
+        sections=[section[0] for section in sections[:10]]
     )
 
+async def open_pdf_document(request: PdfProcessRequest) -> Tuple[Optional[PdfDocument], Optional[PdfEntry]]:
+    """処理済みの文書があれば返し、なければPDFをダウンロード（ディスクキャッシュ経由）して返す"""
+    parsed_url = urlparse(request.pdf_url)
+    if not parsed_url.scheme or not parsed_url.netloc:
+        raise HTTPException(status_code=400, detail="無効なPDF URLです")
+    # paperId で処理済みならダウンロードしない
+    if request.paper_id:
+        document = pdf_store.find(paper_id=request.paper_id)
+        if document is not None:
+            return document, None
+    entry = await pdf_cache.fetch(pdf_client, request.pdf_url)
+    # 別のURL・paperIdで処理済みの同じ内容のPDFも再利用する
+    document = pdf_store.get(entry.sha256)
+    if document is not None:
+        pdf_store.add_keys(entry.sha256, paper_id=request.paper_id, url=request.pdf_url)
+    return document, entry
+
+async def iter_extracted_pages(entry: PdfEntry, page_count: int, writer: PdfDocumentWriter,
+                               batch_pages: Optional[int] = None):
+    """PDFのページを抽出順に返しながら本文ストアへ書き込む（ページ情報, 本文, 新たに見つかったセクション）"""
+    batches = pdf_extractor.iter_page_batches(entry.path, page_count, batch_pages)
+    try:
+        async for batch in batches:
+            for page in batch:
+                text = page.pop("text")
+                yield page, text, writer.add_page(page["page"], text)
+            writer.flush()
+    finally:
+        await batches.aclose()
+
+async def process_pdf_entry(entry: PdfEntry, request: PdfProcessRequest) -> Tuple[List[Dict[str, Any]], str, PdfMetadata, bool]:
+    """ダウンロード済みのPDFを抽出して本文ストアへ保存する（ページ情報, 本文, メタデータ, 打ち切りの有無）"""
+    page_count = await pdf_extractor.count_pages(entry.path)
+    writer = pdf_store.writer(entry.sha256)
+    pages = []
+    texts = []
+    async for page, text, _ in iter_extracted_pages(entry, page_count, writer):
+        pages.append(page)
+        texts.append(text)
+    extracted_text = "\n".join(texts).strip()
+    # メタデータ抽出（抽出中に記録したタイトル・見出しを使う）
+    metadata = pdf_metadata(writer.title, writer.sections)
+    truncated = any(page["timed_out"] for page in pages)
+    # 打ち切ったページがある場合は、次回改めて抽出するため保存しない
+    if extracted_text and not truncated:
+        writer.finish(metadata.model_dump(), paper_id=request.paper_id, url=request.pdf_url)
+    return pages, extracted_text, metadata, truncated
+
 @app.post("/process-pdf", response_model=PdfProcessResult)
-async def process_pdf(request: PdfProcessRequest):
-    """PDFからテキストとメタデータを抽出する"""
+async def process_pdf(request: PdfProcessRequest, response: Response):
+    """PDFからテキストとメタデータを抽出する（処理済みなら保存済みの本文を返す）"""
     try:
-        # URL検証
-        parsed_url = urlparse(request.pdf_url)
-        if not parsed_url.scheme or not parsed_url.netloc:
-            raise HTTPException(status_code=400, detail="無効なPDF URLです")
+        document, entry = await open_pdf_document(request)
+        if document is not None:
+            response.headers["X-PDF-Store"] = "HIT"
+            return PdfProcessResult(
+                text=await asyncio.to_thread(pdf_store.text, document),
+                metadata=PdfMetadata(**document.metadata)
+            )
+        response.headers["X-PDF-Store"] = "MISS"
+        response.headers["X-PDF-Cache"] = entry.status
         
-        # テキスト抽出
-        extracted_text = extract_text_from_pdf_url(request.pdf_url)
+        # テキスト抽出（ページ範囲ごとにプロセスプールで並列実行）
+        started_at = time.perf_counter()
+        pages, extracted_text, metadata, truncated = await process_pdf_entry(entry, request)
         
         if not extracted_text:
             raise HTTPException(status_code=400, detail="PDFからテキストを抽出できませんでした")
         
-        # メタデータ抽出
-        metadata = extract_metadata_from_text(extracted_text)
-        
         return PdfProcessResult(
             text=extracted_text,
-            metadata=metadata
+            metadata=metadata,
+            extraction=PdfExtractionStats(
+                workers=len(pdf_extractor.page_ranges(len(pages))),
+                seconds=round(time.perf_counter() - started_at, 4),
+                cpu_seconds=round(sum(page["cpu_seconds"] for page in pages), 4),
+                truncated=truncated,
+                pages=pages,
+            )
         )
         
     except HTTPException:
@@ -917,6 +1864,297 @@ async def process_pdf(request: PdfProcessRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF処理中にエラーが発生しました: {str(e)}")
 
+# /process-pdf-stream で 1 回に抽出するページ数（小さいほど最初のページが早く届く）
+PDF_STREAM_BATCH_PAGES = int(os.environ.get("PDF_STREAM_BATCH_PAGES", "2"))
+
+def ndjson_line(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+@app.post("/process-pdf-stream")
+async def process_pdf_stream(request: PdfProcessRequest):
+    """PDFを抽出したページから順にNDJSONで返す（ページ本文・セクション見出し・メタデータ）"""
+    # ダウンロードの失敗はストリーム開始前にステータスコードで返す
+    document, entry = await open_pdf_document(request)
+    if document is not None:
+        return StreamingResponse(
+            replay_pdf_document(document),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-PDF-Store": "HIT"},
+        )
+    try:
+        page_count = await pdf_extractor.count_pages(entry.path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"PDF処理エラー: {str(e)}")
+
+    async def generate_pages():
+        started_at = time.perf_counter()
+        writer = pdf_store.writer(entry.sha256)
+        cpu_seconds = 0.0
+        truncated = False
+        yield ndjson_line({"type": "start", "pages": page_count, "size": entry.size, "cache": entry.status, "store": "MISS"})
+        try:
+            # ページ本文は送信・保存後に保持しない（位置情報のみ残す）
+            async for page, text, sections in iter_extracted_pages(entry, page_count, writer, PDF_STREAM_BATCH_PAGES):
+                had_title = bool(writer.title)
+                cpu_seconds += page["cpu_seconds"]
+                truncated = truncated or page["timed_out"]
+                yield ndjson_line({"type": "page", **page, "text": text})
+                for heading, section_page, _ in sections:
+                    yield ndjson_line({"type": "section", "page": section_page, "heading": heading})
+                if writer.title and not had_title:
+                    yield ndjson_line({"type": "metadata", "metadata": pdf_metadata(writer.title, writer.sections).model_dump()})
+        except Exception as e:
+            yield ndjson_line({"type": "error", "status_code": 500, "detail": f"PDF処理エラー: {str(e)}"})
+            return
+        if not writer.text_chars:
+            yield ndjson_line({"type": "error", "status_code": 400, "detail": "PDFからテキストを抽出できませんでした"})
+            return
+        metadata = pdf_metadata(writer.title, writer.sections).model_dump()
+        if not truncated:
+            writer.finish(metadata, paper_id=request.paper_id, url=request.pdf_url)
+        yield ndjson_line({
+            "type": "complete",
+            "metadata": metadata,
+            "extraction": {
+                "pages": page_count,
+                "seconds": round(time.perf_counter() - started_at, 4),
+                "cpu_seconds": round(cpu_seconds, 4),
+                "truncated": truncated,
+            },
+        })
+
+    return StreamingResponse(
+        generate_pages(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-PDF-Cache": entry.status, "X-PDF-Store": "MISS"},
+    )
+
+async def replay_pdf_document(document: PdfDocument):
+    """保存済みの文書を /process-pdf-stream と同じ形式で返す（ページ本文は数ページずつ読み出す）"""
+    started_at = time.perf_counter()
+    yield ndjson_line({"type": "start", "pages": document.page_count, "size": None, "cache": None, "store": "HIT"})
+    yield ndjson_line({"type": "metadata", "metadata": document.metadata})
+    sections_by_page: Dict[int, List[str]] = {}
+    for heading, page, _ in document.sections:
+        sections_by_page.setdefault(page, []).append(heading)
+    batch_pages = max(PDF_STREAM_BATCH_PAGES, 8)
+    for first in range(1, document.page_count + 1, batch_pages):
+        rows = await asyncio.to_thread(list, pdf_store.iter_pages(document, first, first + batch_pages - 1))
+        for page, text in rows:
+            yield ndjson_line({"type": "page", "page": page, "chars": len(text), "seconds": 0.0,
+                               "cpu_seconds": 0.0, "timed_out": False, "text": text})
+            for heading in sections_by_page.get(page, []):
+                yield ndjson_line({"type": "section", "page": page, "heading": heading})
+    yield ndjson_line({
+        "type": "complete",
+        "metadata": document.metadata,
+        "extraction": {
+            "pages": document.page_count,
+            "seconds": round(time.perf_counter() - started_at, 4),
+            "cpu_seconds": 0.0,
+            "truncated": False,
+        },
+    })
+
+def find_pdf_document(paper_id: Optional[str], pdf_url: Optional[str]) -> PdfDocument:
+    if not paper_id and not pdf_url:
+        raise HTTPException(status_code=400, detail="paper_idまたはpdf_urlを指定してください")
+    document = pdf_store.find(paper_id=paper_id, url=pdf_url)
+    if document is None:
+        raise HTTPException(status_code=404, detail="処理済みのPDFが見つかりません。先に /process-pdf で処理してください")
+    return document
+
+@app.get("/pdf-document")
+async def pdf_document_outline(paper_id: Optional[str] = None, pdf_url: Optional[str] = None):
+    """処理済みPDFの構成（ページ数・セクションの範囲・段落数・メタデータ）を返す"""
+    return find_pdf_document(paper_id, pdf_url).outline()
+
+@app.get("/pdf-document/text")
+async def pdf_document_text(paper_id: Optional[str] = None, pdf_url: Optional[str] = None,
+                            section: Optional[int] = None, page: Optional[int] = None):
+    """処理済みPDFの本文のうち、指定したセクションまたはページだけを読み出す"""
+    document = find_pdf_document(paper_id, pdf_url)
+    if section is not None:
+        if not document.sections:
+            raise HTTPException(status_code=404, detail="セクション見出しが検出されていません")
+        if not 0 <= section < len(document.sections):
+            raise HTTPException(status_code=400, detail=f"sectionは0〜{len(document.sections) - 1}で指定してください")
+        span = document.section_spans()[section]
+        start, end = span["start"], span["end"]
+    elif page is not None:
+        if not 1 <= page <= document.page_count:
+            raise HTTPException(status_code=400, detail=f"pageは1〜{document.page_count}で指定してください")
+        start, end = document.page_span(page)
+    else:
+        start, end = 0, document.chars
+    text = await asyncio.to_thread(pdf_store.read, document, start, end)
+    return {"start": start, "end": end, "pages": [document.page_of(start), document.page_of(max(start, end - 1))], "text": text.strip()}
+
+async def load_pdf_document(request: PdfProcessRequest) -> PdfDocument:
+    """処理済みの文書を返す（未処理ならPDFを抽出して保存する）"""
+    document, entry = await open_pdf_document(request)
+    if document is not None:
+        return document
+    _, extracted_text, _, _ = await process_pdf_entry(entry, request)
+    if not extracted_text:
+        raise HTTPException(status_code=400, detail="PDFからテキストを抽出できませんでした")
+    document = pdf_store.get(entry.sha256)
+    if document is None:
+        raise HTTPException(status_code=422, detail="PDFの本文を保存できませんでした（抽出の打ち切り、または本文ストアが無効です）")
+    return document
+
+async def generate_full_summary(document: PdfDocument, title: str, priority: int) -> FullSummaryResult:
+    """チャンクごとの要約（map、簡潔要約モデル）を構造化要約（reduce、構造化要約モデル）にまとめる"""
+    timings: Dict[str, float] = {}
+    total_start = time.perf_counter()
+    max_chars = FULL_SUMMARY_CHUNK_TOKENS * FULL_SUMMARY_CHARS_PER_TOKEN
+    map_model = MODEL_CONFIGS["quick_summary"]
+    map_pool = get_ollama_pool("quick_summary")
+    # 1 リクエストで同時に投入するチャンク数を制限する（待ち行列を埋め尽くさない）
+    semaphore = asyncio.Semaphore(FULL_SUMMARY_CONCURRENCY)
+    
+    async def summarize_text(prompt_data: Dict[str, Any], prompt: str) -> Tuple[str, bool]:
+        """簡潔要約モデルで要約する（チャンクの内容とモデルをキーにキャッシュする）"""
+        cache_key = get_llm_cache_key("summarize-chunk", map_model, prompt_data)
+        cached = llm_cache.get(cache_key, "summarize-chunk")
+        if cached is not None:
+            return cached["summary"], True
+        payload = {
+            "model": map_model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": False,
+            "temperature": 0.3
+        }
+        async with semaphore:
+            content = await llm_flights.do(
+                cache_key, lambda: scheduled_chat_content("quick_summary", payload, priority, timeout=120, pool=map_pool)
+            )
+        summary = content.strip()
+        if summary:
+            llm_cache.set(cache_key, "summarize-chunk", {"summary": summary})
+        return summary, False
+    
+    async def summarize_chunk(span: Dict[str, Any]) -> Optional[FullSummaryChunk]:
+        text = (await asyncio.to_thread(pdf_store.read, document, span["start"], span["end"])).strip()
+        if not text:
+            return None
+        section = span["heading"] or "冒頭"
+        prompt = f"""論文「{title}」の一部です（セクション: {section}）。
+
+{text}
+
+この部分の内容を日本語で3〜5文に要約してください。手法名・データセット・数値・比較結果は具体的に残してください。
+
+/no_think"""
+        summary, cached = await summarize_text({"title": title, "section": span["heading"], "text": text}, prompt)
+        return FullSummaryChunk(section=span["heading"], start=span["start"], end=span["end"], summary=summary, cached=cached)
+    
+    async def summarize_notes(notes: List[str]) -> str:
+        prompt = f"""論文「{title}」の各部分の要約です。
+
+{chr(10).join(notes)}
+
+これらを日本語で5〜8文にまとめてください。手法名・数値・結果は具体的に残してください。
+
+/no_think"""
+        summary, _ = await summarize_text({"title": title, "notes": notes}, prompt)
+        return summary
+    
+    # map: チャンクを並行して要約する（失敗したチャンクがあればエラー。成功分はキャッシュ済みのため再実行時は残りのみ生成）
+    map_start = time.perf_counter()
+    spans = document.chunk_spans(max_chars, FULL_SUMMARY_SKIP_SECTIONS)
+    chunks = [chunk for chunk in await asyncio.gather(*(summarize_chunk(span) for span in spans)) if chunk is not None and chunk.summary]
+    if not chunks:
+        raise HTTPException(status_code=400, detail="要約できる本文がありません")
+    timings["map"] = round(time.perf_counter() - map_start, 3)
+    
+    # まとめた要約が長すぎる場合は、上限に収まるまで要約をまとめ直す
+    notes = [f"[{chunk.section or '冒頭'}] {chunk.summary}" for chunk in chunks]
+    while len(notes) > 1 and sum(len(note) for note in notes) > max_chars:
+        groups: List[List[str]] = [[]]
+        for note in notes:
+            if groups[-1] and sum(len(item) for item in groups[-1]) + len(note) > max_chars:
+                groups.append([])
+            groups[-1].append(note)
+        if len(groups) >= len(notes):
+            break
+        notes = list(await asyncio.gather(*(summarize_notes(group) for group in groups)))
+    
+    # reduce: 構造化要約のスキーマでまとめる
+    reduce_start = time.perf_counter()
+    reduce_prompt = f"""論文: {title}
+
+以下は論文の全文をセクションごとに要約したものです。
+
+{chr(10).join(notes)}
+
+これらをもとに、論文全体の構造化要約を作成してください。
+
+**必ず日本語で生成してください。**
+
+以下のJSON形式で出力:
+
+1. **title**: 論文のタイトル（元のタイトルまたは内容を表す短いタイトル）
+2. **keywords**: 論文の主要キーワード（3-8個）。具体的な技術名、手法名、領域名を含む。
+3. **background**: 研究背景・動機（なぜこの研究が必要だったのか、既存手法の問題点）
+4. **method**: 使用した手法・アプローチ。具体的な技術名、モデル名、アルゴリズム名、実験設定を含む。
+5. **results**: 得られた結果・成果。数値や性能指標、比較結果を具体的に記述。
+6. **conclusion**: 結論・将来の展望、応用可能性
+7. **importance_level**: 常に\"medium\"を設定（重要度判定は主観的なため）
+
+/no_think"""
+    payload = {
+        "model": MODEL_CONFIGS["detailed_summary"],
+        "messages": [{"role": "user", "content": reduce_prompt}],
+        "stream": False,
+        "temperature": 0.7,
+        "format": STRUCTURED_SUMMARY_SCHEMA
+    }
+    content = await scheduled_chat_content("detailed_summary", payload, priority, timeout=180)
+    timings["reduce"] = round(time.perf_counter() - reduce_start, 3)
+    timings["total"] = round(time.perf_counter() - total_start, 3)
+    try:
+        structured = StructuredSummary(**summary_decoder.decode(content))
+    except (json.JSONDecodeError, ValidationError) as e:
+        print(f"全文要約の構造化に失敗: {e}")
+        structured = None
+    return FullSummaryResult(structured=structured, chunks=chunks, timings=timings)
+
+@app.post("/summarize-full", response_model=FullSummaryResult)
+async def summarize_full_paper(request: FullSummaryRequest, x_request_priority: Optional[str] = Header(None)):
+    """PDFの全文をセクション・段落ごとのチャンクに分けて要約し、構造化要約にまとめる"""
+    try:
+        if request.pdf_url:
+            document = await load_pdf_document(PdfProcessRequest(pdf_url=request.pdf_url, paper_id=request.paper_id))
+        else:
+            document = find_pdf_document(request.paper_id, None)
+        title = request.title or document.metadata.get("title") or ""
+        print(f"全文要約リクエスト受信: {title} ({document.page_count}ページ)")
+        
+        # キャッシュ確認（チャンク要約・まとめの両モデルをキーに含める）
+        summary_models = f"{MODEL_CONFIGS['quick_summary']}|{MODEL_CONFIGS['detailed_summary']}"
+        cache_key = get_llm_cache_key(
+            "summarize-full", summary_models,
+            {"sha256": document.sha256, "title": title, "chunk_tokens": FULL_SUMMARY_CHUNK_TOKENS},
+        )
+        cached = llm_cache.get(cache_key, "summarize-full")
+        if cached is not None:
+            print("全文要約をキャッシュから返却")
+            return FullSummaryResult(**cached)
+        
+        priority = parse_priority(x_request_priority)
+        result = await llm_flights.do(cache_key, lambda: generate_full_summary(document, title, priority))
+        print(f"全文要約完了: {len(result.chunks)}チャンク {result.timings}")
+        # 構造化に失敗した結果はキャッシュしない（チャンク要約はキャッシュ済み）
+        if result.structured is not None:
+            llm_cache.set(cache_key, "summarize-full", result.model_dump())
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"全文要約中にエラーが発生しました: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
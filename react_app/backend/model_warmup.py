@@ -0,0 +1,106 @@
+"""Ollama モデルの事前読み込み（ウォームアップ）と常駐状況の管理
+
+機能別に設定されたモデルを起動時とモデル変更時に読み込んでおき、最初のリクエストで
+モデルの読み込み時間を待たないようにする。各リクエストには機能別の keep_alive を付け、
+アイドル後にモデルがアンロードされるまでの時間を制御する。常駐状況（/api/ps）は
+ホストのヘルスチェック（ollama_pool）で取得する。
+"""
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+MODEL_WARMUP_ENABLED = os.environ.get("MODEL_WARMUP_ENABLED", "1") != "0"
+MODEL_WARMUP_TIMEOUT = float(os.environ.get("MODEL_WARMUP_TIMEOUT", "300"))
+# keep_alive の既定値（Ollama の既定は 5m。-1 でアンロードしない）
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+KeepAlive = Union[str, int, float]
+
+
+def parse_keep_alive(value: str) -> KeepAlive:
+    """keep_alive の設定値を変換する（数値は秒数として数値のまま、"30m" などはそのまま渡す）"""
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    return int(number) if number.is_integer() else number
+
+
+def get_keep_alive(function_name: str) -> KeepAlive:
+    """機能別の keep_alive（例: OLLAMA_KEEP_ALIVE_EMBEDDING）。未設定なら共通の値"""
+    return parse_keep_alive(os.environ.get(f"OLLAMA_KEEP_ALIVE_{function_name.upper()}", OLLAMA_KEEP_ALIVE))
+
+
+class ModelWarmer:
+    """モデルのウォームアップ結果を記録する"""
+
+    def __init__(self, enabled: bool = MODEL_WARMUP_ENABLED, timeout: float = MODEL_WARMUP_TIMEOUT):
+        self.enabled = enabled
+        self.timeout = timeout
+        # (接続先, モデル名) → ウォームアップの状態
+        self.models: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def _warm(self, client, model: str, keep_alive: KeepAlive, embedding: bool) -> None:
+        key = (client.base_url, model)
+        state = self.models.setdefault(key, {"warmups": 0})
+        state.update({"status": "loading", "keep_alive": keep_alive, "error": None})
+        started_at = time.perf_counter()
+        try:
+            # 入力なしのリクエストはモデルの読み込みのみを行う
+            if embedding:
+                result = await client.post_json(
+                    "/api/embed", {"model": model, "input": [], "keep_alive": keep_alive}, timeout=self.timeout
+                )
+            else:
+                result = await client.post_json(
+                    "/api/generate", {"model": model, "keep_alive": keep_alive}, timeout=self.timeout
+                )
+            load_duration = result.get("load_duration")
+            state.update({
+                "status": "loaded",
+                "latency": round(time.perf_counter() - started_at, 3),
+                # Ollama が報告する読み込み時間（ns → 秒。既に常駐していればほぼ 0）
+                "load_duration": round(load_duration / 1e9, 3) if load_duration is not None else None,
+                "warmed_at": time.time(),
+            })
+            state["warmups"] += 1
+            print(f"モデルをウォームアップしました: {model} ({client.base_url}, {state['latency']}秒)")
+        except Exception as e:
+            state.update({"status": "error", "error": str(e) or type(e).__name__})
+            print(f"モデルのウォームアップに失敗: {model} ({client.base_url}): {state['error']}")
+
+    def warm(self, client, model: str, keep_alive: KeepAlive, embedding: bool = False) -> Optional[asyncio.Task]:
+        """モデルの読み込みをバックグラウンドで開始する（同じモデルの読み込み中は既存のタスクを返す）"""
+        if not self.enabled:
+            return None
+        key = (client.base_url, model)
+        task = self._tasks.get(key)
+        if task is None or task.done():
+            task = self._tasks[key] = asyncio.ensure_future(self._warm(client, model, keep_alive, embedding))
+        return task
+
+    async def unload(self, client, model: str) -> None:
+        """使われなくなったモデルをアンロードする（keep_alive=0。実行中の生成は完了まで続く）"""
+        try:
+            await client.post_json("/api/generate", {"model": model, "keep_alive": 0}, timeout=30)
+            self.models.pop((client.base_url, model), None)
+            print(f"モデルをアンロードしました: {model} ({client.base_url})")
+        except Exception as e:
+            print(f"モデルのアンロードに失敗: {model} ({client.base_url}): {e}")
+
+    def cancel(self) -> None:
+        """実行中のウォームアップを取り消す（終了時）"""
+        for task in self._tasks.values():
+            task.cancel()
+
+    def stats(self, is_resident: Callable[[str, str], Optional[bool]]) -> Dict[str, Any]:
+        """ウォームアップの状態（is_resident で接続先・モデル名から常駐中かを判定する）"""
+        return {
+            "enabled": self.enabled,
+            "models": [
+                {"base_url": base_url, "model": model, **state, "resident": is_resident(base_url, model)}
+                for (base_url, model), state in self.models.items()
+            ],
+        }
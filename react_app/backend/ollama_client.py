@@ -0,0 +1,108 @@
+"""Ollama API 用の非同期 HTTP クライアント
+
+FastAPI のイベントループをブロックしないよう、すべての Ollama 呼び出しは
+このモジュールの `OllamaClient` を経由する。内部で 1 つの `httpx.AsyncClient`
+を共有し、keep-alive 付きのコネクションプールを再利用する。
+"""
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from response_decoding import loads
+
+# コネクションプール設定（環境変数で変更可能）
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "64"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "16"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.environ.get("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+
+
+class OllamaClient:
+    """接続プールを共有する Ollama API クライアント"""
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = OLLAMA_MAX_CONNECTIONS,
+        max_keepalive_connections: int = OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = OLLAMA_KEEPALIVE_EXPIRY,
+        connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.connect_timeout = connect_timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """共有の AsyncClient を返す（初回アクセス時に生成）"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url, limits=self.limits)
+        return self._client
+
+    def _timeout(self, timeout: float) -> httpx.Timeout:
+        """呼び出し毎のタイムアウトを組み立てる（接続確立は短めに固定）"""
+        return httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+
+    def url(self, path: str) -> str:
+        """Ollama API 用の完全な URL を返す"""
+        return f"{self.base_url}{path}"
+
+    async def get_json(self, path: str, timeout: float = 10) -> Dict[str, Any]:
+        """GET リクエストを送り JSON を返す（/api/tags など）"""
+        response = await self.client.get(path, timeout=self._timeout(timeout))
+        response.raise_for_status()
+        return response.json()
+
+    async def post_json(self, path: str, payload: Dict[str, Any], timeout: float = 60) -> Dict[str, Any]:
+        """POST リクエストを送り JSON を返す"""
+        response = await self.client.post(path, json=payload, timeout=self._timeout(timeout))
+        response.raise_for_status()
+        return response.json()
+
+    async def embed(
+        self, model: str, inputs: List[str], timeout: float = 60, keep_alive: Optional[Any] = None
+    ) -> List[List[float]]:
+        """/api/embed を呼び出し、入力ごとの埋め込みベクトルを返す"""
+        payload: Dict[str, Any] = {"model": model, "input": inputs}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        result = await self.post_json("/api/embed", payload, timeout=timeout)
+        return result["embeddings"]
+
+    async def chat(self, payload: Dict[str, Any], timeout: float = 60) -> Dict[str, Any]:
+        """/api/chat を非ストリーミングで呼び出す"""
+        return await self.post_json("/api/chat", {**payload, "stream": False}, timeout=timeout)
+
+    async def chat_content(self, payload: Dict[str, Any], timeout: float = 60) -> str:
+        """/api/chat を呼び出し、応答メッセージの本文のみを返す"""
+        result = await self.chat(payload, timeout=timeout)
+        return result["message"]["content"]
+
+    async def chat_stream(self, payload: Dict[str, Any], timeout: float = 120) -> AsyncIterator[Dict[str, Any]]:
+        """/api/chat をストリーミングで呼び出し、受信したチャンクを順に返す"""
+        async with self.client.stream(
+            "POST", "/api/chat", json={**payload, "stream": True}, timeout=self._timeout(timeout)
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    yield loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"JSON decode error: {e}")
+                    print(f"デコード済み行: {line}")
+                    continue
+
+    async def aclose(self) -> None:
+        """コネクションプールを閉じる"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
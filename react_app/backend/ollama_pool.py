@@ -0,0 +1,214 @@
+"""複数の Ollama ホストへの負荷分散とヘルスチェック
+
+ホストごとに利用可能なモデル（/api/tags）と読み込み済みのモデル（/api/ps）を定期的に取得し、
+リクエストはモデルを持つ正常なホストのうち、実行中のリクエスト数が最も少ないホストへ送る。
+読み込み済みのホストを優先し（未読み込みのホストには読み込み待ちの分のコストを加える）、
+接続できないホストは切り離して、ヘルスチェックに成功したら戻す。
+モデル一覧（/models）もヘルスチェックで取得した /api/tags の結果から返す。
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, TypeVar
+
+import httpx
+
+from ollama_client import OllamaClient
+
+# ヘルスチェックの間隔（秒、0 で無効）
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "10"))
+# ヘルスチェックがこの回数連続で失敗したホストを切り離す
+OLLAMA_HEALTH_FAILURES = int(os.environ.get("OLLAMA_HEALTH_FAILURES", "2"))
+# モデルが読み込まれていないホストに加えるコスト（実行中リクエスト数に換算）
+OLLAMA_COLD_PENALTY = float(os.environ.get("OLLAMA_COLD_PENALTY", "4"))
+# モデル一覧をそのまま返す期間（秒）。過ぎた一覧も返しつつ裏で取り直す
+OLLAMA_MODELS_TTL = float(os.environ.get("OLLAMA_MODELS_TTL", "30"))
+
+# ホストが停止していると判断する通信エラー
+HOST_DOWN_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+T = TypeVar("T")
+
+
+class OllamaHost:
+    """1 台の Ollama ホストの状態"""
+
+    def __init__(self, client: OllamaClient):
+        self.client = client
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.probe_latency: Optional[float] = None
+        # /api/tags の結果と取得時刻、モデル名（未取得なら None = すべてのモデルを持つとみなす）
+        self.models: List[Dict[str, Any]] = []
+        self.models_at: Optional[float] = None
+        self.available: Optional[Set[str]] = None
+        self.loaded: Set[str] = set()
+        # /api/ps の結果（モデル名・VRAM 使用量・アンロード予定時刻）
+        self.residency: List[Dict[str, Any]] = []
+        self._probe: Optional[asyncio.Task] = None
+
+    @property
+    def base_url(self) -> str:
+        return self.client.base_url
+
+    def refresh(self) -> "asyncio.Future[None]":
+        """ヘルスチェックを開始する（実行中なら同じタスクを返す）"""
+        if self._probe is None or self._probe.done():
+            self._probe = asyncio.ensure_future(probe_host(self))
+        return self._probe
+
+    def has_model(self, model: str) -> bool:
+        return self.available is None or model in self.available
+
+    def mark_down(self, error: Exception) -> None:
+        """接続できなかったホストを切り離す（ヘルスチェックの成功で戻る）"""
+        self.errors += 1
+        self.last_error = str(error) or type(error).__name__
+        if self.healthy:
+            print(f"Ollamaホストを切り離しました: {self.base_url} ({self.last_error})")
+        self.healthy = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "checked_at": self.checked_at,
+            "probe_latency": self.probe_latency,
+            "available_models": sorted(self.available) if self.available is not None else None,
+            "loaded_models": self.residency,
+        }
+
+
+class OllamaHostPool:
+    """複数ホストから 1 台を選んでリクエストを送る"""
+
+    def __init__(self, hosts: List[OllamaHost], cold_penalty: float = OLLAMA_COLD_PENALTY):
+        self.hosts = hosts
+        self.cold_penalty = cold_penalty
+
+    def healthy_hosts(self) -> List[OllamaHost]:
+        """正常なホスト（すべて切り離されている場合は全ホスト）"""
+        return [host for host in self.hosts if host.healthy] or list(self.hosts)
+
+    def hosts_for(self, model: str) -> List[OllamaHost]:
+        """モデルを持つ正常なホスト（なければ正常なホスト）"""
+        healthy = self.healthy_hosts()
+        return [host for host in healthy if host.has_model(model)] or healthy
+
+    def select(self, model: str) -> OllamaHost:
+        """読み込み済みのホストを優先し、実行中のリクエストが最も少ないホストを選ぶ"""
+        return min(
+            self.hosts_for(model),
+            key=lambda host: (
+                host.outstanding + (0 if model in host.loaded else self.cold_penalty),
+                host.requests,
+            ),
+        )
+
+    def capacity(self, model: str) -> int:
+        """モデルを処理できる正常なホストの台数"""
+        return model_capacity(self.hosts, model)
+
+    async def list_models(self, max_age: float = OLLAMA_MODELS_TTL, refresh: bool = False) -> List[Dict[str, Any]]:
+        """正常なホストのモデル一覧（/api/tags）をまとめて返す（同名のモデルは 1 件にまとめる）
+
+        ヘルスチェックで取得済みの一覧を使い、max_age 秒より古ければ古い一覧を返しつつ裏で取り直す。
+        未取得のホストがある場合と refresh=True の場合は取得を待つ。
+        """
+        hosts = self.healthy_hosts()
+        now = time.time()
+        pending = [host for host in hosts if refresh or host.models_at is None]
+        if pending:
+            await asyncio.gather(*(host.refresh() for host in pending))
+        for host in hosts:
+            if host not in pending and now - host.models_at > max_age:
+                host.refresh()
+        models: Dict[str, Dict[str, Any]] = {}
+        for host in hosts:
+            for model in host.models:
+                models.setdefault(model.get("name", ""), model)
+        if not models and all(host.models_at is None for host in hosts):
+            errors = [host.last_error for host in hosts if host.last_error]
+            raise RuntimeError(errors[0] if errors else "Ollamaホストがありません")
+        return list(models.values())
+
+    @asynccontextmanager
+    async def acquire(self, model: str) -> AsyncIterator[OllamaClient]:
+        """ホストを選び、実行中のリクエスト数を数えながらそのクライアントを渡す"""
+        host = self.select(model)
+        host.outstanding += 1
+        host.requests += 1
+        # 同じモデルの後続リクエストも（/api/ps の次回取得を待たず）このホストへ寄せる
+        host.loaded.add(model)
+        try:
+            yield host.client
+        except HOST_DOWN_ERRORS as e:
+            host.mark_down(e)
+            raise
+        finally:
+            host.outstanding -= 1
+
+    async def call(self, model: str, func: Callable[[OllamaClient], Awaitable[T]]) -> T:
+        """ホストに接続できなければ別のホストで再試行する"""
+        for attempt in range(len(self.hosts)):
+            try:
+                async with self.acquire(model) as client:
+                    return await func(client)
+            except HOST_DOWN_ERRORS:
+                if attempt == len(self.hosts) - 1 or not any(host.healthy for host in self.hosts):
+                    raise
+        raise RuntimeError("Ollamaホストがありません")
+
+
+def model_capacity(hosts: Iterable[OllamaHost], model: str) -> int:
+    """モデルを処理できる正常なホストの台数（同じホストは 1 台と数える）"""
+    return max(1, len({host.base_url for host in hosts if host.healthy and host.has_model(model)}))
+
+
+async def probe_host(host: OllamaHost, max_failures: int = OLLAMA_HEALTH_FAILURES) -> None:
+    """/api/tags と /api/ps でホストの状態と保有・読み込み済みモデルを更新する"""
+    started_at = time.perf_counter()
+    try:
+        tags, ps = await asyncio.gather(host.client.get_json("/api/tags", timeout=5), host.client.get_json("/api/ps", timeout=5))
+    except Exception as e:
+        host.failures += 1
+        host.last_error = str(e) or type(e).__name__
+        if host.failures >= max_failures and host.healthy:
+            print(f"Ollamaホストを切り離しました: {host.base_url} ({host.last_error})")
+            host.healthy = False
+    else:
+        if not host.healthy:
+            print(f"Ollamaホストが復帰しました: {host.base_url}")
+        host.healthy = True
+        host.failures = 0
+        host.models = tags.get("models", [])
+        host.models_at = time.time()
+        host.available = {model.get("name", "") for model in host.models}
+        host.residency = [
+            {"name": model.get("name"), "size_vram": model.get("size_vram"), "expires_at": model.get("expires_at")}
+            for model in ps.get("models", [])
+        ]
+        host.loaded = {model["name"] for model in host.residency}
+        host.probe_latency = round(time.perf_counter() - started_at, 3)
+    host.checked_at = time.time()
+
+
+async def probe_hosts(hosts: Iterable[OllamaHost]) -> None:
+    await asyncio.gather(*(host.refresh() for host in hosts))
+
+
+async def monitor_hosts(get_hosts: Callable[[], Iterable[OllamaHost]], interval: float = OLLAMA_HEALTH_INTERVAL) -> None:
+    """ホストの状態を定期的に取得する（lifespan で起動し、終了時にキャンセルする）"""
+    while True:
+        await probe_hosts(get_hosts())
+        await asyncio.sleep(interval)
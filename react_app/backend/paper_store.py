@@ -0,0 +1,207 @@
+"""取得済み論文のメタデータストア（SQLite FTS5 の全文検索インデックス付き）
+
+Semantic Scholar から取得した論文をすべて保存し、タイトル・アブストラクト・著者・
+分野・掲載先の転置インデックスで検索できるようにする。よく使われるクエリをローカルで
+即座に返したり、上流 API が混雑している間も検索を続けたりするために使う。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+PAPER_STORE_ENABLED = os.environ.get("PAPER_STORE_ENABLED", "1") != "0"
+PAPER_STORE_PATH = os.environ.get(
+    "PAPER_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "papers.sqlite3")
+)
+
+# bm25 の列ごとの重み（paper_id, title, abstract, authors, fields_of_study, venue）
+BM25_WEIGHTS = (0.0, 10.0, 1.0, 2.0, 2.0, 1.0)
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class PaperStore:
+    """論文メタデータの保存と全文検索"""
+
+    def __init__(self, path: str = PAPER_STORE_PATH, enabled: bool = PAPER_STORE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self.searches = 0
+        self.upserts = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """SQLite 接続を返す（初回アクセス時にテーブルを作成）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS papers (
+                    paper_id TEXT PRIMARY KEY,
+                    title TEXT,
+                    abstract TEXT,
+                    authors TEXT,
+                    year INTEGER,
+                    venue TEXT,
+                    citation_count INTEGER,
+                    fields_of_study TEXT,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_papers_year ON papers(year)")
+            conn.execute(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+                    paper_id UNINDEXED, title, abstract, authors, fields_of_study, venue,
+                    tokenize = 'porter unicode61 remove_diacritics 2'
+                )"""
+            )
+            # hybrid 検索でクエリごとに最後に Semantic Scholar へ問い合わせた時刻
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS query_refreshes (
+                    key TEXT PRIMARY KEY,
+                    refreshed_at REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def upsert_many(self, papers: Iterable[Dict[str, Any]]) -> int:
+        """論文をまとめて保存（既存の論文は最新の内容で上書き）し、保存件数を返す"""
+        if not self.enabled:
+            return 0
+        now = time.time()
+        rows = []
+        for paper in papers:
+            paper_id = paper.get("paperId")
+            if not paper_id:
+                continue
+            authors = " ".join(author.get("name") or "" for author in paper.get("authors") or [])
+            fields_of_study = " ".join(paper.get("fieldsOfStudy") or [])
+            rows.append((
+                paper_id,
+                paper.get("title") or "",
+                paper.get("abstract") or "",
+                authors,
+                paper.get("year"),
+                paper.get("venue") or "",
+                paper.get("citationCount"),
+                fields_of_study,
+                json.dumps(paper, ensure_ascii=False),
+                now,
+            ))
+        if not rows:
+            return 0
+        with self._lock:
+            self.conn.executemany(
+                """INSERT OR REPLACE INTO papers
+                    (paper_id, title, abstract, authors, year, venue, citation_count, fields_of_study, data, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            self.conn.executemany("DELETE FROM papers_fts WHERE paper_id = ?", [(row[0],) for row in rows])
+            self.conn.executemany(
+                "INSERT INTO papers_fts (paper_id, title, abstract, authors, fields_of_study, venue) VALUES (?, ?, ?, ?, ?, ?)",
+                [(row[0], row[1], row[2], row[3], row[7], row[5]) for row in rows],
+            )
+            self.conn.commit()
+        self.upserts += len(rows)
+        return len(rows)
+
+    @staticmethod
+    def to_match_query(query: str, match_all: bool = False) -> Optional[str]:
+        """検索語を FTS5 の MATCH 式に変換する（match_all=True ならすべての語を含む論文のみ）"""
+        tokens = _TOKEN_PATTERN.findall(query.lower())
+        if not tokens:
+            return None
+        return (" AND " if match_all else " OR ").join(f'"{token}"' for token in dict.fromkeys(tokens))
+
+    def search(
+        self, query: str, year_from: Optional[int] = None, year_to: Optional[int] = None, limit: int = 10, offset: int = 0,
+        match_all: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """全文検索を行い、bm25 の関連度順に論文を返す"""
+        match = self.to_match_query(query, match_all)
+        if not self.enabled or match is None:
+            return []
+        sql = """SELECT papers.data FROM papers_fts
+            JOIN papers ON papers.paper_id = papers_fts.paper_id
+            WHERE papers_fts MATCH ?"""
+        params: List[Any] = [match]
+        if year_from is not None:
+            sql += " AND papers.year >= ?"
+            params.append(year_from)
+        if year_to is not None:
+            sql += " AND papers.year <= ?"
+            params.append(year_to)
+        sql += f" ORDER BY bm25(papers_fts, {', '.join(map(str, BM25_WEIGHTS))}) LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        self.searches += 1
+        return [json.loads(row[0]) for row in rows]
+
+    @staticmethod
+    def query_key(query: str, year_from: Optional[int] = None, year_to: Optional[int] = None) -> str:
+        tokens = _TOKEN_PATTERN.findall(query.lower())
+        return json.dumps([" ".join(tokens), year_from, year_to])
+
+    def mark_query_refreshed(self, query: str, year_from: Optional[int] = None, year_to: Optional[int] = None) -> None:
+        """クエリの結果を上流から取得したことを記録する"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO query_refreshes (key, refreshed_at) VALUES (?, ?)",
+                (self.query_key(query, year_from, year_to), time.time()),
+            )
+            self.conn.commit()
+
+    def query_age(self, query: str, year_from: Optional[int] = None, year_to: Optional[int] = None) -> Optional[float]:
+        """クエリの結果を最後に上流から取得してからの経過秒数（未取得なら None）"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT refreshed_at FROM query_refreshes WHERE key = ?", (self.query_key(query, year_from, year_to),)
+            ).fetchone()
+        return time.time() - row[0] if row else None
+
+    def get(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        """paperId で論文を取得する"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM papers WHERE paper_id = ?", (paper_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, paper_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """paperId の一覧から論文をまとめて取得する（未登録の paperId は含まない）"""
+        paper_ids = list(dict.fromkeys(paper_ids))
+        if not self.enabled or not paper_ids:
+            return {}
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT paper_id, data FROM papers WHERE paper_id IN ({','.join('?' * len(paper_ids))})", paper_ids
+            ).fetchall()
+        return {paper_id: json.loads(data) for paper_id, data in rows}
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "papers": count,
+            "upserts": self.upserts,
+            "searches": self.searches,
+        }
@@ -0,0 +1,280 @@
+"""PDF のストリーミングダウンロードとディスクキャッシュ
+
+PDF はメモリに溜めずにチャンク単位で一時ファイルへ書き出し、内容の SHA-256 をファイル名にして
+保存する（同じ内容の PDF は URL が違っても 1 つのファイルを共有する）。URL ごとに ETag /
+Last-Modified を記録し、TTL 内はネットワークに出ずにそのまま返し、TTL を過ぎたら条件付き GET で
+再検証する。テキスト抽出ではファイルをメモリマップで読み込む。
+"""
+import asyncio
+import hashlib
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from singleflight import SingleFlight
+
+PDF_CACHE_DIR = os.environ.get(
+    "PDF_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "pdfs")
+)
+# 1 ファイルあたりの上限（超える PDF はダウンロードを中断する）
+PDF_MAX_BYTES = int(os.environ.get("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+# キャッシュ全体の上限（超えたら最終アクセスが古い順に削除）
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# 再検証せずにキャッシュを使う期間（秒）
+PDF_CACHE_TTL = float(os.environ.get("PDF_CACHE_TTL", str(24 * 3600)))
+PDF_DOWNLOAD_TIMEOUT = float(os.environ.get("PDF_DOWNLOAD_TIMEOUT", "60"))
+# 直近にアクセスされた PDF は削除しない期間（秒）。処理中のリクエストが使うファイルを残す
+PDF_CACHE_EVICT_GRACE = float(os.environ.get("PDF_CACHE_EVICT_GRACE", "300"))
+
+# キャッシュの状態（X-PDF-Cache ヘッダーの値）
+PDF_CACHE_HIT = "HIT"
+PDF_CACHE_REVALIDATED = "REVALIDATED"
+PDF_CACHE_MISS = "MISS"
+
+_CHUNK_SIZE = 64 * 1024
+# PDF かどうかを判定するまでに読む最大バイト数
+_SNIFF_BYTES = 1024
+
+
+@dataclass
+class PdfEntry:
+    """キャッシュ済みの PDF"""
+    url: str
+    sha256: str
+    size: int
+    path: str
+    status: str
+
+
+class PdfCache:
+    """URL → 内容ハッシュの索引と、内容ハッシュをファイル名にした PDF の保存先"""
+
+    def __init__(
+        self,
+        directory: str = PDF_CACHE_DIR,
+        max_bytes: int = PDF_MAX_BYTES,
+        cache_max_bytes: int = PDF_CACHE_MAX_BYTES,
+        ttl: float = PDF_CACHE_TTL,
+        timeout: float = PDF_DOWNLOAD_TIMEOUT,
+        evict_grace: float = PDF_CACHE_EVICT_GRACE,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.ttl = ttl
+        self.timeout = timeout
+        self.evict_grace = evict_grace
+        self.counts = {PDF_CACHE_HIT: 0, PDF_CACHE_REVALIDATED: 0, PDF_CACHE_MISS: 0, "downloaded_bytes": 0, "evicted": 0}
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """SQLite 接続を返す（初回アクセス時にテーブルを作成）"""
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS pdfs (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_pdfs_sha256 ON pdfs(sha256)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], f"{sha256}.pdf")
+
+    def _lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT sha256, size, etag, last_modified, fetched_at FROM pdfs WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[0])):
+            return None
+        return {"sha256": row[0], "size": row[1], "etag": row[2], "last_modified": row[3], "fetched_at": row[4]}
+
+    def _touch(self, url: str, fetched: bool = False) -> None:
+        now = time.time()
+        with self._lock:
+            if fetched:
+                self.conn.execute("UPDATE pdfs SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+            else:
+                self.conn.execute("UPDATE pdfs SET accessed_at = ? WHERE url = ?", (now, url))
+            self.conn.commit()
+
+    async def fetch(self, client: httpx.AsyncClient, url: str) -> PdfEntry:
+        """PDF をキャッシュから返す（なければダウンロード、TTL 切れなら再検証）"""
+        cached = self._lookup(url)
+        if cached is not None and time.time() - cached["fetched_at"] < self.ttl:
+            # アクセス時刻を更新してから存在を確かめる（更新後は evict の対象外になる）
+            self._touch(url)
+            if not os.path.exists(self.blob_path(cached["sha256"])):
+                return await self._flights.do(url, lambda: self._download(client, url, None))
+            self.counts[PDF_CACHE_HIT] += 1
+            return PdfEntry(url, cached["sha256"], cached["size"], self.blob_path(cached["sha256"]), PDF_CACHE_HIT)
+        # 同じ URL のダウンロードは 1 回にまとめる
+        return await self._flights.do(url, lambda: self._download(client, url, cached))
+
+    async def _download(self, client: httpx.AsyncClient, url: str, cached: Optional[Dict[str, Any]]) -> PdfEntry:
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            async with client.stream("GET", url, headers=headers, timeout=self.timeout) as response:
+                if response.status_code == 304 and cached is not None:
+                    self._touch(url, fetched=True)
+                    self.counts[PDF_CACHE_REVALIDATED] += 1
+                    return PdfEntry(url, cached["sha256"], cached["size"], self.blob_path(cached["sha256"]), PDF_CACHE_REVALIDATED)
+                response.raise_for_status()
+                content_length = response.headers.get("Content-Length")
+                if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                    raise self._too_large()
+                sha256, size = await self._save(response)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(status_code=502, detail=f"PDFのダウンロードに失敗しました: {e.response.status_code}")
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"PDFのダウンロードに失敗しました: {str(e) or type(e).__name__}")
+
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO pdfs (url, sha256, size, etag, last_modified, fetched_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (url, sha256, size, etag, last_modified, now, now),
+            )
+            self.conn.commit()
+        if cached is not None and cached["sha256"] != sha256:
+            # 内容が変わった場合、どの URL からも参照されなくなった古いファイルを削除する
+            self._remove_unreferenced(cached["sha256"])
+        self.counts[PDF_CACHE_MISS] += 1
+        self.counts["downloaded_bytes"] += size
+        await asyncio.to_thread(self.evict, sha256)
+        return PdfEntry(url, sha256, size, self.blob_path(sha256), PDF_CACHE_MISS)
+
+    async def _save(self, response: httpx.Response):
+        """レスポンスを一時ファイルへ書き出しながらハッシュを計算し、内容ハッシュのパスへ移す"""
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        # 先頭の空白を除いて %PDF で始まるかを確かめる（最初のチャンクが空・空白だけの場合もあるため溜めて判定する）
+        head = b""
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                    if head is not None:
+                        head += chunk
+                        if len(head.lstrip()) >= 5 or len(head) >= _SNIFF_BYTES:
+                            _check_pdf_header(head)
+                            head = None
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise self._too_large()
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            if size == 0 or (head is not None and not head.strip()):
+                raise HTTPException(status_code=422, detail="PDFが空です")
+            if head is not None:
+                _check_pdf_header(head)
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            return sha256, size
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"PDFのサイズが上限（{self.max_bytes // (1024 * 1024)}MB）を超えています")
+
+    def _remove_unreferenced(self, sha256: str) -> None:
+        with self._lock:
+            referenced = self.conn.execute("SELECT 1 FROM pdfs WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone()
+        if referenced is None:
+            try:
+                os.remove(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """キャッシュ全体が上限を超えていれば、最終アクセスが古い PDF から削除する
+
+        keep のハッシュと、evict_grace 秒以内にアクセスされた（他のリクエストが処理中の可能性がある）PDF は残す。
+        """
+        recent = time.time() - self.evict_grace
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT sha256, MAX(size), MAX(accessed_at) FROM pdfs GROUP BY sha256 ORDER BY MAX(accessed_at)"
+            ).fetchall()
+            total = sum(row[1] for row in rows)
+            removed = 0
+            for sha256, size, accessed_at in rows:
+                if total <= self.cache_max_bytes:
+                    break
+                if sha256 == keep or accessed_at >= recent:
+                    continue
+                self.conn.execute("DELETE FROM pdfs WHERE sha256 = ?", (sha256,))
+                try:
+                    # 読み込み中のファイルは削除後もメモリマップが有効なまま残る
+                    os.remove(self.blob_path(sha256))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self.conn.commit()
+        self.counts["evicted"] += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            files, total = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM pdfs GROUP BY sha256)"
+            ).fetchone()
+            urls = self.conn.execute("SELECT COUNT(*) FROM pdfs").fetchone()[0]
+        return {
+            "directory": self.directory,
+            "urls": urls,
+            "files": files,
+            "bytes": total,
+            "max_bytes": self.cache_max_bytes,
+            **self.counts,
+        }
+
+
+def _check_pdf_header(head: bytes) -> None:
+    if not head.lstrip().startswith(b"%PDF"):
+        raise HTTPException(status_code=422, detail="URLの内容がPDFではありません")
+
+
+@contextmanager
+def open_pdf_mmap(path: str) -> Iterator[mmap.mmap]:
+    """PDF ファイルを読み取り専用のメモリマップとして開く"""
+    with open(path, "rb") as pdf_file:
+        with mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
@@ -0,0 +1,173 @@
+"""PDF のテキスト抽出をプロセスプールでページ並列に行う
+
+PyPDF2 のテキスト抽出は CPU 処理で GIL を解放しないため、ページ範囲に分けて別プロセスで実行する。
+各範囲にはページ数に応じて文書ごとの CPU 時間の上限を割り当て、上限を超えたページは
+空のテキストとして打ち切る（結果の truncated で分かる）。ページごとの処理時間も返す。
+ページ範囲は先頭から順に受け取れるため、抽出済みのページから順に送信・保存できる（iter_page_batches）。
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import PyPDF2
+
+from pdf_cache import open_pdf_mmap
+
+# ワーカープロセス数（0 でプロセスプールを使わずスレッドで順に抽出する）
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 1 ワーカーに割り当てる最小ページ数（これより少ない文書は分割しない）
+PDF_EXTRACT_MIN_PAGES = int(os.environ.get("PDF_EXTRACT_MIN_PAGES", "4"))
+# 1 文書あたりの CPU 時間の上限（秒）
+PDF_EXTRACT_CPU_BUDGET = float(os.environ.get("PDF_EXTRACT_CPU_BUDGET", "60"))
+
+
+class CpuBudgetExceeded(Exception):
+    """ページの抽出が CPU 時間の上限を超えた"""
+
+
+def _raise_budget_exceeded(signum, frame):
+    raise CpuBudgetExceeded()
+
+
+def count_pages(path: str) -> int:
+    with open_pdf_mmap(path) as pdf_data:
+        return len(PyPDF2.PdfReader(pdf_data).pages)
+
+
+def extract_page_range(path: str, start: int, end: int, cpu_budget: float) -> List[Dict[str, Any]]:
+    """start〜end-1 ページのテキストと処理時間を返す（ワーカープロセスで実行する）"""
+    # CPU 時間のタイマー（SIGPROF）はメインスレッドでのみ使える。使えない場合はページの間で判定する
+    use_timer = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+    previous_handler = signal.signal(signal.SIGPROF, _raise_budget_exceeded) if use_timer else None
+    cpu_started_at = time.process_time()
+    pages = []
+    try:
+        with open_pdf_mmap(path) as pdf_data:
+            pdf_reader = PyPDF2.PdfReader(pdf_data)
+            for index in range(start, end):
+                remaining = cpu_budget - (time.process_time() - cpu_started_at)
+                page = {"page": index + 1, "chars": 0, "seconds": 0.0, "cpu_seconds": 0.0, "timed_out": remaining <= 0, "text": ""}
+                if remaining > 0:
+                    page_started_at = time.perf_counter()
+                    page_cpu_started_at = time.process_time()
+                    if use_timer:
+                        signal.setitimer(signal.ITIMER_PROF, remaining)
+                    try:
+                        page["text"] = pdf_reader.pages[index].extract_text() or ""
+                    except CpuBudgetExceeded:
+                        page["timed_out"] = True
+                    finally:
+                        if use_timer:
+                            signal.setitimer(signal.ITIMER_PROF, 0)
+                    page["chars"] = len(page["text"])
+                    page["seconds"] = round(time.perf_counter() - page_started_at, 4)
+                    page["cpu_seconds"] = round(time.process_time() - page_cpu_started_at, 4)
+                pages.append(page)
+    finally:
+        if use_timer:
+            signal.signal(signal.SIGPROF, previous_handler)
+    return pages
+
+
+class PdfExtractor:
+    """PDF のページ範囲をプロセスプールに振り分けてテキストを抽出する"""
+
+    def __init__(
+        self,
+        workers: int = PDF_EXTRACT_WORKERS,
+        min_pages: int = PDF_EXTRACT_MIN_PAGES,
+        cpu_budget: float = PDF_EXTRACT_CPU_BUDGET,
+    ):
+        self.workers = workers
+        self.min_pages = max(1, min_pages)
+        self.cpu_budget = cpu_budget
+        self.counts = {"documents": 0, "pages": 0, "truncated": 0, "seconds": 0.0, "cpu_seconds": 0.0}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> Optional[ProcessPoolExecutor]:
+        """プロセスプールを返す（初回に作成。イベントループのスレッドを複製しないよう spawn で起動する）"""
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def page_ranges(self, page_count: int, batch_pages: Optional[int] = None) -> List[Tuple[int, int]]:
+        """ページを連続した範囲に分ける（既定はワーカー数以下、batch_pages 指定時はそのページ数ずつ）"""
+        if batch_pages:
+            chunks = max(1, -(-page_count // batch_pages))
+        else:
+            chunks = max(1, min(self.workers, page_count // self.min_pages))
+        size, extra = divmod(page_count, chunks)
+        ranges = []
+        start = 0
+        for chunk in range(chunks):
+            end = start + size + (1 if chunk < extra else 0)
+            ranges.append((start, end))
+            start = end
+        return ranges
+
+    async def _run(self, func, *args):
+        executor = self.executor
+        if executor is None:
+            return await asyncio.to_thread(func, *args)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # ワーカーが異常終了した場合は次回プールを作り直す
+            self._executor = None
+            raise
+
+    async def count_pages(self, path: str) -> int:
+        return await self._run(count_pages, path)
+
+    async def iter_page_batches(
+        self, path: str, page_count: int, batch_pages: Optional[int] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """ページ範囲をすべてプールへ投入し、先頭の範囲から順に抽出結果（ページごとの text を含む）を返す"""
+        started_at = time.perf_counter()
+        tasks = [
+            asyncio.ensure_future(self._run(extract_page_range, path, start, end, self.cpu_budget * (end - start) / max(1, page_count)))
+            for start, end in self.page_ranges(page_count, batch_pages)
+        ]
+        pages = 0
+        cpu_seconds = 0.0
+        truncated = False
+        try:
+            for task in tasks:
+                batch = await task
+                pages += len(batch)
+                cpu_seconds += sum(page["cpu_seconds"] for page in batch)
+                truncated = truncated or any(page["timed_out"] for page in batch)
+                yield batch
+        finally:
+            # クライアント切断時は未着手の範囲を取り消す
+            for task in tasks:
+                task.cancel()
+        self.counts["documents"] += 1
+        self.counts["pages"] += pages
+        self.counts["truncated"] += int(truncated)
+        self.counts["seconds"] = round(self.counts["seconds"] + time.perf_counter() - started_at, 4)
+        self.counts["cpu_seconds"] = round(self.counts["cpu_seconds"] + cpu_seconds, 4)
+        if truncated:
+            print(f"PDFの抽出がCPU時間の上限（{self.cpu_budget}秒）を超えたため一部のページを打ち切りました: {path}")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "min_pages": self.min_pages,
+            "cpu_budget": self.cpu_budget,
+            **self.counts,
+        }
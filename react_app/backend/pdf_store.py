@@ -0,0 +1,368 @@
+"""処理済み PDF の本文ストア（ページ・セクション・段落の位置つき）
+
+抽出した本文をページ単位で保存し、文書全体での文字位置としてページの開始位置・セクション見出しの
+位置・段落の開始位置を記録する。文書は PDF の内容ハッシュで保存し、paperId と URL からも引けるようにする。
+同じ PDF を再度開いたときやセクション単位の参照・要約では、必要な範囲のページだけを読み出す。
+文字位置はページ本文を改行でつないだ文字列（前後の空白を除く前）での位置。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PDF_STORE_ENABLED = os.environ.get("PDF_STORE_ENABLED", "1") != "0"
+PDF_STORE_PATH = os.environ.get(
+    "PDF_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "pdf_documents.sqlite3")
+)
+
+SECTION_PREFIXES = ('Abstract', 'Introduction', 'Method', 'Results', 'Conclusion', 'References')
+# 段落末とみなす文末記号
+_SENTENCE_ENDINGS = ('.', '!', '?', '。', '．', '！', '？', ':')
+
+
+def is_section_heading(line: str) -> bool:
+    """セクション見出しの行か（大文字のみ、または代表的な見出しで始まる短い行）"""
+    line = line.strip()
+    return bool(line) and len(line) < 50 and (line.isupper() or line.startswith(SECTION_PREFIXES))
+
+
+def _pack(values: List[int]) -> bytes:
+    return array("i", values).tobytes()
+
+
+def _unpack(data: bytes) -> List[int]:
+    values = array("i")
+    values.frombytes(data)
+    return values.tolist()
+
+
+@dataclass
+class PdfDocument:
+    """保存済みの PDF 本文の構造（本文そのものはページごとに別に保存する）"""
+    sha256: str
+    chars: int
+    metadata: Dict[str, Any]
+    page_offsets: List[int]
+    paragraph_offsets: List[int]
+    # [見出し, ページ番号, 開始位置]
+    sections: List[List[Any]]
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_offsets)
+
+    def page_span(self, page: int) -> Tuple[int, int]:
+        """ページ（1 始まり）の文字範囲"""
+        end = self.page_offsets[page] - 1 if page < len(self.page_offsets) else self.chars
+        return self.page_offsets[page - 1], end
+
+    def page_of(self, offset: int) -> int:
+        """文字位置を含むページ番号"""
+        return max(1, bisect_right(self.page_offsets, offset))
+
+    def section_spans(self) -> List[Dict[str, Any]]:
+        """セクションごとの見出し・ページ・文字範囲（次の見出しの直前まで）"""
+        spans = []
+        for index, (heading, page, start) in enumerate(self.sections):
+            end = self.sections[index + 1][2] if index + 1 < len(self.sections) else self.chars
+            spans.append({"index": index, "heading": heading, "page": page, "start": start, "end": end})
+        return spans
+
+    def paragraph_spans(self) -> List[Tuple[int, int]]:
+        starts = self.paragraph_offsets
+        return [(start, starts[index + 1] if index + 1 < len(starts) else self.chars) for index, start in enumerate(starts)]
+
+    def chunk_spans(self, max_chars: int, skip_sections: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+        """セクションごとに、段落の境界で max_chars 文字以下の範囲に分ける（skip_sections で始まる見出しのセクションは除く）"""
+        sections = self.section_spans()
+        if not sections or sections[0]["start"] > 0:
+            # 最初の見出しより前（タイトル・著者など）も含める
+            sections.insert(0, {"heading": None, "start": 0, "end": sections[0]["start"] if sections else self.chars})
+        skip = tuple(heading.lower() for heading in skip_sections)
+        chunks = []
+        for section in sections:
+            if skip and section["heading"] and section["heading"].lower().startswith(skip):
+                continue
+            start = section["start"]
+            while start < section["end"]:
+                end = min(section["end"], start + max_chars)
+                if end < section["end"]:
+                    # 上限以内で最後の段落の境界で区切る（段落が上限より長ければ上限で区切る）
+                    index = bisect_right(self.paragraph_offsets, end) - 1
+                    if index >= 0 and self.paragraph_offsets[index] > start:
+                        end = self.paragraph_offsets[index]
+                chunks.append({"heading": section["heading"], "start": start, "end": end})
+                start = end
+        return chunks
+
+    def outline(self) -> Dict[str, Any]:
+        return {
+            "sha256": self.sha256,
+            "pages": self.page_count,
+            "chars": self.chars,
+            "paragraphs": len(self.paragraph_offsets),
+            "metadata": self.metadata,
+            "sections": [
+                {**span, "chars": span["end"] - span["start"]} for span in self.section_spans()
+            ],
+        }
+
+
+class PdfDocumentWriter:
+    """抽出したページを順に保存しながら、ページ・セクション・段落の位置とタイトルを記録する"""
+
+    def __init__(self, store: "PdfStore", sha256: str):
+        self.store = store
+        self.sha256 = sha256
+        self.chars = 0
+        self.page_offsets: List[int] = []
+        self.paragraph_offsets: List[int] = []
+        self.sections: List[List[Any]] = []
+        self.title = ""
+        self.text_chars = 0
+        # 最初の非空行からの行数（タイトルは先頭10行から探す）
+        self._line_count = 0
+        self._in_paragraph = False
+        # これまでで最も長い行の長さ（これより十分短く文末記号で終わる行を段落末とみなす）
+        self._line_width = 0
+        self._pending: List[Tuple[str, int, str]] = []
+
+    def add_page(self, page: int, text: str) -> List[List[Any]]:
+        """ページを追加し、新たに見つかったセクション [見出し, ページ番号, 開始位置] を返す（本文は flush で保存）"""
+        if self.page_offsets:
+            self.chars += 1  # ページ間の改行
+        self.page_offsets.append(self.chars)
+        self.text_chars += len(text.strip())
+        found = []
+        position = self.chars
+        for line in text.split("\n"):
+            stripped = line.strip()
+            line_start = position
+            position += len(line) + 1
+            if not stripped:
+                self._in_paragraph = False
+                continue
+            if not self.title and self._line_count < 10 and len(stripped) > 10:
+                self.title = stripped
+            self._line_count += 1
+            self._line_width = max(self._line_width, len(stripped))
+            if is_section_heading(stripped):
+                section = [stripped, page, line_start]
+                self.sections.append(section)
+                found.append(section)
+                self.paragraph_offsets.append(line_start)
+                self._in_paragraph = False
+                continue
+            if not self._in_paragraph:
+                self.paragraph_offsets.append(line_start)
+                self._in_paragraph = True
+            if stripped.endswith(_SENTENCE_ENDINGS) and len(stripped) < self._line_width * 0.7:
+                self._in_paragraph = False
+        self.chars += len(text)
+        self._pending.append((self.sha256, page, text))
+        return found
+
+    def flush(self) -> None:
+        """追加済みのページ本文を保存する"""
+        if self._pending:
+            self.store.save_pages(self._pending)
+            self._pending = []
+
+    def finish(self, metadata: Dict[str, Any], paper_id: Optional[str] = None, url: Optional[str] = None) -> PdfDocument:
+        """文書の構造を保存する（途中で打ち切られた場合は呼ばない）"""
+        self.flush()
+        document = PdfDocument(
+            sha256=self.sha256,
+            chars=self.chars,
+            metadata=metadata,
+            page_offsets=self.page_offsets,
+            paragraph_offsets=self.paragraph_offsets,
+            sections=self.sections,
+        )
+        self.store.save_document(document)
+        self.store.add_keys(self.sha256, paper_id=paper_id, url=url)
+        return document
+
+
+class PdfStore:
+    """処理済み PDF の本文と構造の保存"""
+
+    def __init__(self, path: str = PDF_STORE_PATH, enabled: bool = PDF_STORE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.slices = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """SQLite 接続を返す（初回アクセス時にテーブルを作成）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS pdf_documents (
+                    sha256 TEXT PRIMARY KEY,
+                    chars INTEGER NOT NULL,
+                    metadata TEXT NOT NULL,
+                    page_offsets BLOB NOT NULL,
+                    paragraph_offsets BLOB NOT NULL,
+                    sections TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS pdf_pages (
+                    sha256 TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    PRIMARY KEY (sha256, page)
+                ) WITHOUT ROWID"""
+            )
+            # "paper:<paperId>" / "url:<URL>" → 内容ハッシュ
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS pdf_keys (
+                    key TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def writer(self, sha256: str) -> PdfDocumentWriter:
+        return PdfDocumentWriter(self, sha256)
+
+    def save_pages(self, rows: List[Tuple[str, int, str]]) -> None:
+        """(内容ハッシュ, ページ番号, 本文) をまとめて保存する"""
+        if not self.enabled:
+            return
+        with self._lock:
+            # 同じ内容の PDF は同じ本文になるため、同時に処理されても上書きでよい
+            self.conn.executemany("INSERT OR REPLACE INTO pdf_pages (sha256, page, text) VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+
+    def save_document(self, document: PdfDocument) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO pdf_documents
+                    (sha256, chars, metadata, page_offsets, paragraph_offsets, sections, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    document.sha256,
+                    document.chars,
+                    json.dumps(document.metadata, ensure_ascii=False),
+                    _pack(document.page_offsets),
+                    _pack(document.paragraph_offsets),
+                    json.dumps(document.sections, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+            self.conn.commit()
+
+    def add_keys(self, sha256: str, paper_id: Optional[str] = None, url: Optional[str] = None) -> None:
+        """paperId・URL から文書を引けるようにする"""
+        keys = [key for key in (f"paper:{paper_id}" if paper_id else None, f"url:{url}" if url else None) if key]
+        if not self.enabled or not keys:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pdf_keys (key, sha256, updated_at) VALUES (?, ?, ?)",
+                [(key, sha256, now) for key in keys],
+            )
+            self.conn.commit()
+
+    def get(self, sha256: str) -> Optional[PdfDocument]:
+        """内容ハッシュで文書の構造を取得する（本文は読み込まない）"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                """SELECT chars, metadata, page_offsets, paragraph_offsets, sections
+                    FROM pdf_documents WHERE sha256 = ?""",
+                (sha256,),
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return PdfDocument(
+            sha256=sha256,
+            chars=row[0],
+            metadata=json.loads(row[1]),
+            page_offsets=_unpack(row[2]),
+            paragraph_offsets=_unpack(row[3]),
+            sections=json.loads(row[4]),
+        )
+
+    def find(self, paper_id: Optional[str] = None, url: Optional[str] = None) -> Optional[PdfDocument]:
+        """paperId（優先）または URL で文書の構造を取得する"""
+        if not self.enabled:
+            return None
+        for key in (f"paper:{paper_id}" if paper_id else None, f"url:{url}" if url else None):
+            if key is None:
+                continue
+            with self._lock:
+                row = self.conn.execute("SELECT sha256 FROM pdf_keys WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                return self.get(row[0])
+        return None
+
+    def iter_pages(self, document: PdfDocument, first: int = 1, last: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """first〜last ページの本文を順に返す"""
+        last = document.page_count if last is None else last
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT page, text FROM pdf_pages WHERE sha256 = ? AND page BETWEEN ? AND ? ORDER BY page",
+                (document.sha256, first, last),
+            ).fetchall()
+        yield from rows
+
+    def read(self, document: PdfDocument, start: int = 0, end: Optional[int] = None) -> str:
+        """文字範囲の本文を、範囲を含むページだけ読み出して返す"""
+        end = document.chars if end is None else min(end, document.chars)
+        if start >= end:
+            return ""
+        first, last = document.page_of(start), document.page_of(end - 1)
+        text = "\n".join(page_text for _, page_text in self.iter_pages(document, first, last))
+        base = document.page_offsets[first - 1]
+        self.slices += 1
+        return text[start - base:end - base]
+
+    def text(self, document: PdfDocument) -> str:
+        """文書全体の本文（前後の空白を除く）"""
+        return self.read(document).strip()
+
+    def section_text(self, document: PdfDocument, index: int) -> str:
+        span = document.section_spans()[index]
+        return self.read(document, span["start"], span["end"]).strip()
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            documents = self.conn.execute("SELECT COUNT(*) FROM pdf_documents").fetchone()[0]
+            pages = self.conn.execute("SELECT COUNT(*) FROM pdf_pages").fetchone()[0]
+            keys = self.conn.execute("SELECT COUNT(*) FROM pdf_keys").fetchone()[0]
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "documents": documents,
+            "pages": pages,
+            "keys": keys,
+            "hits": self.hits,
+            "misses": self.misses,
+            "slices": self.slices,
+        }
@@ -0,0 +1,131 @@
+"""外部 API 呼び出し用のトークンバケット型レートリミッタ
+
+トークンバケットを GCRA（理論到着時刻）方式で実装し、呼び出し毎に「送信してよい時刻」を
+予約する。待機者はポーリングせずに予約時刻まで眠るだけなので、許容量いっぱいまで
+等間隔に送信できる。state_path を指定すると状態をファイルに置き、ファイルロックで
+同一ホスト上の複数ワーカープロセス間でも上限を共有する。
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間共有を行わない
+    fcntl = None
+
+
+class TokenBucket:
+    """rate 件/秒、最大 burst 件まで連続送信できるレートリミッタ"""
+
+    def __init__(self, rate: float, burst: int = 1, state_path: Optional[str] = None):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.state_path = state_path if fcntl is not None else None
+        self._state = {"tat": 0.0, "blocked_until": 0.0}
+        self._lock = threading.Lock()
+        self.total_wait = 0.0
+        self.acquired = 0
+        self.penalties = 0
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / self.rate
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, float]]:
+        """状態を排他的に読み書きする（ファイル共有時はプロセス間でロック）"""
+        with self._lock:
+            if self.state_path is None:
+                yield self._state
+                return
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            with open(self.state_path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    state = json.loads(raw) if raw else {"tat": 0.0, "blocked_until": 0.0}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def reserve(self) -> float:
+        """1 件分の送信枠を予約し、送信可能になるまでの待ち秒数を返す"""
+        now = time.time()
+        with self._locked_state() as state:
+            tolerance = (self.burst - 1) * self.interval
+            scheduled = max(now, state["tat"] - tolerance, state["blocked_until"])
+            state["tat"] = max(state["tat"], scheduled) + self.interval
+        wait = scheduled - now
+        self.acquired += 1
+        self.total_wait += wait
+        return wait
+
+    def blocked_for(self) -> float:
+        """penalize() による送信停止の残り秒数"""
+        with self._locked_state() as state:
+            return max(0.0, state["blocked_until"] - time.time())
+
+    async def acquire(self) -> float:
+        """送信可能になるまで待機する（非同期）。待った秒数を返す"""
+        wait = self.reserve()
+        waited = 0.0
+        # 予約後に 429 で送信停止になった場合は、停止明け以降の枠を予約し直す
+        while wait > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+            wait = self.reserve() if self.blocked_for() > 0 else 0.0
+        return waited
+
+    def acquire_sync(self) -> float:
+        """送信可能になるまで待機する（同期）。待った秒数を返す"""
+        wait = self.reserve()
+        waited = 0.0
+        while wait > 0:
+            time.sleep(wait)
+            waited += wait
+            wait = self.reserve() if self.blocked_for() > 0 else 0.0
+        return waited
+
+    def penalize(self, delay: float) -> None:
+        """上流から 429 / Retry-After を受けた場合に、全呼び出しを delay 秒止める"""
+        until = time.time() + delay
+        with self._locked_state() as state:
+            state["blocked_until"] = max(state["blocked_until"], until)
+            state["tat"] = max(state["tat"], until)
+        self.penalties += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "shared": self.state_path is not None,
+            "acquired": self.acquired,
+            "penalties": self.penalties,
+            "avg_wait": round(self.total_wait / self.acquired, 3) if self.acquired else 0.0,
+        }
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """指数バックオフ + フルジッタの待ち秒数（attempt は 0 始まり）"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After ヘッダー（秒数）を解釈する。日付形式や不正値は None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
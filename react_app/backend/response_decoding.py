@@ -0,0 +1,58 @@
+"""LLM の構造化出力のデコードとスキーマ検証
+
+JSON スキーマのバリデータは起動時に 1 度だけ作成して使い回す（`jsonschema.validate` は呼び出しごとに
+スキーマの検査とバリデータの生成を行う）。JSON のパースは orjson がインストールされていれば orjson を使い、
+なければ標準の json を使う。マークダウンのコードブロック記号は 1 回の走査で取り除く。
+"""
+import json
+import re
+from typing import Any, Dict, Union
+
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+try:
+    import orjson
+except ImportError:  # orjson は任意の依存
+    orjson = None
+
+JSON_CODEC = "orjson" if orjson is not None else "json"
+
+# ``` で始まる行（```json などを含む）を行末の改行ごと取り除く
+_FENCE_LINE = re.compile(r"^[ \t]*```[^\n]*(?:\n|\Z)", re.MULTILINE)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """JSON をパースする（失敗時は json.JSONDecodeError。orjson の例外もそのサブクラス）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def strip_code_fence(text: str) -> str:
+    """マークダウンのコードブロック記号の行を取り除く（含まれていなければそのまま返す）"""
+    if "```" not in text:
+        return text
+    return _FENCE_LINE.sub("", text)
+
+
+class StructuredDecoder:
+    """JSON スキーマに沿った LLM 出力のデコーダ（バリデータは生成時に 1 度だけ作る）"""
+
+    def __init__(self, schema: Dict[str, Any]):
+        validator_class = validator_for(schema)
+        validator_class.check_schema(schema)
+        self.schema = schema
+        self.validator = validator_class(schema)
+
+    def validate(self, instance: Any) -> None:
+        """スキーマに適合しなければ jsonschema.ValidationError を送出する"""
+        error = best_match(self.validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+    def decode(self, content: str) -> Any:
+        """コードブロックを除去してパースし、スキーマ検証済みの値を返す"""
+        data = loads(strip_code_fence(content))
+        self.validate(data)
+        return data
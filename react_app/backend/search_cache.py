@@ -0,0 +1,169 @@
+"""Semantic Scholar 検索結果のキャッシュ（メモリ + ディスクの 2 段構成）
+
+同じ検索条件（クエリ・年範囲・件数・取得フィールド）の結果を再利用し、上流 API への
+アクセスを減らす。TTL 内は新鮮な結果としてそのまま返し、TTL を過ぎても
+stale-while-revalidate の猶予期間内であれば古い結果を即座に返しつつバックグラウンドで更新する。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+SEARCH_CACHE_ENABLED = os.environ.get("SEARCH_CACHE_ENABLED", "1") != "0"
+SEARCH_CACHE_PATH = os.environ.get(
+    "SEARCH_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "search_cache.sqlite3")
+)
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_STALE_TTL = float(os.environ.get("SEARCH_CACHE_STALE_TTL", str(24 * 3600)))
+SEARCH_CACHE_MEMORY_ENTRIES = int(os.environ.get("SEARCH_CACHE_MEMORY_ENTRIES", "256"))
+
+# キャッシュの状態（X-Cache ヘッダーの値）
+CACHE_HIT = "HIT"
+CACHE_STALE = "STALE"
+CACHE_MISS = "MISS"
+
+
+class SearchCache:
+    """TTL と stale-while-revalidate に対応した検索結果キャッシュ"""
+
+    def __init__(
+        self,
+        path: str = SEARCH_CACHE_PATH,
+        ttl: float = SEARCH_CACHE_TTL,
+        stale_ttl: float = SEARCH_CACHE_STALE_TTL,
+        memory_entries: int = SEARCH_CACHE_MEMORY_ENTRIES,
+        enabled: bool = SEARCH_CACHE_ENABLED,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.memory_entries = memory_entries
+        self.enabled = enabled
+        self.counts = {CACHE_HIT: 0, CACHE_STALE: 0, CACHE_MISS: 0, "refreshed": 0}
+        self._memory: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """SQLite 接続を返す（初回アクセス時にテーブルを作成）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(**params: Any) -> str:
+        """検索条件からキャッシュキーを生成する"""
+        raw = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(値, 経過秒数) を返す。猶予期間も過ぎている場合は None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            else:
+                row = self.conn.execute(
+                    "SELECT value, created_at FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = (json.loads(row[0]), row[1])
+                self._remember(key, entry)
+        value, created_at = entry
+        age = now - created_at
+        if age > self.ttl + self.stale_ttl:
+            return None
+        return value, age
+
+    def set(self, key: str, value: Any) -> None:
+        """メモリとディスクの両方に保存する"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, (value, now))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now),
+            )
+            self.conn.execute("DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl - self.stale_ttl,))
+            self.conn.commit()
+
+    def _remember(self, key: str, entry: Tuple[Any, float]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str, float]:
+        """キャッシュを参照し、必要に応じて fetch で取得する。(値, 状態, 経過秒数) を返す"""
+        if not self.enabled:
+            return await fetch(), CACHE_MISS, 0.0
+
+        cached = self.get(key)
+        if cached is not None:
+            value, age = cached
+            if age <= self.ttl:
+                self.counts[CACHE_HIT] += 1
+                return value, CACHE_HIT, age
+            # 古い結果を返しつつバックグラウンドで更新する
+            self.counts[CACHE_STALE] += 1
+            self._refresh_in_background(key, fetch)
+            return value, CACHE_STALE, age
+
+        self.counts[CACHE_MISS] += 1
+        value = await fetch()
+        self.set(key, value)
+        return value, CACHE_MISS, 0.0
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                self.set(key, await fetch())
+                self.counts["refreshed"] += 1
+            except Exception as e:
+                print(f"検索キャッシュの更新に失敗: {e}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.ensure_future(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def cache_control(self, age: float) -> str:
+        """Cache-Control ヘッダーの値を返す"""
+        max_age = max(0, int(self.ttl - age))
+        return f"public, max-age={max_age}, stale-while-revalidate={int(self.stale_ttl)}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "memory_entries": len(self._memory),
+            "refreshing": len(self._refreshing),
+            **{key.lower(): value for key, value in self.counts.items()},
+        }
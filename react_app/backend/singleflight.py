@@ -0,0 +1,102 @@
+"""同一リクエストの重複生成をまとめる（single-flight）
+
+人気の論文を複数ユーザーが同時に開いた場合など、同じキーの生成が実行中であれば
+新たに Ollama を呼び出さず、実行中の結果を共有する。
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """同じキーの非同期処理を 1 回の実行にまとめる"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """key の処理が実行中ならその結果を待ち、なければ func を実行する"""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+            self.executed += 1
+        else:
+            self.shared += 1
+        # 待機側が切断されても共有中の生成は止めない
+        return await asyncio.shield(future)
+
+    def _forget(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "executed": self.executed, "shared": self.shared}
+
+
+class _Broadcast:
+    """1 つのストリームを複数の購読者に配信するためのバッファ"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class StreamFlight:
+    """同じキーのストリーミング生成を 1 本の上流ストリームにまとめる"""
+
+    def __init__(self):
+        self._streams: Dict[str, _Broadcast] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def subscribe(self, key: str, factory: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """key のストリームを購読する。途中から参加した場合も先頭から順に受け取る"""
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            self._tasks[key] = asyncio.ensure_future(self._pump(key, broadcast, factory))
+            self.executed += 1
+        else:
+            self.shared += 1
+
+        index = 0
+        while True:
+            while index < len(broadcast.items):
+                yield broadcast.items[index]
+                index += 1
+            if broadcast.done:
+                if broadcast.error is not None:
+                    raise broadcast.error
+                return
+            await broadcast.changed.wait()
+
+    async def _pump(self, key: str, broadcast: _Broadcast, factory: Callable[[], AsyncIterator[Any]]) -> None:
+        """上流ストリームを読み出してバッファへ追加する"""
+        try:
+            async for item in factory():
+                broadcast.items.append(item)
+                broadcast.notify()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            broadcast.done = True
+            broadcast.notify()
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+                del self._tasks[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._streams), "executed": self.executed, "shared": self.shared}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# バックエンドのモジュールはフラットに配置されているため、親ディレクトリを import パスに加える
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
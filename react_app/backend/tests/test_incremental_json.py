@@ -0,0 +1,83 @@
+"""incremental_json の逐次解析（1 文字ずつの入力、文字列中の記号、前置きやコードブロック）"""
+import json
+
+import pytest
+
+from incremental_json import IncrementalJSONParser
+
+DOCUMENT = {
+    "title": 'He said "}{" and \\ left [',
+    "fields": [{"name": "NLP", "score": 0.5}, {"name": "a]b", "score": 1}],
+    "count": 12,
+    "ok": True,
+    "none": None,
+    "nested": {"k": "v"},
+}
+
+
+def feed_chars(parser, text):
+    completed = []
+    for c in text:
+        completed.extend(parser.feed(c))
+    return completed
+
+
+def test_char_by_char_yields_root_members_in_order():
+    text = json.dumps(DOCUMENT, ensure_ascii=False, indent=2)
+    parser = IncrementalJSONParser()
+
+    completed = feed_chars(parser, text)
+
+    assert completed == [((key,), value) for key, value in DOCUMENT.items()]
+    assert parser.done
+    assert parser.result() == DOCUMENT
+
+
+def test_member_is_returned_as_soon_as_it_closes():
+    parser = IncrementalJSONParser()
+
+    assert parser.feed('{"title": "a \\"quoted\\" }') == []
+    assert parser.feed(' value", "count": 3') == [(("title",), 'a "quoted" } value')]
+    # 数値は区切り文字が来るまで閉じたとみなさない
+    assert parser.feed("}") == [(("count",), 3)]
+    assert parser.done
+
+
+def test_escaped_backslash_before_closing_quote():
+    parser = IncrementalJSONParser()
+
+    completed = feed_chars(parser, '{"path": "C:\\\\", "next": "{"}')
+
+    assert completed == [(("path",), "C:\\"), (("next",), "{")]
+
+
+def test_preamble_and_code_fence_are_skipped():
+    text = "以下が結果です。\n```json\n" + json.dumps(DOCUMENT) + "\n```\n補足: }"
+    parser = IncrementalJSONParser()
+
+    completed = feed_chars(parser, text)
+
+    assert [path for path, _ in completed] == [(key,) for key in DOCUMENT]
+    assert parser.done
+    assert parser.result() == DOCUMENT
+
+
+def test_paths_select_nested_values():
+    parser = IncrementalJSONParser(paths=[("fields", 0), ("fields", 1), ("nested", "k")])
+
+    completed = feed_chars(parser, json.dumps(DOCUMENT))
+
+    assert completed == [
+        (("fields", 0), DOCUMENT["fields"][0]),
+        (("fields", 1), DOCUMENT["fields"][1]),
+        (("nested", "k"), "v"),
+    ]
+
+
+def test_result_raises_until_document_is_complete():
+    parser = IncrementalJSONParser()
+    parser.feed('{"title": "x", "count": ')
+
+    assert not parser.done
+    with pytest.raises(json.JSONDecodeError):
+        parser.result()
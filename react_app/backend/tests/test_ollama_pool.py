@@ -0,0 +1,97 @@
+"""ollama_pool のホスト選択・切り離し・復帰・モデル一覧の統合（httpx.MockTransport のスタブホストで確認）"""
+import asyncio
+
+import httpx
+
+from ollama_client import OllamaClient
+from ollama_pool import OllamaHost, OllamaHostPool, model_capacity, probe_host
+
+
+def stub_host(base_url, models=(), loaded=(), down=False):
+    """/api/tags と /api/ps に応答する（down=True なら接続できない）スタブホスト"""
+
+    def handler(request):
+        if down:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": name} for name in models]})
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": [{"name": name, "size_vram": 1} for name in loaded]})
+        return httpx.Response(404)
+
+    client = OllamaClient(base_url)
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return OllamaHost(client)
+
+
+def test_select_prefers_least_outstanding_with_cold_penalty():
+    warm = stub_host("http://warm")
+    cold = stub_host("http://cold")
+    warm.loaded = {"gemma3"}
+    pool = OllamaHostPool([cold, warm], cold_penalty=4)
+
+    # 読み込み済みのホストは実行中が 3 件でも、未読み込みのホスト（0 + 4）より優先する
+    warm.outstanding = 3
+    assert pool.select("gemma3") is warm
+    # 読み込み待ちのコストを上回るほど混んでいれば未読み込みのホストへ送る
+    warm.outstanding = 5
+    assert pool.select("gemma3") is cold
+
+
+def test_call_marks_host_down_and_retries_on_another_host():
+    down = stub_host("http://down", models=["gemma3"], down=True)
+    up = stub_host("http://up", models=["gemma3"])
+    up.outstanding = 1  # 最初は実行中の少ない down のホストが選ばれる
+    pool = OllamaHostPool([down, up])
+
+    tags = asyncio.run(pool.call("gemma3", lambda client: client.get_json("/api/tags")))
+
+    assert tags["models"] == [{"name": "gemma3"}]
+    assert not down.healthy
+    assert down.errors == 1
+    assert up.healthy and up.requests == 1
+    assert pool.select("gemma3") is up
+
+
+def test_probe_readmits_host_after_success():
+    host = stub_host("http://host", models=["gemma3"], loaded=["gemma3"])
+    host.mark_down(httpx.ConnectError("connection refused"))
+    assert not host.healthy
+
+    asyncio.run(probe_host(host))
+
+    assert host.healthy
+    assert host.failures == 0
+    assert host.available == {"gemma3"}
+    assert host.loaded == {"gemma3"}
+
+
+def test_probe_ejects_host_after_consecutive_failures():
+    host = stub_host("http://host", down=True)
+
+    asyncio.run(probe_host(host, max_failures=2))
+    assert host.healthy
+    asyncio.run(probe_host(host, max_failures=2))
+    assert not host.healthy
+
+
+def test_list_models_merges_hosts():
+    first = stub_host("http://first", models=["gemma3", "qwen3"])
+    second = stub_host("http://second", models=["qwen3", "nomic-embed-text"])
+    pool = OllamaHostPool([first, second])
+
+    models = asyncio.run(pool.list_models())
+
+    assert sorted(model["name"] for model in models) == ["gemma3", "nomic-embed-text", "qwen3"]
+
+
+def test_model_capacity_counts_shared_hosts_once():
+    shared = stub_host("http://shared")
+    other = stub_host("http://other")
+    shared.available = other.available = {"gemma3"}
+
+    # 機能ごとのプールで同じホストを共有していても台数は重複して数えない
+    assert model_capacity([shared, other, shared], "gemma3") == 2
+    other.healthy = False
+    assert model_capacity([shared, other], "gemma3") == 1
+    assert model_capacity([], "gemma3") == 1
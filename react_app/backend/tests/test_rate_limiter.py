@@ -0,0 +1,89 @@
+"""rate_limiter のトークンバケット（Retry-After による停止と、状態ファイルによるプロセス間共有）"""
+import json
+import multiprocessing
+
+import pytest
+
+import rate_limiter
+from rate_limiter import TokenBucket, backoff_delay, parse_retry_after
+
+
+def reserve_in_child(state_path, count):
+    bucket = TokenBucket(rate=1.0, burst=1, state_path=state_path)
+    for _ in range(count):
+        bucket.reserve()
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("5", 5.0), ("0.5", 0.5), ("-3", 0.0), ("", None), (None, None), ("soon", None),
+     ("Wed, 21 Oct 2015 07:28:00 GMT", None)],
+)
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_burst_then_evenly_spaced():
+    bucket = TokenBucket(rate=10.0, burst=3)
+
+    waits = [bucket.reserve() for _ in range(5)]
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3] == pytest.approx(0.1, abs=0.02)
+    assert waits[4] == pytest.approx(0.2, abs=0.02)
+
+
+def test_penalize_blocks_until_retry_after():
+    bucket = TokenBucket(rate=100.0, burst=5)
+    bucket.penalize(parse_retry_after("2"))
+
+    assert bucket.blocked_for() == pytest.approx(2.0, abs=0.1)
+    # burst の余裕があっても停止明けまでは送信しない
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.1)
+    assert bucket.stats()["penalties"] == 1
+
+
+def test_penalize_never_shortens_existing_block():
+    bucket = TokenBucket(rate=100.0)
+    bucket.penalize(5)
+    bucket.penalize(1)
+
+    assert bucket.blocked_for() == pytest.approx(5.0, abs=0.1)
+
+
+shared_state = pytest.mark.skipif(rate_limiter.fcntl is None, reason="fcntl がない環境ではプロセス間共有しない")
+
+
+@shared_state
+def test_shared_state_between_buckets(tmp_path):
+    state_path = str(tmp_path / "limits" / "api.json")
+    first = TokenBucket(rate=1.0, state_path=state_path)
+    second = TokenBucket(rate=1.0, state_path=state_path)
+
+    assert first.reserve() == 0.0
+    assert second.reserve() == pytest.approx(1.0, abs=0.1)
+
+    first.penalize(10)
+    assert second.blocked_for() == pytest.approx(10.0, abs=0.1)
+    assert second.stats()["shared"] is True
+    with open(state_path) as f:
+        assert set(json.load(f)) == {"tat", "blocked_until"}
+
+
+@shared_state
+def test_shared_state_across_processes(tmp_path):
+    state_path = str(tmp_path / "api.json")
+    process = multiprocessing.get_context("fork").Process(target=reserve_in_child, args=(state_path, 3))
+    process.start()
+    process.join(timeout=10)
+    assert process.exitcode == 0
+
+    # 子プロセスが 3 件分の枠を予約済みなので、次の枠は約 3 秒後になる
+    bucket = TokenBucket(rate=1.0, state_path=state_path)
+    assert bucket.reserve() == pytest.approx(3.0, abs=0.5)
+
+
+def test_backoff_delay_bounds():
+    for attempt in range(8):
+        for _ in range(20):
+            assert 0.0 <= backoff_delay(attempt, base=1.0, cap=30.0) <= min(30.0, 2 ** attempt)
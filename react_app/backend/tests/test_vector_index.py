@@ -0,0 +1,134 @@
+"""vector_index の追加・再構築・再読み込み・書き込み途中の行の切り捨て"""
+import os
+
+import numpy as np
+import pytest
+
+from vector_index import VectorIndex
+
+
+def random_vectors(count, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return {f"p{i}": rng.standard_normal(dim).astype(np.float32) for i in range(count)}
+
+
+def exact_top(vectors, query, k):
+    ids = list(vectors)
+    matrix = np.stack([vectors[paper_id] for paper_id in ids])
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    scores = matrix @ (query / np.linalg.norm(query))
+    return [ids[i] for i in np.argsort(-scores)[:k]]
+
+
+def make_index(directory, **kwargs):
+    # 自動の再構築は起こさず、maintain() を明示的に呼ぶ
+    kwargs.setdefault("min_train", 10 ** 9)
+    kwargs.setdefault("nprobe", 1024)
+    return VectorIndex(str(directory), **kwargs)
+
+
+def test_add_ignores_known_ids_and_checks_dimension(tmp_path):
+    index = make_index(tmp_path)
+    vectors = random_vectors(5)
+
+    assert index.add(vectors) == 5
+    assert index.add({"p0": vectors["p0"], "p5": vectors["p1"]}) == 1
+    assert index.count == 6
+    assert "p5" in index
+    with pytest.raises(ValueError):
+        index.add({"other": np.ones(8, dtype=np.float32)})
+
+
+def test_search_matches_exact_top_k_before_and_after_maintain(tmp_path):
+    vectors = random_vectors(500)
+    index = make_index(tmp_path)
+    index.add(vectors)
+    query = vectors["p7"]
+
+    assert [paper_id for paper_id, _ in index.search(query, 10)] == exact_top(vectors, query, 10)
+
+    index.min_train = 100
+    index.maintain()
+    assert index.generation == 1
+    assert index.stats()["nlist"] > 1
+    # nprobe をリスト数以上にしているので全件走査と同じ結果になる
+    assert [paper_id for paper_id, _ in index.search(query, 10)] == exact_top(vectors, query, 10)
+    assert "p7" not in [paper_id for paper_id, _ in index.search(query, 10, exclude="p7")]
+
+
+def test_reload_reads_committed_generation_and_tail(tmp_path):
+    vectors = random_vectors(300)
+    index = make_index(tmp_path)
+    index.add(dict(list(vectors.items())[:200]))
+    index.min_train = 100
+    index.maintain()
+    # 再構築後に追加した行は未整理領域として読み込まれる
+    index.add(dict(list(vectors.items())[200:]))
+
+    reloaded = make_index(tmp_path)
+
+    assert reloaded.generation == index.generation == 1
+    assert reloaded.count == 300
+    np.testing.assert_allclose(reloaded.get_vector("p250"), index.get_vector("p250"))
+    query = vectors["p250"]
+    assert [paper_id for paper_id, _ in reloaded.search(query, 5)] == exact_top(vectors, query, 5)
+
+
+def test_uncommitted_generation_is_ignored_and_removed(tmp_path):
+    vectors = random_vectors(200)
+    index = make_index(tmp_path)
+    index.add(vectors)
+    index.min_train = 100
+    index.maintain()
+
+    # meta.json を置き換える前に落ちた再構築（世代 2）の残骸
+    for name in ("vectors.2.f32", "assign.2.i32", "ids.2.txt", "offsets.2.npy", "vectors.1.f32.tmp"):
+        (tmp_path / name).write_bytes(b"\0" * 64)
+
+    reloaded = make_index(tmp_path)
+
+    assert reloaded.generation == 1
+    assert reloaded.count == 200
+    assert not (tmp_path / "vectors.2.f32").exists()
+    assert not (tmp_path / "vectors.1.f32.tmp").exists()
+    query = vectors["p3"]
+    assert [paper_id for paper_id, _ in reloaded.search(query, 5)] == exact_top(vectors, query, 5)
+
+
+def test_torn_append_is_truncated_on_load(tmp_path):
+    vectors = random_vectors(10)
+    index = make_index(tmp_path)
+    index.add(vectors)
+
+    # ベクトルと割り当てだけ書いて paperId を書く前に落ちた追記
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.ones(16, dtype=np.float32).tobytes())
+    with open(tmp_path / "assign.i32", "ab") as f:
+        f.write(np.array([-1], dtype=np.int32).tobytes())
+
+    reloaded = make_index(tmp_path)
+
+    assert reloaded.count == 10
+    assert os.path.getsize(tmp_path / "vectors.f32") == 10 * 16 * 4
+    assert os.path.getsize(tmp_path / "assign.i32") == 10 * 4
+    assert reloaded.add({"p10": np.ones(16, dtype=np.float32)}) == 1
+    assert make_index(tmp_path).count == 11
+
+
+def test_concurrent_maintain_commits_consistent_generations(tmp_path):
+    vectors = random_vectors(400)
+    index = make_index(tmp_path)
+    index.add(vectors)
+    index.min_train = 100
+
+    index._start_maintenance()
+    index.maintain()
+    index._maintenance.join()
+
+    reloaded = make_index(tmp_path)
+    assert reloaded.generation == index.generation == 2
+    query = vectors["p11"]
+    assert [paper_id for paper_id, _ in reloaded.search(query, 5)] == exact_top(vectors, query, 5)
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["meta.json", "vectors.2.f32", "assign.2.i32", "ids.2.txt", "centroids.2.npy", "offsets.2.npy"]
+    )
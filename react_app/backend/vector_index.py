@@ -0,0 +1,430 @@
+"""埋め込みベクトルの近似最近傍（ANN）インデックス
+
+NumPy だけで実装した IVF-Flat 方式のインデックス。ベクトルを k-means のセントロイドで
+クラスタ（転置リスト）に分け、検索時はクエリに近い nprobe 個のリストだけを走査する。
+
+ベクトルは正規化した float32 として追記専用のファイルに保存し、np.memmap で読み出すため
+全件をメモリに載せる必要はない。追加されたベクトルは最寄りのリストの「未整理領域」に入り、
+一定量たまるとバックグラウンドでリスト順に並べ直す（再学習・圧縮）。並べ直した領域は
+リストごとに連続しているので、検索時はスライスで読み出せる。
+
+並べ直した結果は世代番号付きの別ファイル（vectors.<世代>.f32 など）に書き出し、meta.json の世代を
+アトミックに置き換えて確定する。読み込みは meta.json に記録された世代のファイルだけを使うため、
+再構築の途中で落ちても古い世代と新しい世代のファイルが混ざることはない。
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+VECTOR_INDEX_DIR = os.environ.get(
+    "VECTOR_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "vector_index")
+)
+# 転置リスト数の上限（件数の平方根程度まで、データ量に応じて段階的に増やす）
+VECTOR_INDEX_NLIST = int(os.environ.get("VECTOR_INDEX_NLIST", "1024"))
+# 検索時に走査するリスト数
+VECTOR_INDEX_NPROBE = int(os.environ.get("VECTOR_INDEX_NPROBE", "8"))
+# この件数未満は全件走査（学習しない）
+VECTOR_INDEX_MIN_TRAIN = int(os.environ.get("VECTOR_INDEX_MIN_TRAIN", "4096"))
+# 未整理領域が整理済み領域のこの割合を超えたら並べ直す
+VECTOR_INDEX_COMPACT_RATIO = float(os.environ.get("VECTOR_INDEX_COMPACT_RATIO", "0.2"))
+
+# 世代ごとのファイル名（世代 0 は接尾辞なし）
+_GENERATION_FILES = {
+    "vectors": "vectors{}.f32",
+    "assign": "assign{}.i32",
+    "ids": "ids{}.txt",
+    "centroids": "centroids{}.npy",
+    "offsets": "offsets{}.npy",
+}
+_GENERATION_FILE_PATTERN = re.compile(r"^(vectors|assign|ids|centroids|offsets)(?:\.(\d+))?\.(f32|i32|txt|npy)$")
+
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+ASSIGN_CHUNK = 65536
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """各ベクトルを最も近い（内積が最大の）セントロイドに割り当てる"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK], dtype=np.float32)
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def _kmeans(sample: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """正規化済みベクトルの球面 k-means でセントロイドを求める"""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = _assign(sample, centroids)
+        counts = np.bincount(assignments, minlength=nlist)
+        # クラスタ順に並べて区間ごとに合計する
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+        # 空のクラスタはランダムなベクトルで置き直す
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def target_nlist(count: int, max_nlist: int = VECTOR_INDEX_NLIST) -> int:
+    """件数に応じた転置リスト数"""
+    return max(1, min(max_nlist, int(np.sqrt(count))))
+
+
+class VectorIndex:
+    """memmap に保存する IVF-Flat インデックス（コサイン類似度）"""
+
+    def __init__(
+        self,
+        directory: str,
+        max_nlist: int = VECTOR_INDEX_NLIST,
+        nprobe: int = VECTOR_INDEX_NPROBE,
+        min_train: int = VECTOR_INDEX_MIN_TRAIN,
+        compact_ratio: float = VECTOR_INDEX_COMPACT_RATIO,
+    ):
+        self.directory = directory
+        self.max_nlist = max_nlist
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.compact_ratio = compact_ratio
+        self.dim: Optional[int] = None
+        self.generation = 0
+        self.count = 0
+        self.searches = 0
+        self.last_maintenance: Optional[Dict[str, Any]] = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._centroids: Optional[np.ndarray] = None
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._compacted = 0
+        self._tail: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+        # 再構築は同時に 1 つだけ（同じ世代のファイルを並行に書かないようにする）
+        self._maintain_lock = threading.Lock()
+        self._maintenance: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _file(self, kind: str, generation: Optional[int] = None) -> str:
+        generation = self.generation if generation is None else generation
+        return self._path(_GENERATION_FILES[kind].format(f".{generation}" if generation else ""))
+
+    # 永続化
+
+    def _load(self) -> None:
+        """meta.json に記録された世代のインデックスを読み込む（書き込み途中の行は切り捨てる）"""
+        meta_path = self._path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.generation = meta.get("generation", 0)
+        self._compacted = meta.get("compacted", 0)
+        self._remove_stale_files()
+        if os.path.exists(self._file("centroids")):
+            self._centroids = np.load(self._file("centroids"))
+            self._offsets = np.load(self._file("offsets"))
+        if not all(os.path.exists(self._file(kind)) for kind in ("vectors", "assign", "ids")):
+            return
+        with open(self._file("ids")) as f:
+            ids = f.read().splitlines()
+        assignments = np.fromfile(self._file("assign"), dtype=np.int32)
+        rows = os.path.getsize(self._file("vectors")) // (self.dim * 4)
+        count = min(len(ids), len(assignments), rows)
+        if count < max(len(ids), len(assignments), rows):
+            self._truncate_files(count, ids[:count])
+        self._ids = ids[:count]
+        self._rows = {paper_id: row for row, paper_id in enumerate(self._ids)}
+        self._assignments = assignments[:count].copy()
+        self.count = count
+        self._tail = {}
+        for row in range(self._compacted, count):
+            self._tail.setdefault(int(self._assignments[row]), []).append(row)
+        self._open_vectors()
+
+    def _remove_stale_files(self) -> None:
+        """確定していない・置き換え済みの世代のファイルと一時ファイルを削除する"""
+        for name in os.listdir(self.directory):
+            match = _GENERATION_FILE_PATTERN.match(name)
+            if name.endswith(".tmp") or (match and int(match.group(2) or 0) != self.generation):
+                os.remove(self._path(name))
+
+    def _remove_generation(self, generation: int) -> None:
+        for kind in _GENERATION_FILES:
+            try:
+                os.remove(self._file(kind, generation))
+            except FileNotFoundError:
+                pass
+
+    def _truncate_files(self, count: int, ids: List[str]) -> None:
+        with open(self._file("vectors"), "r+b") as f:
+            f.truncate(count * self.dim * 4)
+        with open(self._file("assign"), "r+b") as f:
+            f.truncate(count * 4)
+        with open(self._file("ids"), "w") as f:
+            f.write("".join(f"{paper_id}\n" for paper_id in ids))
+
+    def _open_vectors(self) -> None:
+        if self.count == 0:
+            self._vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+        else:
+            self._vectors = np.memmap(self._file("vectors"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+
+    def _write_meta(self, generation: Optional[int] = None, compacted: Optional[int] = None) -> None:
+        """meta.json をアトミックに置き換える（再構築ではこれが新しい世代の確定になる）"""
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "dim": self.dim,
+                "generation": self.generation if generation is None else generation,
+                "compacted": self._compacted if compacted is None else compacted,
+            }, f)
+            _sync(f)
+        os.replace(tmp_path, self._path("meta.json"))
+
+    # 追加
+
+    def add(self, vectors: Dict[str, np.ndarray]) -> int:
+        """ベクトルを追加する（登録済みの paperId は無視）。追加件数を返す"""
+        with self._lock:
+            new_ids = [paper_id for paper_id in dict.fromkeys(vectors) if paper_id not in self._rows]
+            if not new_ids:
+                return 0
+            matrix = _normalize(np.stack([vectors[paper_id] for paper_id in new_ids]))
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._write_meta()
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"ベクトルの次元が一致しません: {matrix.shape[1]} != {self.dim}")
+            if self._centroids is not None:
+                assignments = _assign(matrix, self._centroids)
+            else:
+                assignments = np.full(len(new_ids), -1, dtype=np.int32)
+
+            # ベクトル → 割り当て → paperId の順に追記する（途中で落ちても読み込み時に揃える）
+            with open(self._file("vectors"), "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self._file("assign"), "ab") as f:
+                f.write(assignments.tobytes())
+            with open(self._file("ids"), "a") as f:
+                f.write("".join(f"{paper_id}\n" for paper_id in new_ids))
+
+            for offset, paper_id in enumerate(new_ids):
+                row = self.count + offset
+                self._ids.append(paper_id)
+                self._rows[paper_id] = row
+                self._tail.setdefault(int(assignments[offset]), []).append(row)
+            self._assignments = np.concatenate([self._assignments, assignments])
+            self.count += len(new_ids)
+            self._open_vectors()
+        if self._needs_maintenance():
+            self._start_maintenance()
+        return len(new_ids)
+
+    # 検索
+
+    def __contains__(self, paper_id: str) -> bool:
+        return paper_id in self._rows
+
+    def get_vector(self, paper_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(paper_id)
+            return None if row is None else np.array(self._vectors[row])
+
+    def search(self, query: np.ndarray, k: int = 10, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """クエリに近い順に (paperId, コサイン類似度) を最大 k 件返す"""
+        query = _normalize(query)
+        with self._lock:
+            vectors, centroids, offsets = self._vectors, self._centroids, self._offsets
+            if self.count == 0:
+                return []
+            if centroids is None:
+                rows = np.arange(self.count)
+                scores = vectors @ query
+            else:
+                nprobe = min(self.nprobe, len(centroids))
+                probes = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+                row_parts, score_parts = [], []
+                for list_id in probes:
+                    start, end = int(offsets[list_id]), int(offsets[list_id + 1])
+                    if end > start:
+                        # 整理済み領域はリストごとに連続しているのでスライスで読み出す
+                        row_parts.append(np.arange(start, end))
+                        score_parts.append(vectors[start:end] @ query)
+                    tail = self._tail.get(int(list_id))
+                    if tail:
+                        tail_rows = np.array(tail)
+                        row_parts.append(tail_rows)
+                        score_parts.append(vectors[tail_rows] @ query)
+                if not row_parts:
+                    return []
+                rows, scores = np.concatenate(row_parts), np.concatenate(score_parts)
+            exclude_row = self._rows.get(exclude) if exclude is not None else None
+            if exclude_row is not None:
+                keep = rows != exclude_row
+                rows, scores = rows[keep], scores[keep]
+            k = min(k, len(rows))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            self.searches += 1
+            return [(self._ids[int(rows[i])], float(scores[i])) for i in top]
+
+    # 再学習・圧縮
+
+    def _needs_maintenance(self) -> bool:
+        if self.count < self.min_train:
+            return False
+        if self._centroids is None or target_nlist(self.count, self.max_nlist) >= 2 * len(self._centroids):
+            return True
+        return self.count - self._compacted > self.compact_ratio * max(self._compacted, 1)
+
+    def _start_maintenance(self) -> None:
+        if self._maintenance is not None and self._maintenance.is_alive():
+            return
+        self._maintenance = threading.Thread(target=self._run_maintenance, daemon=True)
+        self._maintenance.start()
+
+    def _run_maintenance(self) -> None:
+        try:
+            self.maintain()
+        except Exception as e:
+            print(f"ベクトルインデックスの再構築に失敗: {e}")
+
+    def maintain(self) -> None:
+        """必要に応じてセントロイドを学習し直し、ベクトルをリスト順に並べ直す
+
+        並べ直した結果は次の世代のファイルにロックの外で書き出し、ロック中は再構築中に追加された行の
+        書き足しと meta.json の置き換え（確定）、メモリ上の状態の入れ替えだけを行う。
+        """
+        with self._maintain_lock:
+            self._maintain()
+
+    def _maintain(self) -> None:
+        started_at = time.perf_counter()
+        with self._lock:
+            snapshot = self.count
+            vectors = self._vectors
+            centroids = self._centroids
+            assignments = self._assignments[:snapshot].copy()
+            ids = self._ids[:snapshot]
+            generation = self.generation + 1
+        if snapshot == 0:
+            return
+        retrain = centroids is None or target_nlist(snapshot, self.max_nlist) >= 2 * len(centroids)
+        if retrain:
+            # 学習と全件の割り当ては時間がかかるためロックの外で行う
+            nlist = target_nlist(snapshot, self.max_nlist)
+            rng = np.random.default_rng(snapshot)
+            sample_rows = np.sort(rng.choice(snapshot, min(snapshot, nlist * KMEANS_SAMPLE_PER_LIST), replace=False))
+            centroids = _kmeans(np.asarray(vectors[sample_rows]), nlist)
+            assignments = _assign(vectors[:snapshot], centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))]).astype(np.int64)
+        ordered_ids = [ids[int(row)] for row in order]
+        ordered_assignments = assignments[order].astype(np.int32)
+        rows = {paper_id: row for row, paper_id in enumerate(ordered_ids)}
+
+        # 新しい世代のファイルを書き出す（meta.json を置き換えるまでは読み込みに使われない）
+        self._remove_generation(generation)
+        with open(self._file("vectors", generation), "wb") as f:
+            for start in range(0, snapshot, ASSIGN_CHUNK):
+                f.write(np.asarray(vectors[order[start:start + ASSIGN_CHUNK]], dtype=np.float32).tobytes())
+            _sync(f)
+        with open(self._file("assign", generation), "wb") as f:
+            f.write(ordered_assignments.tobytes())
+            _sync(f)
+        with open(self._file("ids", generation), "w") as f:
+            f.write("".join(f"{paper_id}\n" for paper_id in ordered_ids))
+            _sync(f)
+        for kind, array in (("centroids", centroids), ("offsets", offsets)):
+            with open(self._file(kind, generation), "wb") as f:
+                np.save(f, array)
+                _sync(f)
+
+        with self._lock:
+            # 並べ直している間に追加された行を新しいセントロイドで割り当てて末尾に付ける
+            extra_vectors = np.asarray(self._vectors[snapshot:self.count], dtype=np.float32)
+            extra_ids = self._ids[snapshot:self.count]
+            extra_assignments = (
+                _assign(extra_vectors, centroids) if len(extra_ids) else np.zeros(0, dtype=np.int32)
+            )
+            if extra_ids:
+                with open(self._file("vectors", generation), "ab") as f:
+                    f.write(extra_vectors.tobytes())
+                    _sync(f)
+                with open(self._file("assign", generation), "ab") as f:
+                    f.write(extra_assignments.tobytes())
+                    _sync(f)
+                with open(self._file("ids", generation), "a") as f:
+                    f.write("".join(f"{paper_id}\n" for paper_id in extra_ids))
+                    _sync(f)
+            self._write_meta(generation=generation, compacted=snapshot)
+
+            previous = self.generation
+            self.generation = generation
+            self._compacted = snapshot
+            self._centroids = centroids
+            self._offsets = offsets
+            for offset, paper_id in enumerate(extra_ids):
+                rows[paper_id] = snapshot + offset
+            self._ids = ordered_ids + extra_ids
+            self._rows = rows
+            self._assignments = np.concatenate([ordered_assignments, extra_assignments])
+            self._tail = {}
+            for offset, list_id in enumerate(extra_assignments):
+                self._tail.setdefault(int(list_id), []).append(snapshot + offset)
+            self._open_vectors()
+        # 古い世代は確定後に削除する（memmap で開いたままの検索があってもファイルは残る）
+        self._remove_generation(previous)
+        self.last_maintenance = {
+            "retrained": retrain,
+            "vectors": snapshot,
+            "nlist": len(centroids),
+            "seconds": round(time.perf_counter() - started_at, 3),
+        }
+        print(f"ベクトルインデックスを再構築: {self.last_maintenance}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "vectors": self.count,
+            "dim": self.dim,
+            "generation": self.generation,
+            "nlist": 0 if self._centroids is None else len(self._centroids),
+            "nprobe": self.nprobe,
+            "compacted": self._compacted,
+            "searches": self.searches,
+            "maintenance_running": self._maintenance is not None and self._maintenance.is_alive(),
+            "last_maintenance": self.last_maintenance,
+        }
+
+
+def _sync(f) -> None:
+    """ファイルの内容をディスクまで書き出す"""
+    f.flush()
+    os.fsync(f.fileno())
@@ -14,7 +14,8 @@ interface AnalysisPanelProps {
   headerHeight: number;
   activeTab: 'analysis' | 'translation';
   onTabChange: (tab: 'analysis' | 'translation') => void;
-  analysisResult: PaperAnalysisResult | null;
+  analysisResult: Partial<PaperAnalysisResult> | null;
+  isStreamingAnalysis: boolean;
   translationResult: string | null;
   streamingTranslation: string;
   isStreamingTranslation: boolean;
@@ -28,6 +29,7 @@ export const AnalysisPanel: React.FC<AnalysisPanelProps> = ({
   activeTab,
   onTabChange,
   analysisResult,
+  isStreamingAnalysis,
   translationResult,
   streamingTranslation,
   isStreamingTranslation
@@ -83,7 +85,7 @@ export const AnalysisPanel: React.FC<AnalysisPanelProps> = ({
 
       <div className="flex-1 overflow-y-auto p-4 space-y-4">
         {activeTab === 'analysis' ? (
-          <AnalysisResult analysisResult={analysisResult} />
+          <AnalysisResult analysisResult={analysisResult} isStreamingAnalysis={isStreamingAnalysis} />
         ) : (
           <TranslationResult
             translationResult={translationResult}
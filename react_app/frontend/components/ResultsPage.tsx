@@ -50,6 +50,9 @@ const ResultsPage: React.FC = () => {
     isLoading,
     searchTime,
     resultLimit,
+    hasMore,
+    isLoadingMore,
+    loadMore,
     handleSearch,
     handleLimitChange,
   } = useSearch();
@@ -58,6 +61,7 @@ const ResultsPage: React.FC = () => {
     analysisResults,
     isAnalyzing,
     analyzingPaperId,
+    streamingAnalysis,
     handleAnalyzePaper,
   } = useAnalysis();
   
@@ -292,6 +296,18 @@ const ResultsPage: React.FC = () => {
                   })
                 )}
               </div>
+              
+              {!isLoading && hasMore && (
+                <div className="flex justify-center my-6">
+                  <button
+                    onClick={loadMore}
+                    disabled={isLoadingMore}
+                    className="px-6 py-2 bg-white border border-gray-300 rounded-lg text-gray-700 hover:bg-gray-100 disabled:opacity-50"
+                  >
+                    {isLoadingMore ? "読み込み中..." : "さらに読み込む"}
+                  </button>
+                </div>
+              )}
             </div>
           </main>
 
@@ -302,7 +318,8 @@ const ResultsPage: React.FC = () => {
             headerHeight={headerHeight}
             activeTab={activeTab}
             onTabChange={setActiveTab}
-            analysisResult={selectedPaper ? analysisResults[getPaperId(selectedPaper)] : null}
+            analysisResult={selectedPaper ? analysisResults[getPaperId(selectedPaper)] ?? (analyzingPaperId === getPaperId(selectedPaper) ? streamingAnalysis : null) : null}
+            isStreamingAnalysis={!!selectedPaper && analyzingPaperId === getPaperId(selectedPaper)}
             translationResult={selectedPaper ? translationResults[getPaperId(selectedPaper)] : null}
             streamingTranslation={streamingTranslation}
             isStreamingTranslation={isStreamingTranslation}
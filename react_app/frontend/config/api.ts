@@ -3,12 +3,14 @@ export const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost
 export const apiEndpoints = {
   search: `${API_BASE_URL}/search`,
   analyze: `${API_BASE_URL}/analyze`,
+  analyzeStream: `${API_BASE_URL}/analyze-stream`,
   translate: `${API_BASE_URL}/translate-stream`,
   quickSummary: `${API_BASE_URL}/quick-summary`,
   detailedSummary: `${API_BASE_URL}/summarize`,
   models: `${API_BASE_URL}/models`,
   modelConfig: `${API_BASE_URL}/models/config`,
   processPdf: `${API_BASE_URL}/process-pdf`,
+  processPdfStream: `${API_BASE_URL}/process-pdf-stream`,
 } as const;
 
 export const sortOptions = [
@@ -1,12 +1,14 @@
 import React from "react";
-import { Brain } from "lucide-react";
+import { Brain, Loader2 } from "lucide-react";
 import { PaperAnalysisResult } from "../../types";
 
 interface AnalysisResultProps {
-  analysisResult: PaperAnalysisResult | null;
+  // ストリーミング中は完成したフィールドのみを持つ
+  analysisResult: Partial<PaperAnalysisResult> | null;
+  isStreamingAnalysis?: boolean;
 }
 
-export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult }) => {
+export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult, isStreamingAnalysis = false }) => {
   if (!analysisResult) {
     return (
       <div className="text-center text-gray-500 mt-8">
@@ -19,7 +21,15 @@ export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult }
 
   return (
     <>
+      {isStreamingAnalysis && (
+        <div className="flex items-center text-sm text-blue-600">
+          <Loader2 className="animate-spin mr-1" size={14} />
+          解析中...
+        </div>
+      )}
+
       {/* 分野分類 */}
+      {analysisResult.fields && (
       <div className="bg-blue-50 rounded-lg p-3">
         <h4 className="text-sm font-semibold text-blue-800 mb-2">📊 分野分類</h4>
         <div className="space-y-1">
@@ -39,8 +49,10 @@ export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult }
           ))}
         </div>
       </div>
+      )}
 
       {/* 研究対象 */}
+      {analysisResult.target && (
       <div className="bg-green-50 rounded-lg p-3">
         <h4 className="text-sm font-semibold text-green-800 mb-2">🎯 研究対象</h4>
         <div className="bg-white p-2 rounded text-xs">
@@ -54,12 +66,15 @@ export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult }
           </div>
         </div>
       </div>
+      )}
 
       {/* 技術的アプローチ */}
+      {(analysisResult.methods || analysisResult.factors || analysisResult.metrics) && (
       <div className="bg-purple-50 rounded-lg p-3">
         <h4 className="text-sm font-semibold text-purple-800 mb-2">🔬 技術的アプローチ</h4>
         
         {/* Methods */}
+        {analysisResult.methods && (
         <div className="bg-white p-2 rounded mb-2">
           <h5 className="text-xs font-semibold text-purple-700 mb-1">手法</h5>
           <div className="space-y-1">
@@ -71,8 +86,10 @@ export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult }
             ))}
           </div>
         </div>
+        )}
 
         {/* Factors */}
+        {analysisResult.factors && (
         <div className="bg-white p-2 rounded mb-2">
           <h5 className="text-xs font-semibold text-purple-700 mb-1">要因</h5>
           <div className="space-y-1">
@@ -84,8 +101,10 @@ export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult }
             ))}
           </div>
         </div>
+        )}
 
         {/* Metrics */}
+        {analysisResult.metrics && (
         <div className="bg-white p-2 rounded">
           <h5 className="text-xs font-semibold text-purple-700 mb-1">指標</h5>
           <div className="space-y-1">
@@ -97,9 +116,12 @@ export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult }
             ))}
           </div>
         </div>
+        )}
       </div>
+      )}
 
       {/* 検索キーワード */}
+      {analysisResult.search_keywords && (
       <div className="bg-yellow-50 rounded-lg p-3">
         <h4 className="text-sm font-semibold text-yellow-800 mb-2">🔍 検索キーワード</h4>
         <div className="space-y-2">
@@ -125,6 +147,7 @@ export const AnalysisResult: React.FC<AnalysisResultProps> = ({ analysisResult }
           </div>
         </div>
       </div>
+      )}
     </>
   );
 };
\ No newline at end of file
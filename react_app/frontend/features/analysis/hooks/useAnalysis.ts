@@ -6,6 +6,8 @@ export const useAnalysis = () => {
   const [analysisResults, setAnalysisResults] = useState<Record<string, PaperAnalysisResult>>({});
   const [isAnalyzing, setIsAnalyzing] = useState(false);
   const [analyzingPaperId, setAnalyzingPaperId] = useState<string | null>(null);
+  // ストリーミング中の解析結果（完成したフィールドから順に埋まる）
+  const [streamingAnalysis, setStreamingAnalysis] = useState<Partial<PaperAnalysisResult> | null>(null);
 
   const getPaperId = (paper: Paper): string => {
     return paper.paperId || paper.url || `${paper.title}_${paper.authors?.[0]?.name || 'unknown'}`;
@@ -29,9 +31,12 @@ export const useAnalysis = () => {
 
     setAnalyzingPaperId(paperId);
     setIsAnalyzing(true);
+    setStreamingAnalysis({});
+    onSuccess?.(paper);
     
     try {
-      const response = await fetch(apiEndpoints.analyze, {
+      // ストリーミング解析APIを使用
+      const response = await fetch(apiEndpoints.analyzeStream, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -46,19 +51,51 @@ export const useAnalysis = () => {
         throw new Error('解析に失敗しました');
       }
 
-      const analysisData = await response.json();
-      
-      // 結果をキャッシュ
-      setAnalysisResults(prev => ({
-        ...prev,
-        [paperId]: analysisData
-      }));
-      
-      onSuccess?.(paper);
+      const reader = response.body?.getReader();
+      const decoder = new TextDecoder();
+
+      if (!reader) {
+        throw new Error('ストリーミングの読み取りに失敗しました');
+      }
+
+      // イベントが読み取り単位をまたぐことがあるため、改行までをバッファする
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+        
+        for (const line of lines) {
+          if (!line.startsWith('data: ')) continue;
+          
+          const data = JSON.parse(line.slice(6));
+          switch (data.type) {
+            case 'field':
+              setStreamingAnalysis(prev => ({ ...prev, [data.name]: data.value }));
+              break;
+              
+            case 'complete':
+              // 検証済みの最終結果をキャッシュ
+              setAnalysisResults(prev => ({
+                ...prev,
+                [paperId]: data.result
+              }));
+              break;
+              
+            case 'error':
+              throw new Error(data.content);
+          }
+        }
+      }
     } catch (error) {
       console.error('解析エラー:', error);
       alert('論文解析中にエラーが発生しました');
     } finally {
+      setStreamingAnalysis(null);
       setIsAnalyzing(false);
       setAnalyzingPaperId(null);
       setCurrentPriorityTask(null);
@@ -75,6 +112,7 @@ export const useAnalysis = () => {
     analysisResults,
     isAnalyzing,
     analyzingPaperId,
+    streamingAnalysis,
     handleAnalyzePaper,
     getAnalysisResult,
     getPaperId,
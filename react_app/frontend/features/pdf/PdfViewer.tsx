@@ -20,7 +20,14 @@ export const PdfViewer: React.FC<PdfViewerProps> = ({
   onClose,
   onAnalyzePdf
 }) => {
-  const { processPdf, isProcessing, processingError } = usePdfProcessing();
+  const {
+    processPdfStream,
+    isProcessing,
+    processingError,
+    streamedPages,
+    streamedSections,
+    pageCount,
+  } = usePdfProcessing();
   const [extractedText, setExtractedText] = useState<string | null>(null);
   
   // URL妥当性チェック
@@ -30,8 +37,10 @@ export const PdfViewer: React.FC<PdfViewerProps> = ({
     pdfUrl.startsWith('/')
   );
 
+  // 抽出したページから順に表示し、全ページの抽出が終わったら解析できるようにする
   const handleProcessPdf = async () => {
-    const result = await processPdf(pdfUrl);
+    setExtractedText(null);
+    const result = await processPdfStream(pdfUrl);
     if (result) {
       setExtractedText(result.text);
     }
@@ -68,7 +77,9 @@ export const PdfViewer: React.FC<PdfViewerProps> = ({
               ) : (
                 <Brain className="mr-1" size={14} />
               )}
-              {isProcessing ? 'テキスト抽出中...' : 'テキスト抽出'}
+              {isProcessing
+                ? `テキスト抽出中... ${streamedPages.length}${pageCount !== null ? ` / ${pageCount}` : ''}`
+                : 'テキスト抽出'}
             </button>
             
             {/* PDF解析ボタン */}
@@ -143,22 +154,52 @@ export const PdfViewer: React.FC<PdfViewerProps> = ({
             </div>
           </div>
 
-          {/* 抽出テキスト表示エリア */}
-          {(extractedText || processingError) && (
+          {/* 抽出テキスト表示エリア（届いたページから順に表示） */}
+          {(streamedPages.length > 0 || isProcessing || processingError) && (
             <div className="w-1/3 border-l border-gray-200 p-4 overflow-y-auto">
               <h3 className="text-lg font-semibold mb-3 text-gray-800">
                 抽出テキスト
+                {pageCount !== null && (
+                  <span className="ml-2 text-sm font-normal text-gray-500">
+                    {streamedPages.length} / {pageCount} ページ
+                  </span>
+                )}
               </h3>
-              
-              {processingError ? (
-                <div className="text-red-600 bg-red-50 p-3 rounded-lg text-sm">
+
+              {processingError && (
+                <div className="text-red-600 bg-red-50 p-3 rounded-lg text-sm mb-3">
                   {processingError}
                 </div>
-              ) : extractedText ? (
-                <div className="text-sm text-gray-700 leading-relaxed whitespace-pre-wrap bg-gray-50 p-3 rounded-lg">
-                  {extractedText}
+              )}
+
+              {streamedSections.length > 0 && (
+                <div className="mb-3 text-xs text-gray-600">
+                  <div className="font-semibold mb-1">セクション</div>
+                  <ul className="list-disc list-inside">
+                    {streamedSections.map(heading => (
+                      <li key={heading} className="truncate">{heading}</li>
+                    ))}
+                  </ul>
                 </div>
-              ) : null}
+              )}
+
+              {streamedPages.map(page => (
+                <div key={page.page} className="mb-3">
+                  <div className="text-xs text-gray-500 mb-1">
+                    p.{page.page}{page.timed_out ? '（処理時間の上限により打ち切り）' : ''}
+                  </div>
+                  <div className="text-sm text-gray-700 leading-relaxed whitespace-pre-wrap bg-gray-50 p-3 rounded-lg">
+                    {page.text}
+                  </div>
+                </div>
+              ))}
+
+              {isProcessing && (
+                <div className="flex items-center text-sm text-gray-500">
+                  <Loader2 className="animate-spin mr-1" size={14} />
+                  次のページを抽出中...
+                </div>
+              )}
             </div>
           )}
         </div>
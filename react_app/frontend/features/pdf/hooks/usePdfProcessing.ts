@@ -11,9 +11,21 @@ export interface PdfProcessingResult {
   };
 }
 
+export interface PdfStreamedPage {
+  page: number;
+  text: string;
+  timed_out: boolean;
+}
+
 export const usePdfProcessing = () => {
   const [isProcessing, setIsProcessing] = useState(false);
   const [processingError, setProcessingError] = useState<string | null>(null);
+  // ストリーミング抽出中に届いたページ・メタデータ・総ページ数
+  const [streamedPages, setStreamedPages] = useState<PdfStreamedPage[]>([]);
+  const [streamedMetadata, setStreamedMetadata] = useState<PdfProcessingResult['metadata'] | null>(null);
+  const [pageCount, setPageCount] = useState<number | null>(null);
+  // metadata より先に届いた見出しも捨てずに保持する
+  const [streamedSections, setStreamedSections] = useState<string[]>([]);
 
   const processPdf = useCallback(async (pdfUrl: string): Promise<PdfProcessingResult | null> => {
     setIsProcessing(true);
@@ -44,9 +56,110 @@ export const usePdfProcessing = () => {
     }
   }, []);
 
+  // 抽出したページから順に受け取る（最初のページを全ページの抽出完了前に表示できる）
+  const processPdfStream = useCallback(async (pdfUrl: string): Promise<PdfProcessingResult | null> => {
+    setIsProcessing(true);
+    setProcessingError(null);
+    setStreamedPages([]);
+    setStreamedMetadata(null);
+    setPageCount(null);
+    setStreamedSections([]);
+
+    try {
+      const response = await fetch(apiEndpoints.processPdfStream, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ pdf_url: pdfUrl }),
+      });
+
+      if (!response.ok) {
+        throw new Error(`PDF処理エラー: ${response.statusText}`);
+      }
+
+      const reader = response.body?.getReader();
+      const decoder = new TextDecoder();
+
+      if (!reader) {
+        throw new Error('ストリーミングの読み取りに失敗しました');
+      }
+
+      const texts: string[] = [];
+      const sections: string[] = [];
+      // 届いた見出しをメタデータの sections に重複なく加える
+      const withSections = (metadata: PdfProcessingResult['metadata']) => ({
+        ...metadata,
+        sections: [...metadata.sections, ...sections.filter(heading => !metadata.sections.includes(heading))],
+      });
+      let result: PdfProcessingResult | null = null;
+      // 1行が読み取り単位をまたぐことがあるため、改行までをバッファする
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+
+        for (const line of lines) {
+          if (!line.trim()) continue;
+
+          const data = JSON.parse(line);
+          switch (data.type) {
+            case 'start':
+              setPageCount(data.pages);
+              break;
+
+            case 'page':
+              texts.push(data.text);
+              setStreamedPages(prev => [...prev, { page: data.page, text: data.text, timed_out: data.timed_out }]);
+              break;
+
+            case 'metadata':
+              setStreamedMetadata(withSections(data.metadata));
+              break;
+
+            case 'section':
+              if (!sections.includes(data.heading)) {
+                sections.push(data.heading);
+                setStreamedSections([...sections]);
+                setStreamedMetadata(prev => prev && withSections(prev));
+              }
+              break;
+
+            case 'complete':
+              result = { text: texts.join('\n').trim(), metadata: withSections(data.metadata) };
+              setStreamedMetadata(result.metadata);
+              break;
+
+            case 'error':
+              throw new Error(data.detail);
+          }
+        }
+      }
+
+      return result;
+    } catch (error) {
+      const errorMessage = error instanceof Error ? error.message : 'PDF処理中にエラーが発生しました';
+      setProcessingError(errorMessage);
+      console.error('PDF処理エラー:', error);
+      return null;
+    } finally {
+      setIsProcessing(false);
+    }
+  }, []);
+
   return {
     processPdf,
+    processPdfStream,
     isProcessing,
     processingError,
+    streamedPages,
+    streamedMetadata,
+    streamedSections,
+    pageCount,
   };
 };
\ No newline at end of file
@@ -1,3 +1,3 @@
 export { PdfViewer } from './PdfViewer';
 export { usePdfProcessing } from './hooks/usePdfProcessing';
-export type { PdfProcessingResult } from './hooks/usePdfProcessing';
\ No newline at end of file
+export type { PdfProcessingResult, PdfStreamedPage } from './hooks/usePdfProcessing';
\ No newline at end of file
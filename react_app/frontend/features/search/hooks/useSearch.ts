@@ -12,12 +12,15 @@ export const useSearch = () => {
   const [isLoading, setIsLoading] = useState(false);
   const [searchTime, setSearchTime] = useState<number>(0);
   const [resultLimit, setResultLimit] = useState<number>(DEFAULT_RESULT_LIMIT);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
   useEffect(() => {
     const q = params.get("q");
     if (!q) return;
     
     setIsLoading(true);
+    setNextCursor(null);
     const startTime = performance.now();
     
     const limit = params.get("limit") || DEFAULT_RESULT_LIMIT.toString();
@@ -32,6 +35,7 @@ export const useSearch = () => {
         setSearchTime((endTime - startTime) / 1000);
         const papers = data.papers || [];
         setResults(papers);
+        setNextCursor(data.next_cursor || null);
       })
       .catch((err) => {
         console.error(err);
@@ -42,6 +46,29 @@ export const useSearch = () => {
       });
   }, [params]);
 
+  // 次のページを取得して結果の末尾に追加する
+  const loadMore = () => {
+    const q = params.get("q");
+    if (!q || !nextCursor || isLoadingMore) return;
+    
+    setIsLoadingMore(true);
+    const searchUrl = `${apiEndpoints.search}?q=${encodeURIComponent(q)}&limit=${resultLimit}&cursor=${encodeURIComponent(nextCursor)}`;
+    
+    fetch(searchUrl)
+      .then((res) => res.json())
+      .then((data) => {
+        const papers = data.papers || [];
+        setResults((prev) => [...prev, ...papers]);
+        setNextCursor(data.next_cursor || null);
+      })
+      .catch((err) => {
+        console.error(err);
+      })
+      .finally(() => {
+        setIsLoadingMore(false);
+      });
+  };
+
   const handleSearch = () => {
     if (searchQuery.trim()) {
       const newParams = new URLSearchParams(params.toString());
@@ -63,6 +90,9 @@ export const useSearch = () => {
     isLoading,
     searchTime,
     resultLimit,
+    hasMore: nextCursor !== null,
+    isLoadingMore,
+    loadMore,
     handleSearch,
     handleLimitChange,
   };
@@ -23,7 +23,7 @@ export const useSummary = () => {
     );
   }, []);
 
-  const handleQuickSummary = async (paper: Paper) => {
+  const handleQuickSummary = async (paper: Paper, isAutomatic = false) => {
     const paperId = getPaperId(paper);
     
     // 既にキャッシュされた結果があるかチェック
@@ -39,6 +39,8 @@ export const useSummary = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          // 自動キューからの要求はバッチ扱いにして対話的な操作を優先させる
+          'X-Request-Priority': isAutomatic ? 'batch' : 'interactive',
         },
         body: JSON.stringify({
           title: paper.title,
@@ -93,6 +95,7 @@ export const useSummary = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'X-Request-Priority': isAutomatic ? 'batch' : 'interactive',
         },
         body: JSON.stringify({
           title: paper.title,
@@ -158,7 +161,7 @@ export const useSummary = () => {
       
       if (paper && !quickSummaryResults[paperId] && !streamingQuickSummary[paperId]) {
         // 簡潔要約を実行
-        await handleQuickSummary(paper);
+        await handleQuickSummary(paper, true);
       }
       
       // 処理済みの論文をキューから削除
@@ -1,5 +1,5 @@
 import React from "react";
-import { X, Settings, Brain, Languages, Zap, BarChart3, Loader2 } from "lucide-react";
+import { X, Settings, Brain, Languages, Zap, BarChart3, Search, Loader2 } from "lucide-react";
 import { ModelConfig, AvailableModel } from "../types";
 
 interface ModelSettingsProps {
@@ -130,6 +130,26 @@ export const ModelSettings: React.FC<ModelSettingsProps> = ({
                     ))}
                   </select>
                 </div>
+
+                {/* Embedding Model */}
+                <div className="bg-indigo-50 rounded-lg p-4">
+                  <h4 className="text-lg font-semibold text-indigo-800 mb-3 flex items-center">
+                    <Search className="mr-2" size={20} />
+                    埋め込み
+                  </h4>
+                  <p className="text-sm text-gray-600 mb-3">検索結果の並べ替え（埋め込みモデル）</p>
+                  <select
+                    value={modelConfig.embedding_model}
+                    onChange={(e) => onUpdateModel('embedding', e.target.value)}
+                    className="w-full p-2 border border-gray-300 rounded-md focus:ring-2 focus:ring-indigo-500 focus:border-transparent"
+                  >
+                    {availableModels.map((model) => (
+                      <option key={model.name} value={model.name}>
+                        {model.name} ({(model.size / 1024 / 1024 / 1024).toFixed(1)}GB)
+                      </option>
+                    ))}
+                  </select>
+                </div>
               </div>
             )
           )}
@@ -3,6 +3,7 @@ export interface ModelConfig {
   translation_model: string;
   quick_summary_model: string;
   detailed_summary_model: string;
+  embedding_model?: string;
 }
 
 export interface AvailableModel {
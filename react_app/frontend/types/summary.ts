@@ -12,6 +12,7 @@ export interface StructuredSummary {
 export interface SummaryData {
   summary?: string;
   structured?: StructuredSummary;
+  timings?: Record<string, number>;  // 各生成の所要時間（秒）
 }
 
 export interface QuickSummary {
@@ -1,7 +1,18 @@
 import requests
 import json
 from utils import config
-from jsonschema import validate, ValidationError
+from jsonschema import ValidationError
+from utils.response_decoding import StructuredDecoder, loads as json_loads, strip_code_fence
+
+# スキーマごとのバリデータ（スキーマは設定の定数なので id をキーに使い回す）
+_decoders = {}
+
+def get_decoder(json_schema: dict) -> StructuredDecoder:
+    """スキーマのデコーダを返す（初回のみ作成）"""
+    entry = _decoders.get(id(json_schema))
+    if entry is None or entry[0] is not json_schema:
+        entry = _decoders[id(json_schema)] = (json_schema, StructuredDecoder(json_schema))
+    return entry[1]
 
 def get_structured_response(model_name: str, prompt: str, temperature: float = 0.8, max_tokens: int = 500) -> dict:
     """
@@ -22,8 +33,7 @@ def get_structured_response(model_name: str, prompt: str, temperature: float = 0
     
     result = response.text
     # 不要なマークダウン（例: ```）が含まれている場合は除去
-    clean_lines = [line for line in result.splitlines() if not line.strip().startswith("```")]
-    clean_result = "\n".join(clean_lines)
+    clean_result = strip_code_fence(result)
     
     try:
         structured_data = json.loads(clean_result)
@@ -31,8 +41,7 @@ def get_structured_response(model_name: str, prompt: str, temperature: float = 0
         raise ValueError("レスポンスのJSON形式に誤りがあります.1") from e
     
     # 不要なマークダウン（例: ```）が含まれている場合は除去
-    clean_lines = [line for line in structured_data["response"].splitlines() if not line.strip().startswith("```")]
-    clean_result = "\n".join(clean_lines)
+    clean_result = strip_code_fence(structured_data["response"])
 
     try:
         structured_data = json.loads(clean_result)
@@ -86,7 +95,7 @@ def get_structured_response_v2(model_name: str, prompt: str, temperature: float
     
     
     try:
-        structured_data = json.loads(result)
+        structured_data = json_loads(result)
         print("\n\n",structured_data)
     except json.JSONDecodeError as e:
         raise ValueError("レスポンスのJSON形式に誤りがあります") from e
@@ -96,11 +105,10 @@ def get_structured_response_v2(model_name: str, prompt: str, temperature: float
     except (KeyError, TypeError):
         raise ValueError("レスポンス形式が想定と異なります")
     
-    clean_lines = [line for line in content.splitlines() if not line.strip().startswith("```")]
-    clean_result = "\n".join(clean_lines)
+    clean_result = strip_code_fence(content)
     
     try:
-        structured_data = json.loads(clean_result)
+        structured_data = json_loads(clean_result)
         print("\n\n", structured_data)
     except json.JSONDecodeError as e:
         print("abc")
@@ -111,7 +119,7 @@ def get_structured_response_v2(model_name: str, prompt: str, temperature: float
     # ここで、json_schema が指定されている場合はバリデーションを実施
     if json_schema:
         try:
-            validate(instance=structured_data, schema=json_schema)
+            get_decoder(json_schema).validate(structured_data)
         except ValidationError as ve:
             raise ValueError("レスポンスが指定されたJSONスキーマに準拠していません。") from ve
 
@@ -175,6 +183,28 @@ def stream_chat_response(model_name: str, messages: list, temperature: float = 0
                 response_text += decoded_line
                 yield response_text
 
+def get_embeddings(model_name: str, texts: list, batch_size: int = 32) -> list | None:
+    """
+    Ollama の /api/embed エンドポイントで texts の埋め込みベクトルを取得します。
+    取得できなかった場合は None を返します（呼び出し側は埋め込みなしで処理を続けます）。
+    """
+    if not model_name:
+        return None
+    vectors = []
+    try:
+        for start in range(0, len(texts), batch_size):
+            response = requests.post(
+                config.OLLAMA_EMBED_URL,
+                json={"model": model_name, "input": texts[start:start + batch_size]},
+                timeout=120,
+            )
+            response.raise_for_status()
+            vectors.extend(json_loads(response.content)["embeddings"])
+    except (requests.RequestException, ValueError, KeyError) as e:
+        print(f"埋め込みの取得に失敗: {e}")
+        return None
+    return vectors
+
 if __name__ == "__main__":
     # 非ストリーミング生成の例
     model = config.OLLAMA_MODEL
@@ -1,6 +1,33 @@
+import io
 import requests
 import streamlit as st
 import time
+import PyPDF2
+from utils import config
+from utils.search_cache import SearchCache
+from utils.rate_limiter import TokenBucket, backoff_delay, parse_retry_after
+
+SEMANTIC_SCHOLAR_SEARCH_URL = "http://api.semanticscholar.org/graph/v1/paper/search/"
+SEMANTIC_SCHOLAR_FIELDS = "title,abstract,url,publicationTypes,openAccessPdf"
+
+# 全セッションで共有する検索結果キャッシュ
+search_cache = SearchCache()
+
+# 全セッション（および状態ファイル指定時は全プロセス）で共有するレートリミッタ
+rate_limiter = TokenBucket(
+    config.SEMANTIC_SCHOLAR_RATE, config.SEMANTIC_SCHOLAR_BURST, state_path=config.SEMANTIC_SCHOLAR_RATE_LIMIT_FILE
+)
+request_headers = {"x-api-key": config.SEMANTIC_SCHOLAR_API_KEY} if config.SEMANTIC_SCHOLAR_API_KEY else None
+
+def _request_papers(query_params: dict) -> list[dict] | None:
+    """Semantic Scholar API を 1 回だけ呼び出す（失敗時は None）。キャッシュのバックグラウンド更新用"""
+    try:
+        rate_limiter.acquire()
+        data = requests.get(SEMANTIC_SCHOLAR_SEARCH_URL, params=query_params, headers=request_headers, timeout=30).json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"Semantic Scholar API エラー: {e}")
+        return None
+    return data.get("data")
 
 def search_papers_semantic(query: str, year_from: int = 2023,year_to: int = None, limit: int = 20, max_retries=10) -> list[dict]:
     """
@@ -14,10 +41,10 @@ def search_papers_semantic(query: str, year_from: int = 2023,year_to: int = None
     Returns:
         list[dict]: 論文情報の辞書のリスト
     """
-    url = "http://api.semanticscholar.org/graph/v1/paper/search/"
+    url = SEMANTIC_SCHOLAR_SEARCH_URL
     query_params = {
         "query": query,
-        "fields": "title,abstract,url,publicationTypes",
+        "fields": SEMANTIC_SCHOLAR_FIELDS,
         #"year": f"{year_from}-",
         "limit": limit,
         "sort": "relevance",
@@ -27,26 +54,72 @@ def search_papers_semantic(query: str, year_from: int = 2023,year_to: int = None
     else:
         query_params["year"] = f"{year_from}-"
 
+    # キャッシュ確認（TTL切れでも猶予期間内なら古い結果を返してバックグラウンドで更新）
+    cache_key = search_cache.make_key(**query_params)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        papers, age = cached
+        if not search_cache.is_fresh(age):
+            search_cache.refresh_in_background(cache_key, lambda: _request_papers(query_params))
+        return papers
+
     retries = 0
+    waited = 0.0
     while retries < max_retries:
-        response = requests.get(url, params=query_params)
-        data = response.json()
+        waited += rate_limiter.acquire()
+        try:
+            response = requests.get(url, params=query_params, headers=request_headers, timeout=30)
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"Semantic Scholar API エラー: {e}")
+            time.sleep(backoff_delay(retries))
+            retries += 1
+            continue
 
         if "data" in data:
             #st.write(data)
+            print(f"Semantic Scholar 待機時間: {waited:.2f}秒 (再試行 {retries} 回)")
+            search_cache.set(cache_key, data["data"])
             return data["data"]
-        elif data.get("code") == "429":
+        elif response.status_code == 429 or data.get("code") == "429":
             st.warning("APIが混雑しています。自動で再試行します...")
-            time.sleep(1)
+            # Retry-After を優先し、なければ指数バックオフ + ジッタ。待機は全セッションで共有する
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            rate_limiter.penalize(max(retry_after or 0.0, backoff_delay(retries)))
             retries += 1
             continue
+        elif response.status_code == 200:
+            # 該当なしの場合は "data" キーが含まれない
+            return []
         else:
             st.error("APIエラーが発生しました。再度検索ボタンを押してください。")
             st.write(data)
             return []
     
     st.error("APIが混雑しています。時間をおいて再試行してください。")
-        
+    return []
+
+
+def fetch_pdf_pages(pdf_url: str, max_bytes: int = config.PAPER_PDF_MAX_BYTES) -> list[str] | None:
+    """オープンアクセスの PDF をダウンロードしてページごとのテキストを返す（取得できなければ None）"""
+    try:
+        with requests.get(pdf_url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            buffer = io.BytesIO()
+            for chunk in response.iter_content(64 * 1024):
+                buffer.write(chunk)
+                if buffer.tell() > max_bytes:
+                    print(f"PDFのサイズが上限を超えたため本文を使いません: {pdf_url}")
+                    return None
+        if not buffer.getvalue().lstrip()[:5].startswith(b"%PDF"):
+            print(f"URLの内容がPDFではありません: {pdf_url}")
+            return None
+        reader = PyPDF2.PdfReader(buffer)
+        return [page.extract_text() or "" for page in reader.pages]
+    except (requests.RequestException, PyPDF2.errors.PdfReadError) as e:
+        print(f"PDFの取得に失敗: {e}")
+        return None
+
 
 # 使用例（この行は他ファイルで呼び出す場合の参考）
 # results = search_papers('"human activity recognition sensor transformer"')
@@ -1,9 +1,10 @@
 # app.py
+import time
 import streamlit as st
 from ui import search_bar, result_summary, paper_network, chat_panel
 from state import state_manager
 from utils import config
-from core import llm_service
+from core import llm_service, batch_analysis
 
 st.set_page_config(layout="wide")
 
@@ -34,22 +35,28 @@ def main():
                 unsafe_allow_html=True,
             )
             if st.session_state["papers"].papers and st.button(
-                "一括解析", key="batch_analysis"
+                "一括解析", key="start_batch_analysis", disabled=batch_analysis.is_batch_running()
             ):
-                # 取得済みの PaperResult から、すべての論文を解析してキャッシュに保存
-                for paper in st.session_state["papers"].papers:
-                    pid = paper.paper_id
-                    cache_key = f"paper_analysis_{pid}"
-                    # まだ解析していなければ LLM 呼び出し
-                    if cache_key not in st.session_state:
-                        title = paper.title
-                        abstract = paper.abstract or ""
-                        analysis = llm_service.analyze_searched_paper(
-                            f"title: {title}, abstract: {abstract}"
-                        )
-                        st.session_state[cache_key] = analysis
-                # 全件解析後にリラン
-                st.rerun()
+                # 取得済みの PaperResult のうち未解析の論文をスレッドプールで並列に解析
+                batch_analysis.start_batch_analysis(
+                    st.session_state["papers"].papers,
+                    st.session_state["batch_analysis_workers"],
+                )
+
+            # 完了した解析結果をキャッシュに反映して進捗を表示
+            batch = batch_analysis.collect_batch_results()
+            if batch and batch["total"]:
+                finished = batch["done"] + batch["failed"]
+                if batch["futures"]:
+                    st.progress(
+                        finished / batch["total"],
+                        text=f"一括解析中... {finished}/{batch['total']} 件",
+                    )
+                else:
+                    st.caption(
+                        f"一括解析完了: {batch['done']} 件"
+                        + (f"（失敗 {batch['failed']} 件）" if batch["failed"] else "")
+                    )
 
             if st.session_state["papers"].papers:
                 selected, element_dict, papers_dict = (
@@ -128,6 +135,7 @@ def main():
                     {"role": "system", "content": config.system_prompt}
                 ]
                 st.session_state["initial_prompt_processed"] = False
+                st.session_state["chat_paper"] = None
 
             # テキストチャットなどの処理をここに記述
             chat_container = st.container(height=600)
@@ -169,13 +177,9 @@ def main():
                     f"{chat_panel.render_history(st.session_state['chat_history'], config.css_text_user, config.css_text_assistant)}</div>",
                     unsafe_allow_html=True,
                 )
-                api_messages = [
-                    {
-                        "role": "user" if msg["role"] == "hidden_user" else msg["role"],
-                        "content": msg["content"],
-                    }
-                    for msg in st.session_state["chat_history"]
-                ]
+                api_messages = chat_panel.build_api_messages(
+                    st.session_state["chat_history"], st.session_state["chat_paper"]
+                )
                 chat_panel.update_chat_history_with_response(
                     api_messages, stream_placeholder
                 )
@@ -185,6 +189,11 @@ def main():
                 )
             st.markdown("</div>", unsafe_allow_html=True)
 
+    # 一括解析中は一定間隔で再描画し、解析済みの論文をネットワークへ順次反映する
+    if batch_analysis.is_batch_running():
+        time.sleep(config.BATCH_ANALYSIS_POLL_INTERVAL)
+        st.rerun()
+
 
 if __name__ == "__main__":
     main()
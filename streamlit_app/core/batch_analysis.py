@@ -0,0 +1,60 @@
+# 一括解析をスレッドプールで実行するロジック
+# core/batch_analysis.py
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import streamlit as st
+
+from core import llm_service
+from core.data_models import PaperInfo
+
+
+def start_batch_analysis(papers: List[PaperInfo], max_workers: int) -> None:
+    """
+    未解析の論文をスレッドプールに投入し、進捗を session_state["batch_analysis"] に保存する。
+    ワーカースレッドでは LLM 呼び出しのみを行い、session_state への書き込みは
+    collect_batch_results() でメインスレッドから行う。
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch_analysis")
+    futures = {}
+    for paper in papers:
+        pid = paper.paper_id
+        # 解析済み・投入済みの論文はスキップ
+        if f"paper_analysis_{pid}" in st.session_state or pid in futures:
+            continue
+        futures[pid] = executor.submit(
+            llm_service.analyze_searched_paper,
+            f"title: {paper.title}, abstract: {paper.abstract or ''}",
+        )
+    # 投入済みのジョブは実行を続け、完了後にスレッドを解放する
+    executor.shutdown(wait=False)
+    st.session_state["batch_analysis"] = {
+        "futures": futures,
+        "total": len(futures),
+        "done": 0,
+        "failed": 0,
+    }
+
+
+def collect_batch_results() -> Optional[dict]:
+    """完了した解析結果を paper_analysis_{pid} キャッシュへ書き込み、進捗を返す"""
+    batch = st.session_state.get("batch_analysis")
+    if not batch:
+        return None
+    for pid, future in list(batch["futures"].items()):
+        if not future.done():
+            continue
+        del batch["futures"][pid]
+        try:
+            st.session_state[f"paper_analysis_{pid}"] = future.result()
+            batch["done"] += 1
+        except Exception as e:
+            print(f"一括解析に失敗しました ({pid}): {e}")
+            batch["failed"] += 1
+    return batch
+
+
+def is_batch_running() -> bool:
+    batch = st.session_state.get("batch_analysis")
+    return bool(batch and batch["futures"])
@@ -29,6 +29,8 @@ class PaperInfo:
     url: str
     paper_id: str
     relatedness: Optional[int] = None
+    matched_queries: Optional[List[str]] = None  # 複数クエリ検索でヒットした検索語（順位の高い順）
+    pdf_url: Optional[str] = None  # オープンアクセスの PDF（論文解説AIの本文検索に使う）
 
 @dataclass
 class PaperResult:
@@ -1,9 +1,24 @@
 # 論文APIへのアクセスロジック
 # core/paper_service.py
 
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from core.data_models import PaperResult, PaperInfo
-from api.paper_api import search_papers_semantic
-from typing import Tuple
+from api.paper_api import search_papers_semantic, fetch_pdf_pages
+from api.ollama_api import get_embeddings
+from typing import List, Optional, Tuple
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils import config
+from utils.paper_index import PaperIndex, chunk_pages
+from utils.rank_fusion import reciprocal_rank_fusion
+
+# 全セッションで共有する論文本文の索引（paper_id → PaperIndex。本文を取得できなかった論文は None）
+_paper_indexes: "OrderedDict[str, Optional[PaperIndex]]" = OrderedDict()
+# PDF の取得・解析に失敗した論文と失敗時刻（PAPER_INDEX_RETRY_INTERVAL 秒が過ぎたら取り直す）
+_paper_index_failures: dict = {}
+_paper_indexes_lock = threading.Lock()
 
 def fetch_papers_by_query(query: str, year_range: Tuple[int, int], limit: int = 10) -> PaperResult:
     year_from, year_to = year_range
@@ -14,8 +29,79 @@ def fetch_papers_by_query(query: str, year_range: Tuple[int, int], limit: int =
             title=paper["title"],
             abstract=paper.get("abstract"),
             url=paper["url"],
-            paper_id=paper["paperId"]
+            paper_id=paper["paperId"],
+            pdf_url=(paper.get("openAccessPdf") or {}).get("url"),
         )
         for paper in raw_papers
     ]
     return PaperResult(papers=papers)
+
+def fetch_papers_fanout(queries: List[str], year_range: Tuple[int, int], limit: int = 10) -> PaperResult:
+    """
+    複数のクエリを並行に検索し、RRF で 1 つのランキングに統合する。
+    上流への送信間隔は共有のレートリミッタが調整する。
+    """
+    year_from, year_to = year_range
+    ctx = get_script_run_ctx()
+    # ワーカースレッドからも st.warning などを表示できるようにする
+    with ThreadPoolExecutor(
+        max_workers=max(1, len(queries)),
+        thread_name_prefix="fanout_search",
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as executor:
+        futures = {
+            query: executor.submit(search_papers_semantic, query, year_from=year_from, year_to=year_to, limit=limit)
+            for query in queries
+        }
+        rankings = {query: future.result() for query, future in futures.items()}
+
+    papers = [
+        PaperInfo(
+            title=paper["title"],
+            abstract=paper.get("abstract"),
+            url=paper["url"],
+            paper_id=paper["paperId"],
+            matched_queries=[match["query"] for match in paper["matched_queries"]],
+            pdf_url=(paper.get("openAccessPdf") or {}).get("url"),
+        )
+        for paper in reciprocal_rank_fusion(rankings)[:limit]
+    ]
+    return PaperResult(papers=papers)
+
+def get_paper_index(paper: dict) -> Optional[PaperIndex]:
+    """
+    選択された論文の PDF 本文をチャンクに分けて索引を作る（作成済みならそれを返す）。
+    PDF がない・取得できない論文は None を返し、チャットはタイトルとアブストラクトだけで行う。
+    """
+    paper_id = paper["paper_id"]
+    with _paper_indexes_lock:
+        if paper_id in _paper_indexes:
+            _paper_indexes.move_to_end(paper_id)
+            return _paper_indexes[paper_id]
+        # 直近に失敗した論文は質問のたびにダウンロードを待たないよう、しばらくアブストラクトだけで答える
+        failed_at = _paper_index_failures.get(paper_id)
+        if failed_at is not None and time.time() - failed_at < config.PAPER_INDEX_RETRY_INTERVAL:
+            return None
+
+    index = None
+    pages = fetch_pdf_pages(paper["pdf_url"]) if paper.get("pdf_url") else None
+    if pages is None and paper.get("pdf_url"):
+        # 一時的な障害の可能性があるため索引には記録せず、一定時間後に取り直す
+        with _paper_indexes_lock:
+            _paper_index_failures[paper_id] = time.time()
+        return None
+    chunks = chunk_pages(pages) if pages else []
+    if chunks:
+        index = PaperIndex(chunks, embed=lambda texts: get_embeddings(config.OLLAMA_EMBED_MODEL, texts))
+        print(
+            f"論文本文の索引を作成: {paper_id} ({len(pages)} ページ, {len(chunks)} チャンク, "
+            f"埋め込み{'あり' if index.vectors is not None else 'なし'})"
+        )
+
+    with _paper_indexes_lock:
+        _paper_index_failures.pop(paper_id, None)
+        _paper_indexes[paper_id] = index
+        _paper_indexes.move_to_end(paper_id)
+        while len(_paper_indexes) > config.PAPER_INDEX_CACHE_ENTRIES:
+            _paper_indexes.popitem(last=False)
+    return index
@@ -18,6 +18,9 @@ def initialize_session_state():
         "prev_selected_nodes": [],
         "chat_history": [{"role": "system", "content": config.system_prompt}],
         "initial_prompt_processed": True,
+        "chat_paper": None,
+        "batch_analysis": None,
+        "batch_analysis_workers": config.BATCH_ANALYSIS_WORKERS,
     }
 
     for key, value in defaults.items():
@@ -27,6 +30,7 @@ def initialize_session_state():
 def reset_chat_history():
     st.session_state["chat_history"] = [{"role": "system", "content": config.system_prompt}]
     st.session_state["initial_prompt_processed"] = False
+    st.session_state["chat_paper"] = None
 
 def update_selected_paper(selected_paper):
     st.session_state["selected_paper"] = selected_paper
@@ -34,6 +38,8 @@ def update_selected_paper(selected_paper):
 
 def update_paper_results(papers: PaperResult):
     st.session_state["papers"] = papers
+    # 検索結果が変わったら一括解析の進捗表示をリセット
+    st.session_state["batch_analysis"] = None
 
 def update_user_input_analysis(analysis: PaperAnalysisResult):
     """
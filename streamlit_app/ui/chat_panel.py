@@ -1,7 +1,9 @@
 # テキストチャット
 import streamlit as st
 from utils import llm_controller, config
+from utils.paper_index import format_passages
 from api import lm_studio_api, ollama_api
+from core import paper_service
 
 def render_history(chat_history, css_text_user, css_text_assistant):
     """
@@ -21,6 +23,38 @@ def render_history(chat_history, css_text_user, css_text_assistant):
             out += f"""{css_text_user}<strong>User:</strong> {msg['content']}</div>{script}\n\n"""
     return out
 
+def build_api_messages(chat_history, paper=None):
+    """
+    API に送るメッセージを作る。
+    会話全体ではなく、システムプロンプト・最初の指示（hidden_user）・直近 CHAT_HISTORY_TURNS 往復だけを送り、
+    論文本文の索引があれば最後のメッセージに関連する本文の箇所（上位 k チャンク）を添える。
+    """
+    system_messages = [msg for msg in chat_history if msg["role"] == "system"]
+    instructions = [msg for msg in chat_history if msg["role"] == "hidden_user"][-1:]
+    conversation = [msg for msg in chat_history if msg["role"] in ("user", "assistant")]
+    recent = conversation[-(2 * config.CHAT_HISTORY_TURNS + 1):]
+    api_messages = [
+        {"role": "user" if msg["role"] == "hidden_user" else msg["role"], "content": msg["content"]}
+        for msg in system_messages + instructions + recent
+    ]
+
+    if paper and api_messages and api_messages[-1]["role"] == "user":
+        with st.spinner("論文本文の索引を準備中..."):
+            index = paper_service.get_paper_index(paper)
+        if index is not None:
+            if recent and recent[-1]["role"] == "user":
+                query = recent[-1]["content"]
+            else:
+                # 最初の解説では指示文ではなく論文タイトルと検索語（ユーザー論文）で検索する
+                query = f"{paper['title']} {st.session_state['first_user_input'][:500]}"
+            chunks = index.search(query)
+            if chunks:
+                api_messages[-1] = {
+                    "role": "user",
+                    "content": f"{config.CHAT_PASSAGE_PROMPT}\n{format_passages(chunks)}\n\n{api_messages[-1]['content']}",
+                }
+    return api_messages
+
 def update_chat_history_with_response(api_messages, stream_placeholder):
     """
     LLM APIからのストリーミングレスポンスを処理し、チャット履歴を更新する。
@@ -60,12 +94,11 @@ def render_stream(stream_placeholder, selected_paper):
         "role": "hidden_user",
         "content": initial_prompt
     })
+    # 以降の質問でも同じ論文の本文から関連箇所を検索する
+    st.session_state["chat_paper"] = selected_paper
 
     # hidden_user を user に変換した API 用メッセージリストの作成
-    api_messages = [
-        {"role": "user" if msg["role"] == "hidden_user" else msg["role"], "content": msg["content"]}
-        for msg in st.session_state["chat_history"]
-    ]
+    api_messages = build_api_messages(st.session_state["chat_history"], selected_paper)
     update_chat_history_with_response(api_messages, stream_placeholder)
 
         
\ No newline at end of file
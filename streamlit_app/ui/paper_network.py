@@ -15,7 +15,8 @@ def render_network_sections(papers, details=False):
         else:
             all_analyzed = False
 
-    if all_analyzed and analysis_map:
+    # 一括解析中は解析済みの論文から順に分野別レイアウトへ切り替える
+    if analysis_map and (all_analyzed or st.session_state.get("batch_analysis")):
         elements = cytoscape_utils.build_cy_elements_by_field(papers, analysis_map)
     else:
         elements = cytoscape_utils.build_cy_elements_simple(papers)
@@ -102,6 +103,8 @@ def get_selected_papers(selected, element_dict, papers_dict):
                 "url": node_papers.url,
                 "paper_id": node_papers.paper_id,
                 "relatedness": node_elem["data"]["relatedness"],
+                "matched_queries": node_papers.matched_queries,
+                "pdf_url": node_papers.pdf_url,
             #    "relatedness": getattr(paper, "relatedness", 0),  # 存在しない場合は0とする例
             #    "university": getattr(paper, "university", "不明"),
             #    "url": paper.url,
@@ -57,6 +57,8 @@ def render_info_paper(papers):
     for paper in papers:
         st.write(f"タイトル: {paper['title']}")
         st.write(f"関連順位: {paper.get('relatedness', 0)} 位")
+        if paper.get("matched_queries"):
+            st.write(f"ヒットした検索語: {', '.join(paper['matched_queries'])}")
         st.write(f"URL: {paper['url']}")
         st.write(f"アブストラクト：\n {paper['abstract']}")
         st.write("---")
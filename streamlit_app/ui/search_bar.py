@@ -3,6 +3,7 @@
 import streamlit as st
 from core import paper_service, llm_service
 from state import state_manager
+from utils.rank_fusion import build_fanout_queries
 
 def render_search_section():
     st.radio(
@@ -45,13 +46,19 @@ def render_search_section():
             elif mode == "AI検索 2":
                 analysis = llm_service.analyze_user_paper(query)
                 state_manager.update_user_input_analysis(analysis)
-                ai_query = analysis.search_keywords[0].en
-                results = paper_service.fetch_papers_by_query(ai_query, year_range, num_papers)
+                # 検索キーワードと対象×手法・要因・指標のすべてで並行に検索し、順位を統合する
+                facets = (analysis.methods or []) + (analysis.factors or []) + (analysis.metrics or [])
+                ai_queries = build_fanout_queries(
+                    [keyword.en for keyword in analysis.search_keywords or []],
+                    analysis.target.en if analysis.target else None,
+                    [label.en for label in facets],
+                )
+                results = paper_service.fetch_papers_fanout(ai_queries, year_range, num_papers)
                 state_manager.update_paper_results(results)
 
 def render_search_info_selection_section():
     with st.expander("オプション設定"):
-        search_num_col, year_col, search_engine_col = st.columns([1, 1, 1])
+        search_num_col, year_col, search_engine_col, workers_col = st.columns([1, 1, 1, 1])
 
         with search_num_col:
             st.slider(
@@ -76,4 +83,12 @@ def render_search_info_selection_section():
                 horizontal=True,
                 key="search_engine",
             )
+        with workers_col:
+            st.slider(
+                "一括解析の並列数",
+                1,
+                16,
+                st.session_state["batch_analysis_workers"],
+                key="batch_analysis_workers",
+            )
 
@@ -24,6 +24,25 @@ def get_ollama_url(path: str) -> str:
 
 OLLAMA_CHAT_URL = get_ollama_url("/api/chat")
 OLLAMA_GENERATE_URL = get_ollama_url("/api/generate")
+OLLAMA_EMBED_URL = get_ollama_url("/api/embed")
+# 論文本文の検索に使う埋め込みモデル（空にすると BM25 だけで検索する）
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+# Semantic Scholar へのアクセス設定（APIキー、許可レート[件/秒]、連続送信数、複数プロセスで共有する状態ファイル）
+SEMANTIC_SCHOLAR_API_KEY = os.environ.get("SEMANTIC_SCHOLAR_API_KEY")
+SEMANTIC_SCHOLAR_RATE = float(os.environ.get("SEMANTIC_SCHOLAR_RATE", "1"))
+SEMANTIC_SCHOLAR_BURST = int(os.environ.get("SEMANTIC_SCHOLAR_BURST", "1"))
+SEMANTIC_SCHOLAR_RATE_LIMIT_FILE = os.environ.get("SEMANTIC_SCHOLAR_RATE_LIMIT_FILE")
+# 一括解析の並列数と進捗確認の間隔（秒）
+BATCH_ANALYSIS_WORKERS = int(os.environ.get("BATCH_ANALYSIS_WORKERS", "4"))
+BATCH_ANALYSIS_POLL_INTERVAL = float(os.environ.get("BATCH_ANALYSIS_POLL_INTERVAL", "1.0"))
+# 論文解説AIで毎回送る直近の会話の往復数（それより前の会話は送らない）
+CHAT_HISTORY_TURNS = int(os.environ.get("CHAT_HISTORY_TURNS", "4"))
+# 論文解説AIで本文を取得する PDF の上限サイズ（バイト）
+PAPER_PDF_MAX_BYTES = int(os.environ.get("PAPER_PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+# プロセス内に保持する論文本文の索引の数（超えたら最後に使ったのが古い順に破棄）
+PAPER_INDEX_CACHE_ENTRIES = int(os.environ.get("PAPER_INDEX_CACHE_ENTRIES", "32"))
+# PDF の取得・解析に失敗した論文の本文を取り直すまでの秒数
+PAPER_INDEX_RETRY_INTERVAL = float(os.environ.get("PAPER_INDEX_RETRY_INTERVAL", "300"))
 #OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "deepseek-r1:8b-0528-qwen3-q8_0")
 _experiment_message_template = '''
 以下は論文の情報です。
@@ -301,6 +320,10 @@ INST_PROMPT_KEYWORDS = (
     "より深い説明を求めているかやユーザーに説明したほうがいい概念などがあればその説明が必要かどうかなどについて質問を最後にすることで、自然な会話を続けるように心がけてください。"
     "また与えられた論文のタイトルとアブストラクトは繰り返して生成しないでください。"
 )
+CHAT_PASSAGE_PROMPT = (
+    "以下は選択された論文の本文から、質問に関連する箇所を抜き出したものです（[p.ページ番号] 本文 の形式）。"
+    "回答の根拠として使い、抜き出した箇所に書かれていない内容を説明する場合はその旨を明示してください。"
+)
 # 使う予定なし
 unified_schema = {
     "$schema": "http://json-schema.org/draft-07/schema#",
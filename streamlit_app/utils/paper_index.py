@@ -0,0 +1,147 @@
+"""論文本文のチャンク索引（BM25 + 埋め込みベクトル）
+
+PDF から抽出したページごとのテキストを段落単位でチャンクに分け、BM25 と埋め込みベクトルの
+コサイン類似度でそれぞれ順位を付けて、Reciprocal Rank Fusion で 1 つのランキングにまとめる。
+チャットでは質問ごとに上位のチャンクだけをプロンプトに入れ、論文全体は送らない。
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils.rank_fusion import reciprocal_rank_fusion
+
+# 1 チャンクの最大文字数
+PAPER_CHUNK_CHARS = int(os.environ.get("PAPER_CHUNK_CHARS", "1200"))
+# 1 回の質問でプロンプトに入れるチャンク数
+PAPER_RETRIEVAL_TOP_K = int(os.environ.get("PAPER_RETRIEVAL_TOP_K", "4"))
+# BM25 のパラメータ
+BM25_K1 = float(os.environ.get("BM25_K1", "1.5"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+|[぀-ヿ㐀-鿿]+")
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-鿿]")
+_SENTENCE_PATTERN = re.compile(r"(?<=[。．.!?！？])\s+|(?<=[。！？])")
+
+
+def tokenize(text: str) -> List[str]:
+    """英数字は単語、日本語は文字 bigram に分ける"""
+    tokens = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if _CJK_PATTERN.match(word):
+            tokens.extend(word[i:i + 2] for i in range(max(1, len(word) - 1)))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """max_chars を超える段落を文（なければ文字数）の区切りで分ける"""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_PATTERN.split(text):
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_pages(pages: List[str], max_chars: int = PAPER_CHUNK_CHARS) -> List[Dict[str, Any]]:
+    """ページごとのテキストを段落の切れ目で max_chars 以下のチャンクにまとめる（ページはまたがない）"""
+    chunks = []
+    for page_number, text in enumerate(pages, start=1):
+        current = ""
+        for paragraph in re.split(r"\n\s*\n", text):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            for piece in _split_long(paragraph, max_chars):
+                if current and len(current) + len(piece) + 1 > max_chars:
+                    chunks.append({"page": page_number, "text": current})
+                    current = ""
+                current = f"{current}\n{piece}" if current else piece
+        if current:
+            chunks.append({"page": page_number, "text": current})
+    for chunk_id, chunk in enumerate(chunks):
+        chunk["chunk_id"] = chunk_id
+    return chunks
+
+
+class PaperIndex:
+    """1 本の論文のチャンクに対する BM25 と埋め込みベクトルの索引"""
+
+    def __init__(
+        self,
+        chunks: List[Dict[str, Any]],
+        embed: Optional[Callable[[List[str]], Optional[List[List[float]]]]] = None,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ):
+        self.chunks = chunks
+        self.embed = embed
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(chunk["text"])) for chunk in chunks]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_freqs: Counter = Counter()
+        for freqs in self.term_freqs:
+            document_freqs.update(freqs.keys())
+        self.idf = {
+            term: math.log(1 + (len(chunks) - freq + 0.5) / (freq + 0.5)) for term, freq in document_freqs.items()
+        }
+        # 埋め込みが取得できなければ BM25 だけで検索する
+        self.vectors: Optional[np.ndarray] = None
+        if embed is not None and chunks:
+            vectors = embed([chunk["text"] for chunk in chunks])
+            if vectors is not None and len(vectors) == len(chunks):
+                self.vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+
+    def bm25_ranking(self, query: str) -> List[Dict[str, Any]]:
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scored = []
+        for chunk, freqs, length in zip(self.chunks, self.term_freqs, self.lengths):
+            score = 0.0
+            for term in terms:
+                freq = freqs.get(term, 0)
+                if freq:
+                    norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1.0))
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                scored.append((score, chunk))
+        scored.sort(key=lambda item: -item[0])
+        return [chunk for _, chunk in scored]
+
+    def embedding_ranking(self, query: str) -> List[Dict[str, Any]]:
+        if self.vectors is None:
+            return []
+        query_vectors = self.embed([query])
+        if not query_vectors:
+            return []
+        scores = self.vectors @ _normalize(np.asarray(query_vectors, dtype=np.float32))[0]
+        return [self.chunks[index] for index in np.argsort(-scores)]
+
+    def search(self, query: str, top_k: int = PAPER_RETRIEVAL_TOP_K) -> List[Dict[str, Any]]:
+        """BM25 と埋め込みの順位を RRF で統合し、上位 top_k 件のチャンクを本文の順に返す"""
+        rankings = {"bm25": self.bm25_ranking(query), "embedding": self.embedding_ranking(query)}
+        fused = reciprocal_rank_fusion(rankings, id_key="chunk_id")[:top_k]
+        return sorted(fused, key=lambda chunk: chunk["chunk_id"])
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def format_passages(chunks: List[Dict[str, Any]]) -> str:
+    """検索したチャンクをプロンプト用の文字列にする"""
+    return "\n\n".join(f"[p.{chunk['page']}] {chunk['text']}" for chunk in chunks)
@@ -0,0 +1,57 @@
+"""複数クエリの検索結果の統合（Reciprocal Rank Fusion）
+
+解析結果のキーワードごとに検索した結果を paperId で重複除去し、各クエリでの順位から
+RRF スコア（Σ 1 / (k + 順位)）を計算して 1 つのランキングにまとめる。
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+RRF_K = int(os.environ.get("RRF_K", "60"))
+FANOUT_MAX_QUERIES = int(os.environ.get("FANOUT_MAX_QUERIES", "8"))
+
+
+def build_fanout_queries(
+    keywords: List[str],
+    target: Optional[str] = None,
+    facets: Optional[List[str]] = None,
+    max_queries: int = FANOUT_MAX_QUERIES,
+) -> List[str]:
+    """検索キーワードと、対象 + 手法・要因・指標の組み合わせから検索クエリを作る（重複は除く）"""
+    candidates = list(keywords)
+    for facet in facets or []:
+        candidates.append(f"{target} {facet}" if target else facet)
+    queries: Dict[str, str] = {}
+    for query in candidates:
+        query = " ".join(query.split())
+        if query and query.lower() not in queries:
+            queries[query.lower()] = query
+    return list(queries.values())[:max_queries]
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, List[Dict[str, Any]]], k: int = RRF_K, id_key: str = "paperId"
+) -> List[Dict[str, Any]]:
+    """クエリごとの検索結果を統合し、fusion_score と matched_queries（クエリと順位）を付けて返す
+
+    id_key で重複除去に使うキーを変えられる（論文本文のチャンク検索では "chunk_id"）。
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for query, papers in rankings.items():
+        for rank, paper in enumerate(papers, start=1):
+            paper_id = paper.get(id_key)
+            if paper_id is None or paper_id == "":
+                continue
+            entry = fused.get(paper_id)
+            if entry is None:
+                entry = fused[paper_id] = {"paper": paper, "score": 0.0, "matched": []}
+            elif rank <= entry["matched"][0]["rank"]:
+                # 論文の内容は最も上位にヒットした結果のものを使う
+                entry["paper"] = paper
+            entry["score"] += 1.0 / (k + rank)
+            entry["matched"].append({"query": query, "rank": rank})
+            entry["matched"].sort(key=lambda match: match["rank"])
+    ranked = sorted(fused.values(), key=lambda entry: (-entry["score"], entry["matched"][0]["rank"]))
+    return [
+        {**entry["paper"], "fusion_score": round(entry["score"], 6), "matched_queries": entry["matched"]}
+        for entry in ranked
+    ]
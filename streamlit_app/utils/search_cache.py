@@ -0,0 +1,127 @@
+# Semantic Scholar 検索結果のキャッシュ（メモリ + ディスクの 2 段構成）
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+SEARCH_CACHE_ENABLED = os.environ.get("SEARCH_CACHE_ENABLED", "1") != "0"
+SEARCH_CACHE_PATH = os.environ.get(
+    "SEARCH_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "search_cache.sqlite3"),
+)
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_STALE_TTL = float(os.environ.get("SEARCH_CACHE_STALE_TTL", str(24 * 3600)))
+SEARCH_CACHE_MEMORY_ENTRIES = int(os.environ.get("SEARCH_CACHE_MEMORY_ENTRIES", "256"))
+
+
+class SearchCache:
+    """
+    TTL と stale-while-revalidate に対応した検索結果キャッシュ。
+    プロセス内の全セッションで共有し、TTL を過ぎた結果は猶予期間内であれば
+    そのまま返しつつバックグラウンドスレッドで取り直す。
+    """
+
+    def __init__(
+        self,
+        path: str = SEARCH_CACHE_PATH,
+        ttl: float = SEARCH_CACHE_TTL,
+        stale_ttl: float = SEARCH_CACHE_STALE_TTL,
+        memory_entries: int = SEARCH_CACHE_MEMORY_ENTRIES,
+        enabled: bool = SEARCH_CACHE_ENABLED,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.memory_entries = memory_entries
+        self.enabled = enabled
+        self._memory: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(**params) -> str:
+        raw = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(値, 経過秒数) を返す。未登録または猶予期間も過ぎている場合は None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self.conn.execute(
+                    "SELECT value, created_at FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = (json.loads(row[0]), row[1])
+            self._remember(key, entry)
+        value, created_at = entry
+        age = time.time() - created_at
+        if age > self.ttl + self.stale_ttl:
+            return None
+        return value, age
+
+    def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, (value, now))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now),
+            )
+            self.conn.execute("DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl - self.stale_ttl,))
+            self.conn.commit()
+
+    def _remember(self, key: str, entry: Tuple[Any, float]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def is_fresh(self, age: float) -> bool:
+        return age <= self.ttl
+
+    def refresh_in_background(self, key: str, fetch: Callable[[], Optional[Any]]) -> None:
+        """fetch をバックグラウンドスレッドで実行し、結果が得られればキャッシュを更新する"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = fetch()
+                if value is not None:
+                    self.set(key, value)
+            except Exception as e:
+                print(f"検索キャッシュの更新に失敗: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()